@@ -0,0 +1,80 @@
+"""Micro-benchmark of drawing bonds of all types into offscreen image.
+
+Run from the repository root:
+    > python benchmarks/bench_bond_drawing.py
+"""
+
+import random
+import time
+from statistics import median
+
+from PySide6.QtCore import QLine, Qt
+from PySide6.QtGui import QGuiApplication, QImage, QPainter
+
+from molina.drawing_objects import TypedLine
+
+NUM_BONDS = 1000
+REPEATS = 20
+IMAGE_SIZE = 2000
+BOND_TYPES = [
+    "single",
+    "double",
+    "triple",
+    "aromatic",
+    "solid unwedge",
+    "solid wedge",
+    "dashed wedge",
+]
+CONSTANTS = {
+    "bond_distance": 14,
+    "line_width": 8,
+    "max_width": 12,
+    "segment_number": 20,
+}
+
+
+def create_bonds(num_bonds: int) -> list:
+    """Random bonds of all types with length about 50-150 pixels"""
+    rng = random.Random(0)
+    bonds = []
+    for i in range(num_bonds):
+        x1 = rng.randint(100, IMAGE_SIZE - 100)
+        y1 = rng.randint(100, IMAGE_SIZE - 100)
+        x2 = x1 + rng.randint(-100, 100)
+        y2 = y1 + rng.randint(-100, 100)
+        bonds.append(TypedLine(QLine(x1, y1, x2, y2), BOND_TYPES[i % len(BOND_TYPES)]))
+    return bonds
+
+
+def draw(image: QImage, bonds: list) -> float:
+    """Time in milliseconds to draw all bonds"""
+    image.fill(Qt.white)
+    start = time.perf_counter()
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    for bond in bonds:
+        bond.draw(painter, CONSTANTS)
+    painter.end()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    app = QGuiApplication.instance() or QGuiApplication([])
+    image = QImage(IMAGE_SIZE, IMAGE_SIZE, QImage.Format_ARGB32_Premultiplied)
+
+    print(f"{'bond type':>14} {'first draw, ms':>16} {'cached draw, ms':>16}")
+    for bond_type in BOND_TYPES + ["mixed"]:
+        bonds = create_bonds(NUM_BONDS)
+        if bond_type != "mixed":
+            for bond in bonds:
+                bond.type = bond_type
+
+        first = draw(image, bonds)
+        cached = median(draw(image, bonds) for _ in range(REPEATS))
+        print(f"{bond_type:>14} {first:>16.1f} {cached:>16.1f}")
+
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmark of DataManager per-edit latency.
+Atoms and bonds are deleted in the middle of the chain, so half of the
+following objects are renumbered.
+
+Run from the repository root:
+    > python benchmarks/bench_data_manager.py
+"""
+
+import time
+from statistics import median
+
+from PySide6.QtCore import QPoint, QLine
+
+from molina.data_manager import DataManager
+from molina.drawing_objects import Atom, TypedLine
+
+SIZES = [10, 100, 1000]
+REPEATS = 50
+EDITS = ["add atom", "add bond", "move atom", "delete bond", "delete atom"]
+
+
+def fill(data_manager: DataManager, num_atoms: int) -> None:
+    """Create chain of atoms connected by single bonds"""
+    data_manager.cleanAll()
+    for i in range(num_atoms):
+        data_manager.addAtom(Atom(QPoint(10 * i, 10 * i), "C"), i)
+        if i > 0:
+            line = QLine(10 * (i - 1), 10 * (i - 1), 10 * i, 10 * i)
+            data_manager.addBond(TypedLine(line, "single", [i - 1, i]), i - 1, i, i - 1)
+
+
+def measure(data_manager: DataManager, num_atoms: int) -> dict:
+    """Median latency in microseconds of one add atom, add bond, move atom,
+    delete bond and delete atom edit
+    """
+    fill(data_manager, num_atoms)
+    add_atom, add_bond, move_atom, delete_bond, delete_atom = [], [], [], [], []
+
+    for i in range(REPEATS):
+        idx = num_atoms + i
+        start = time.perf_counter()
+        data_manager.addAtom(Atom(QPoint(10 * idx, 0), "N"), idx)
+        add_atom.append(time.perf_counter() - start)
+
+        line = QLine(10 * (idx - 1), 0, 10 * idx, 0)
+        start = time.perf_counter()
+        data_manager.addBond(
+            TypedLine(line, "double", [idx - 1, idx]), idx - 1, idx, idx - 1
+        )
+        add_bond.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        data_manager.updateAtomPosition(idx, QPoint(10 * idx, 5))
+        move_atom.append(time.perf_counter() - start)
+
+    for i in range(REPEATS):
+        index = len(data_manager._bonds.liveRows()) // 2
+        start = time.perf_counter()
+        data_manager.deleteBond(index)
+        delete_bond.append(time.perf_counter() - start)
+
+        index = len(data_manager._atoms.liveRows()) // 2
+        start = time.perf_counter()
+        data_manager.deleteAtom(index)
+        delete_atom.append(time.perf_counter() - start)
+
+    return {
+        "add atom": median(add_atom) * 1e6,
+        "add bond": median(add_bond) * 1e6,
+        "move atom": median(move_atom) * 1e6,
+        "delete bond": median(delete_bond) * 1e6,
+        "delete atom": median(delete_atom) * 1e6,
+    }
+
+
+def main():
+    data_manager = DataManager()
+    print(f"{'atoms':>8}" + "".join(f"{edit + ', us':>16}" for edit in EDITS))
+    for size in SIZES:
+        result = measure(data_manager, size)
+        print(f"{size:>8}" + "".join(f"{result[edit]:>16.1f}" for edit in EDITS))
+    data_manager.cleanAll()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark of per-edit synchronization between DataManager and ImageData.
+
+Compares full re-serialization of the annotation after every edit
+(behaviour before change feed) with applying AnnotationChange list.
+Text panel is measured too: MainWindow.changeAnnotation used to build
+the whole annotation text after every edit, now the text is built once
+after a burst of edits.
+
+Run from the repository root:
+    > python benchmarks/bench_dataset_sync.py
+"""
+
+import time
+from statistics import median
+
+import numpy as np
+from PySide6.QtCore import QPoint, QLine
+
+from molina.data_manager import DataManager
+from molina.data_structs import ImageData
+from molina.drawing_objects import Atom, TypedLine
+from molina.main_window import annotation_to_text
+
+NUM_ATOMS = 500
+REPEATS = 200
+WIDTH, HEIGHT = 4000, 3000
+
+
+def fill(data_manager: DataManager) -> None:
+    """Create chain of atoms connected by single bonds"""
+    data_manager.cleanAll()
+    for i in range(NUM_ATOMS):
+        data_manager.addAtom(Atom(QPoint(5 * i, 5 * i), "C"), i)
+        if i > 0:
+            line = QLine(5 * (i - 1), 5 * (i - 1), 5 * i, 5 * i)
+            data_manager.addBond(TypedLine(line, "single", [i - 1, i]), i - 1, i, i - 1)
+
+
+def full_sync(data_manager: DataManager, image_data: ImageData) -> None:
+    """Serialize all atoms and bonds and rescale every atom"""
+    atoms = data_manager._atoms
+    bonds = data_manager._bonds
+    atoms_data = [atoms.record(row) for row in atoms.liveRows()]
+    for atom in atoms_data:
+        atom["x"] /= WIDTH
+        atom["y"] /= HEIGHT
+    image_data.atoms = atoms_data
+    image_data.bonds = [bonds.record(row) for row in bonds.liveRows()]
+
+
+def measure(data_manager: DataManager, sync) -> float:
+    """Median time in microseconds of one move atom edit with synchronization"""
+    times = []
+    for i in range(REPEATS):
+        idx = i % NUM_ATOMS
+        start = time.perf_counter()
+        data_manager.updateAtomPosition(idx, QPoint(5 * idx + i % 7, 5 * idx))
+        sync()
+        times.append(time.perf_counter() - start)
+    return median(times) * 1e6
+
+
+def main():
+    data_manager = DataManager()
+    image_data = ImageData("", "", np.zeros((HEIGHT, WIDTH), dtype=np.uint8))
+
+    changes = []
+    data_manager.annotationChanged.connect(changes.extend)
+    fill(data_manager)
+    full_sync(data_manager, image_data)
+    changes.clear()
+
+    full = measure(data_manager, lambda: full_sync(data_manager, image_data))
+    changes.clear()
+
+    def delta_sync():
+        image_data.applyChanges(changes)
+        changes.clear()
+
+    delta = measure(data_manager, delta_sync)
+    changes.clear()
+
+    def text_sync():
+        delta_sync()
+        annotation_to_text({"atoms": image_data.atoms, "bonds": image_data.bonds})
+
+    text = measure(data_manager, text_sync)
+
+    print(f"{NUM_ATOMS} atoms, median time of one edit")
+    print(f"full re-serialization:   {full:10.1f} us")
+    print(f"change feed:             {delta:10.1f} us")
+    print(f"change feed, text/edit:  {text:10.1f} us")
+    print(f"text once after burst:   {text - delta:10.1f} us")
+    data_manager.cleanAll()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark of abbreviation expansion for molecules with 1-20 abbreviations.
+
+Combine path is the previous implementation: every abbreviation combines
+the whole molecule with its fragment and rebuilds RWMol, abbreviation atoms
+are removed one by one. Both paths use the same cached fragments, so only
+assembly of molecule is compared.
+
+Run from the repository root:
+    > python benchmarks/bench_expand_groups.py
+"""
+
+import time
+from statistics import median
+
+from rdkit import Chem
+
+from molina.molfile import BOND_TYPES_3, expand_functional_group, fragment_mol
+
+CHAIN_LENGTH = 40
+NUM_ABBREVIATIONS = [1, 2, 5, 10, 15, 20]
+LABELS = ["OMe", "CO2Et", "Ph", "OAc", "NO2", "CF3", "tBu", "CN"]
+REPEATS = 200
+
+
+def create_mol(num_abbreviations: int) -> Chem.rdchem.RWMol:
+    """Carbon chain with abbreviations attached to every second atom"""
+    mol = Chem.RWMol()
+    for i in range(CHAIN_LENGTH):
+        mol.AddAtom(Chem.Atom("C"))
+        if i > 0:
+            mol.AddBond(i - 1, i, Chem.BondType.SINGLE)
+
+    for k in range(num_abbreviations):
+        atom = Chem.Atom("*")
+        label = LABELS[k % len(LABELS)]
+        Chem.SetAtomAlias(atom, label)
+        atom.SetProp("molFileAlias", label)
+        idx = mol.AddAtom(atom)
+        mol.AddBond(2 * k, idx, Chem.BondType.SINGLE)
+    return mol
+
+
+def expand_combine(mol: Chem.rdchem.RWMol) -> str:
+    """Previous assembly: CombineMols and new RWMol for every abbreviation"""
+    mol_w = Chem.RWMol(mol)
+    num_atoms = mol_w.GetNumAtoms()
+    for atom in mol_w.GetAtoms():
+        atom.SetNumRadicalElectrons(0)
+
+    atoms_to_remove = []
+    for i in range(num_atoms):
+        atom = mol_w.GetAtomWithIdx(i)
+        if atom.GetSymbol() != "*":
+            continue
+        symbol = Chem.GetAtomAlias(atom)
+        bonds = atom.GetBonds()
+        total_bonds = int(sum([bond.GetBondTypeAsDouble() for bond in bonds]))
+        mol_r = fragment_mol(symbol, total_bonds)
+
+        adjacent_indices = [bond.GetOtherAtomIdx(i) for bond in bonds]
+        for adjacent_idx in adjacent_indices:
+            mol_w.RemoveBond(i, adjacent_idx)
+        for adjacent_idx, bond in zip(adjacent_indices, bonds):
+            mol_w.GetAtomWithIdx(adjacent_idx).SetNumRadicalElectrons(
+                int(bond.GetBondTypeAsDouble())
+            )
+
+        bonding_atom_r = mol_w.GetNumAtoms()
+        mol_w = Chem.RWMol(Chem.CombineMols(mol_w, mol_r))
+        for atm in adjacent_indices:
+            bond_order = mol_w.GetAtomWithIdx(atm).GetNumRadicalElectrons()
+            mol_w.AddBond(atm, bonding_atom_r, order=BOND_TYPES_3[bond_order])
+            mol_w.GetAtomWithIdx(atm).SetNumRadicalElectrons(0)
+        mol_w.GetAtomWithIdx(bonding_atom_r).SetNumRadicalElectrons(0)
+        atoms_to_remove.append(i)
+
+    atoms_to_remove.sort(reverse=True)
+    for i in atoms_to_remove:
+        mol_w.RemoveAtom(i)
+    return Chem.MolToSmiles(mol_w)
+
+
+def measure(function, mol) -> float:
+    """Median time in microseconds of one expansion"""
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(mol)
+        times.append(time.perf_counter() - start)
+    return median(times) * 1e6
+
+
+def main():
+    print(f"{'abbreviations':>13} {'combine, us':>12} {'single pass, us':>16}")
+    for num_abbreviations in NUM_ABBREVIATIONS:
+        mol = create_mol(num_abbreviations)
+        smiles, _ = expand_functional_group(mol, {})
+        assert smiles == expand_combine(mol)
+
+        combine = measure(expand_combine, mol)
+        single = measure(lambda m: expand_functional_group(m, {}), mol)
+        print(f"{num_abbreviations:>13} {combine:>12.0f} {single:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
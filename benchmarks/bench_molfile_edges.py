@@ -0,0 +1,118 @@
+"""Benchmark of molfile export with dense edge matrix and with edge list.
+
+Dense path is the previous implementation: num_atoms x num_atoms matrix
+and scan of all atom pairs for bonds.
+
+Run from the repository root:
+    > python benchmarks/bench_molfile_edges.py
+"""
+
+import random
+import time
+
+from rdkit import Chem
+
+from molina.constants import BOND_TYPES
+from molina.molfile import (
+    EDGE_BONDS,
+    annotation_to_coords_and_edges,
+    convert_graph_to_mol,
+    mol_to_molblock,
+)
+
+NUM_ANNOTATIONS = 10000
+MIN_ATOMS = 20
+MAX_ATOMS = 300
+SYMBOLS = ["C"] * 8 + ["N", "O"]
+
+
+def create_annotation(rng: random.Random, num_atoms: int) -> dict:
+    """Chain of atoms with a ring closure every ten atoms, about N bonds"""
+    atoms = [
+        {
+            "atom_symbol": rng.choice(SYMBOLS),
+            "x": rng.random(),
+            "y": rng.random(),
+            "atom_number": i,
+        }
+        for i in range(num_atoms)
+    ]
+    bonds = [
+        {"bond_type": "single", "endpoint_atoms": [i - 1, i]}
+        for i in range(1, num_atoms)
+    ]
+    bonds += [
+        {"bond_type": "single", "endpoint_atoms": [i - 5, i]}
+        for i in range(5, num_atoms, 10)
+    ]
+    return {"atoms": atoms, "bonds": bonds}
+
+
+def dense_edges(data: dict) -> list:
+    """Previous edge matrix of annotation_to_coords_and_edges"""
+    bonds_data = data["bonds"]
+    num_atoms = max(max(bond["endpoint_atoms"]) for bond in bonds_data) + 1
+    edges = [[0 for _ in range(num_atoms)] for _ in range(num_atoms)]
+    for bond in bonds_data:
+        i, j = bond["endpoint_atoms"]
+        bond_type_int = BOND_TYPES.index(bond["bond_type"])
+        edges[i][j] = bond_type_int
+        edges[j][i] = bond_type_int
+    return edges
+
+
+def dense_mol(data: dict) -> Chem.rdchem.RWMol:
+    """Previous bond loop of convert_graph_to_mol over all pairs of atoms"""
+    edges = dense_edges(data)
+    symbols = [atom["atom_symbol"] for atom in data["atoms"]]
+    mol = convert_graph_to_mol([], symbols, [])
+    n = len(symbols)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if edges[i][j] in EDGE_BONDS:
+                order, direction = EDGE_BONDS[edges[i][j]]
+                mol.AddBond(i, j, order)
+                if direction is not None:
+                    mol.GetBondBetweenAtoms(i, j).SetBondDir(direction)
+    return mol
+
+
+def sparse_mol(data: dict) -> Chem.rdchem.RWMol:
+    """Current path: edge list from annotation straight to bonds"""
+    prepared = annotation_to_coords_and_edges(data)
+    return convert_graph_to_mol(
+        prepared["chartok_coords"]["coords"],
+        prepared["chartok_coords"]["symbols"],
+        prepared["edges"],
+    )
+
+
+def measure(annotations: list, build) -> dict:
+    """Seconds spent on building molecules and on writing molblocks"""
+    start = time.perf_counter()
+    mols = [build(annotation) for annotation in annotations]
+    built = time.perf_counter()
+    for mol in mols:
+        mol_to_molblock(mol)
+    return {"build": built - start, "total": time.perf_counter() - start}
+
+
+def main():
+    rng = random.Random(0)
+    annotations = [
+        create_annotation(rng, rng.randint(MIN_ATOMS, MAX_ATOMS))
+        for _ in range(NUM_ANNOTATIONS)
+    ]
+
+    sample = annotations[0]
+    assert mol_to_molblock(dense_mol(sample)) == mol_to_molblock(sparse_mol(sample))
+
+    print(f"{NUM_ANNOTATIONS} annotations of {MIN_ATOMS}-{MAX_ATOMS} atoms")
+    print(f"{'path':>8} {'build, s':>10} {'export, s':>10}")
+    for name, build in [("dense", dense_mol), ("sparse", sparse_mol)]:
+        result = measure(annotations, build)
+        print(f"{name:>8} {result['build']:>10.2f} {result['total']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
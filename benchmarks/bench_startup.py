@@ -0,0 +1,74 @@
+"""Startup import time benchmark of GUI.
+
+Every run imports main window in a fresh interpreter with -X importtime.
+The script fails if the fastest run is slower than budget or if heavy
+dependencies, which are needed only for prediction, export or image decode,
+are imported at startup.
+
+Run from the repository root:
+    > python benchmarks/bench_startup.py [--budget-ms 1000] [--runs 5]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+MODULE = "molina.main_window"
+HEAVY_MODULES = ["torch", "cv2", "rdkit", "molscribe"]
+LINE_REGEX = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure() -> Tuple[int, Dict[str, int]]:
+    """Import module in new process, return its cumulative time and
+    cumulative time of every top-level imported package in microseconds
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    packages = {}
+    total = None
+    for match in LINE_REGEX.finditer(output):
+        cumulative, name = int(match.group(2)), match.group(4)
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), cumulative)
+        if name == MODULE:
+            total = cumulative
+
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    total, packages = min(runs, key=lambda run: run[0])
+
+    print(f"import {MODULE}: {total / 1000:.1f} ms (best of {args.runs})")
+    for package, cumulative in sorted(
+        packages.items(), key=lambda item: item[1], reverse=True
+    )[:10]:
+        print(f"{package:>20} {cumulative / 1000:>8.1f} ms")
+
+    failed = False
+    heavy = [module for module in HEAVY_MODULES if module in packages]
+    if heavy:
+        print(f"FAIL: heavy modules are imported at startup: {', '.join(heavy)}")
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print(f"FAIL: startup is over budget {args.budget_ms:.0f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 ''''''
 
-from molina.main_window import MainWindow
-
 __version__ = '0.0.1'
 
 
+def __getattr__(name):
+    """Import GUI only when it is requested, so headless commands do not load Qt widgets"""
+    if name == "MainWindow":
+        from molina.main_window import MainWindow
+
+        return MainWindow
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
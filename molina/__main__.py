@@ -1,22 +1,139 @@
-"""Launches GUI via CLI"""
+"""Launches GUI, batch annotation or export via CLI"""
 
 import sys
+import argparse
 
-from PySide6.QtWidgets import QApplication
 
-from molina import MainWindow
-from molina.styles import SCROLLBAR_STYLE
+def run_gui(args: argparse.Namespace, qt_args: list) -> None:
+    """Start main window"""
+    from PySide6.QtWidgets import QApplication
 
+    from molina import MainWindow
+    from molina.styles import SCROLLBAR_STYLE
 
-def main():
-    """Main function"""
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyleSheet(SCROLLBAR_STYLE)
-    window = MainWindow()
+    window = MainWindow(
+        preload_model=args.preload_model, show_frame_times=args.show_frame_times
+    )
     window.show()
     app.exec()
 
+
+def run_batch(args: argparse.Namespace) -> None:
+    """Annotate images without GUI"""
+    from molina.batch import annotate_path
+
+    result = annotate_path(
+        args.path,
+        workers=args.workers,
+        molfile=args.molfile,
+        smiles=args.smiles,
+        overwrite=args.overwrite,
+        on_progress=lambda done, total, image: print(
+            f"[{done}/{total}] {image['path']} "
+            f"{image['error'] or 'ok'} ({image['seconds']:.2f} s)",
+            flush=True,
+        ),
+    )
+
+    print(
+        f"{result['images']} images, {len(result['failed'])} failed, "
+        f"{result['seconds']:.1f} s, {result['images_per_second']:.2f} images/sec"
+    )
+    if result["failed"]:
+        sys.exit(1)
+
+
+def run_export(args: argparse.Namespace) -> None:
+    """Write molecules of all annotations into one file"""
+    from molina.export import export_directory
+
+    result = export_directory(
+        args.path,
+        args.output,
+        fmt=args.format,
+        workers=args.workers,
+        on_progress=lambda done, total: print(
+            f"[{done}/{total}] exported", flush=True
+        ),
+    )
+
+    for path, error in result["failed"].items():
+        print(f"{path} {error}", file=sys.stderr)
+    print(
+        f"{result['written']} of {result['annotations']} annotations written, "
+        f"{result['seconds']:.1f} s, "
+        f"{result['annotations_per_second']:.2f} annotations/sec"
+    )
+    if result["failed"]:
+        sys.exit(1)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(prog="molina")
+    parser.add_argument(
+        "--preload-model",
+        action="store_true",
+        help="load prediction model in background at startup",
+    )
+    parser.add_argument(
+        "--show-frame-times",
+        action="store_true",
+        help="show paint time of drawing area in status bar",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="annotate all images under path without GUI"
+    )
+    batch_parser.add_argument("path", help="image or directory with images")
+    batch_parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+    batch_parser.add_argument(
+        "--molfile", action="store_true", help="also write .mol file near image"
+    )
+    batch_parser.add_argument(
+        "--smiles", action="store_true", help="also write .smi file near image"
+    )
+    batch_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="predict images which already have annotation",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="write molecules of all annotations under directory"
+    )
+    export_parser.add_argument("path", help="directory with annotations")
+    export_parser.add_argument(
+        "-o", "--output", required=True, help="output .sdf or .csv file"
+    )
+    export_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["sdf", "csv"],
+        help="output format, taken from output suffix by default",
+    )
+    export_parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of worker processes"
+    )
+
+    args, qt_args = parser.parse_known_args()
+    if args.command in ("batch", "export"):
+        if qt_args:
+            parser.error(f"unrecognized arguments: {' '.join(qt_args)}")
+        if args.command == "batch":
+            run_batch(args)
+        else:
+            run_export(args)
+    else:
+        run_gui(args, qt_args)
+
     return
 
 
-main()
+if __name__ == "__main__":
+    main()
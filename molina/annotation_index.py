@@ -0,0 +1,204 @@
+"""Persistent index of annotation status of images in directory.
+Module does not import Qt, index is updated by FileManager in background
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from molina.batch import annotation_path, find_images
+
+
+INDEX_FILE = ".molina_index.sqlite"
+LOW_CONFIDENCE = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    image_mtime INTEGER NOT NULL,
+    annotation_mtime INTEGER,
+    atoms INTEGER NOT NULL DEFAULT 0,
+    bonds INTEGER NOT NULL DEFAULT 0,
+    model TEXT,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS images_confidence ON images (confidence);
+"""
+
+FILTERS = {
+    "all": "SELECT path FROM images ORDER BY path",
+    "annotated": "SELECT path FROM images WHERE annotation_mtime IS NOT NULL "
+    "ORDER BY path",
+    "unannotated": "SELECT path FROM images WHERE annotation_mtime IS NULL "
+    "ORDER BY path",
+    "low_confidence": "SELECT path FROM images WHERE confidence < ? ORDER BY path",
+}
+
+
+def summarize_annotation(annotation: Dict) -> Tuple[int, int, Optional[str], Any]:
+    """Numbers of atoms and bonds, model name and mean confidence
+    of atoms and bonds, confidence is None if annotation has not it
+    """
+    atoms = annotation.get("atoms", [])
+    bonds = annotation.get("bonds", [])
+    confidences = [
+        item["confidence"]
+        for item in atoms + bonds
+        if isinstance(item.get("confidence"), (int, float))
+    ]
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return len(atoms), len(bonds), annotation.get("model"), confidence
+
+
+def matches(
+    status: Optional[Dict[str, Any]], name: str, threshold: float = LOW_CONFIDENCE
+) -> bool:
+    """Whether image with indexed status passes filter, like query of FILTERS.
+    Image which is not indexed passes no filter
+    """
+    if status is None:
+        return False
+    if name == "annotated":
+        return status["annotated"]
+    elif name == "unannotated":
+        return not status["annotated"]
+    elif name == "low_confidence":
+        return status["confidence"] is not None and status["confidence"] < threshold
+    return True
+
+
+def _status(row: Tuple) -> Dict[str, Any]:
+    """Status of image from annotation_mtime, atoms, bonds, model, confidence"""
+    return {
+        "annotated": row[0] is not None,
+        "atoms": row[1],
+        "bonds": row[2],
+        "model": row[3],
+        "confidence": row[4],
+    }
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class AnnotationIndex:
+    """SQLite index of images of one directory: modification times of image
+    and annotation, numbers of atoms and bonds, model and mean confidence.
+    Update reads only annotations changed since the last update, so status
+    queries do not open annotation files.
+    """
+
+    def __init__(self, directory: Path, index_path: Optional[Path] = None):
+        self.directory = Path(directory)
+        self.path = Path(index_path) if index_path else self.directory / INDEX_FILE
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def update(self) -> List[str]:
+        """Add new images, remove deleted ones and read changed annotations.
+        Return paths of changed rows
+        """
+        images = {
+            str(path): _mtime(path)
+            for path in find_images(self.directory, recursive=False)
+        }
+        with self._lock:
+            known = {
+                path: (image_mtime, annotation_mtime)
+                for path, image_mtime, annotation_mtime in self._connection.execute(
+                    "SELECT path, image_mtime, annotation_mtime FROM images"
+                )
+            }
+
+        deleted = [(path,) for path in known if path not in images]
+        rows = []
+        for path, image_mtime in images.items():
+            if image_mtime is None:
+                continue
+            annotation_mtime = _mtime(annotation_path(path))
+            if known.get(path) != (image_mtime, annotation_mtime):
+                rows.append(self._row(path, image_mtime, annotation_mtime))
+
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM images WHERE path = ?", deleted)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return [path for path, in deleted] + [row[0] for row in rows]
+
+    def updatePath(self, path: str) -> List[str]:
+        """Read status of one image, for example after its annotation is saved.
+        Return paths of changed rows
+        """
+        path = str(Path(path))
+        image_mtime = _mtime(Path(path))
+        with self._lock, self._connection:
+            if image_mtime is None:
+                self._connection.execute("DELETE FROM images WHERE path = ?", (path,))
+            else:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._row(path, image_mtime, _mtime(annotation_path(path))),
+                )
+        return [path]
+
+    def _row(
+        self, path: str, image_mtime: int, annotation_mtime: Optional[int]
+    ) -> Tuple:
+        """Row of images table, unreadable annotation counts as absent"""
+        if annotation_mtime is not None:
+            try:
+                with open(annotation_path(path)) as f:
+                    summary = summarize_annotation(json.load(f))
+                return (path, image_mtime, annotation_mtime) + summary
+            except (OSError, ValueError, AttributeError, TypeError):
+                pass
+        return (path, image_mtime, None, 0, 0, None, None)
+
+    def query(
+        self, status: str = "all", threshold: float = LOW_CONFIDENCE
+    ) -> List[str]:
+        """Sorted paths of images with status: all, annotated, unannotated
+        or low_confidence, which mean confidence is below threshold
+        """
+        if status not in FILTERS:
+            raise ValueError(f"Unknown status {status}")
+        params = (threshold,) if status == "low_confidence" else ()
+        with self._lock:
+            rows = self._connection.execute(FILTERS[status], params).fetchall()
+        return [row[0] for row in rows]
+
+    def status(self, path: str) -> Optional[Dict[str, Any]]:
+        """Indexed status of image, None if it is not indexed"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT annotation_mtime, atoms, bonds, model, confidence "
+                "FROM images WHERE path = ?",
+                (str(Path(path)),),
+            ).fetchone()
+        return None if row is None else _status(row)
+
+    def statuses(self, paths: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Indexed status of every image, or of paths if they are given.
+        Paths which are not indexed get None
+        """
+        if paths is not None:
+            return {path: self.status(path) for path in paths}
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path, annotation_mtime, atoms, bonds, model, confidence "
+                "FROM images"
+            ).fetchall()
+        return {row[0]: _status(row[1:]) for row in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,345 @@
+"""Columnar storage of atoms and bonds used by DataManager"""
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class SymbolTable:
+    """Maps strings (atom symbols, bond types) to small integer codes and back.
+    Codes are assigned in order of first appearance and are never reused.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._symbols = []
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def encode(self, symbol: str) -> int:
+        """Return code of symbol, register it if it is new"""
+        code = self._codes.get(symbol)
+        if code is None:
+            code = len(self._symbols)
+            self._codes[symbol] = code
+            self._symbols.append(symbol)
+        return code
+
+    def decode(self, code: int) -> str:
+        """Return symbol by its code"""
+        return self._symbols[code]
+
+
+class ColumnStore:
+    """Growable struct-of-arrays table.
+    Every column is a preallocated numpy array. When the table is full,
+    capacity is doubled, so append is amortized O(1).
+    Rows are never removed, objects are only marked as deleted,
+    therefore row index is a stable unique id of the object.
+    Sorted list of not-deleted rows maps drawing index (number) to row,
+    numbers are rewritten lazily and only from the first changed position.
+    Column "deleted" is changed only by delete, restore and deleteAll.
+    """
+
+    COLUMNS: Dict[str, Any] = {}
+
+    def __init__(self, capacity: int = 64):
+        self._capacity = max(capacity, 1)
+        self._size = 0
+        self._columns = {
+            name: np.empty(self._capacity, dtype=dtype)
+            for name, dtype in self.COLUMNS.items()
+        }
+        self._live: List[int] = []
+        # Position in live rows from which numbers are outdated, None if actual
+        self._stale: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, name: str) -> npt.NDArray:
+        """Return view of the filled part of the column"""
+        if name == "number":
+            self._renumber()
+        return self._columns[name][: self._size]
+
+    def _grow(self) -> None:
+        """Double capacity of all columns"""
+        self._capacity *= 2
+        for name, column in self._columns.items():
+            new_column = np.empty(self._capacity, dtype=column.dtype)
+            new_column[: self._size] = column[: self._size]
+            self._columns[name] = new_column
+
+    def append(self, **values: Any) -> int:
+        """Add row and return its index"""
+        if self._size == self._capacity:
+            self._grow()
+
+        row = self._size
+        for name, column in self._columns.items():
+            column[row] = values[name]
+        self._size += 1
+        if not values["deleted"]:
+            # New row is the last one, so live rows stay sorted
+            self._live.append(row)
+
+        return row
+
+    def get(self, row: int, name: str) -> Any:
+        """Return one value of the table"""
+        if not 0 <= row < self._size:
+            raise IndexError(f"Row {row} is out of table")
+        if name == "number":
+            self._renumber()
+        return self._columns[name][row]
+
+    def set(self, row: int, name: str, value: Any) -> None:
+        """Change one value of the table"""
+        if not 0 <= row < self._size:
+            raise IndexError(f"Row {row} is out of table")
+        if name == "deleted" and value:
+            self.delete([row])
+        elif name == "deleted":
+            self.restore([row])
+        else:
+            self._columns[name][row] = value
+
+    def delete(self, rows: List[int]) -> None:
+        """Mark rows as deleted, numbers of following objects are shifted"""
+        deleted = self._columns["deleted"]
+        for row in map(int, rows):
+            if deleted[row]:
+                continue
+            position = bisect_left(self._live, row)
+            del self._live[position]
+            deleted[row] = True
+            self._markStale(position)
+
+    def restore(self, rows: List[int]) -> None:
+        """Return deleted rows on their places in insertion order"""
+        deleted = self._columns["deleted"]
+        for row in map(int, rows):
+            if not deleted[row]:
+                continue
+            insort(self._live, row)
+            deleted[row] = False
+            self._markStale(bisect_left(self._live, row))
+
+    def deleteAll(self) -> None:
+        """Mark all rows as deleted"""
+        self._columns["deleted"][: self._size] = True
+        self._live = []
+        self._stale = None
+
+    def _markStale(self, position: int) -> None:
+        if self._stale is None or position < self._stale:
+            self._stale = position
+
+    def _renumber(self) -> None:
+        """Enumerate not-deleted objects in insertion order, the same order
+        as DrawingWidget keeps them. Only objects after the first changed
+        position get new numbers
+        """
+        if self._stale is None:
+            return
+        start = self._stale
+        rows = np.asarray(self._live[start:], dtype=np.int64)
+        self._columns["number"][rows] = np.arange(start, start + len(rows))
+        self._stale = None
+
+    def liveRows(self) -> npt.NDArray:
+        """Return indexes of not-deleted rows in insertion order"""
+        return np.asarray(self._live, dtype=np.int64)
+
+    def rowByNumber(self, number: int) -> int:
+        """Return row of not-deleted object by its drawing index (atom or line number)"""
+        if not 0 <= number < len(self._live):
+            raise KeyError(f"No object with number {number}")
+        return self._live[number]
+
+    def isAllDeleted(self) -> bool:
+        """Check if there is no not-deleted object"""
+        return not self._live
+
+
+class AtomStore(ColumnStore):
+    """Atoms data:
+    id - unique index, equals to row
+    number - atom index in DrawingWidget
+    x, y - position on not scaled image
+    symbol - code of atom symbol in symbols table
+    confidence - model confidence or "not_modeling"
+    instance - Atom object with not scaled position
+    deleted - flag of deleted object
+    """
+
+    COLUMNS = {
+        "id": np.int64,
+        "number": np.int64,
+        "x": np.float64,
+        "y": np.float64,
+        "symbol": np.int32,
+        "confidence": object,
+        "instance": object,
+        "deleted": np.bool_,
+    }
+
+    def __init__(self, capacity: int = 64):
+        super().__init__(capacity)
+        self.symbols = SymbolTable()
+
+    def add(
+        self,
+        number: int,
+        symbol: str,
+        x: float,
+        y: float,
+        instance: Any,
+        confidence: Any = "not_modeling",
+    ) -> int:
+        """Add atom and return its unique index"""
+        uid = len(self)
+        return self.append(
+            id=uid,
+            number=number,
+            x=x,
+            y=y,
+            symbol=self.symbols.encode(symbol),
+            confidence=confidence,
+            instance=instance,
+            deleted=False,
+        )
+
+    def symbol(self, row: int) -> str:
+        """Return atom symbol of the row"""
+        return self.symbols.decode(self.get(row, "symbol"))
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Return atom as dictionary for Dataset"""
+        return {
+            "atom_number": int(self.get(row, "number")),
+            "atom_symbol": self.symbol(row),
+            "x": float(self.get(row, "x")),
+            "y": float(self.get(row, "y")),
+            "confidence": self.get(row, "confidence"),
+        }
+
+
+class BondStore(ColumnStore):
+    """Bonds data:
+    id - unique index, equals to row
+    number - line index in DrawingWidget
+    type - code of bond type in types table
+    start, end - unique indexes of endpoint atoms
+    confidence - model confidence or "not_modeling"
+    instance - TypedLine object with not scaled position
+    deleted - flag of deleted object
+    Bonds refer to atoms by unique index, which does not change after deletion,
+    so atom numbers of bond ends are got from atoms store by one vectorized remap.
+    Adjacency (atom unique index -> bond unique indexes) gives bonds of atom
+    without scanning all bonds.
+    """
+
+    COLUMNS = {
+        "id": np.int64,
+        "number": np.int64,
+        "type": np.int32,
+        "start": np.int64,
+        "end": np.int64,
+        "confidence": object,
+        "instance": object,
+        "deleted": np.bool_,
+    }
+
+    def __init__(self, atoms: AtomStore, capacity: int = 64):
+        super().__init__(capacity)
+        self.types = SymbolTable()
+        self._atoms = atoms
+        self._adjacency = defaultdict(list)
+
+    def add(
+        self,
+        number: int,
+        bond_type: str,
+        start: int,
+        end: int,
+        instance: Any,
+        confidence: Any = "not_modeling",
+    ) -> int:
+        """Add bond between atoms with unique indexes start and end,
+        return unique index of bond
+        """
+        uid = self.append(
+            id=len(self),
+            number=number,
+            type=self.types.encode(bond_type),
+            start=start,
+            end=end,
+            confidence=confidence,
+            instance=instance,
+            deleted=False,
+        )
+        self._adjacency[start].append(uid)
+        self._adjacency[end].append(uid)
+
+        return uid
+
+    def bondsOf(self, atom_uid: int) -> List[int]:
+        """Return unique indexes of not-deleted bonds of atom"""
+        deleted = self["deleted"]
+        return [uid for uid in self._adjacency.get(atom_uid, []) if not deleted[uid]]
+
+    def endpointNumbers(self, rows: npt.NDArray) -> npt.NDArray:
+        """Return array (len(rows), 2) of atom numbers of bond ends"""
+        numbers = self._atoms["number"]
+        return np.stack(
+            [numbers[self["start"][rows]], numbers[self["end"][rows]]], axis=1
+        )
+
+    def endpointsOf(self, uid: int) -> List[int]:
+        """Return atom numbers of bond ends"""
+        numbers = self._atoms["number"]
+        return [
+            int(numbers[self.get(uid, "start")]),
+            int(numbers[self.get(uid, "end")]),
+        ]
+
+    def endpoints(self) -> List[List[int]]:
+        """Return atom numbers of not-deleted bond ends"""
+        return self.endpointNumbers(self.liveRows()).tolist()
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Return bond as dictionary for Dataset"""
+        return {
+            "bond_type": self.types.decode(self.get(row, "type")),
+            "endpoint_atoms": self.endpointsOf(row),
+            "confidence": self.get(row, "confidence"),
+        }
+
+
+@dataclass
+class AnnotationChange:
+    """One change of annotation sent by DataManager to Dataset.
+    Changes are applied in order, index is valid at the moment of applying:
+    add - insert data at index, following objects are shifted
+    remove - delete object at index, following objects are shifted
+    move - set new not scaled x and y of atom at index
+    update - set new endpoint_atoms of bond at index
+    """
+
+    action: str
+    """ One of add, remove, move, update """
+    target: str
+    """ atom or bond """
+    uid: int
+    """ Unique index of the object in DataManager """
+    index: int
+    """ Atom number or line number of the object """
+    data: Dict[str, Any] = field(default_factory=dict)
+    """ Atom or bond record for add, changed values for move and update """
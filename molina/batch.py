@@ -0,0 +1,291 @@
+"""Batch prediction of all images in directory.
+Module does not import Qt widgets, so it works on servers without display
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from molina.prediction_pool import READ_ERROR, PredictionPool
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
+STATE_FILE = ".molina_batch.json"
+
+
+def annotation_path(image_path: Path) -> Path:
+    """Annotation is json file near image with the same name"""
+    image_path = Path(image_path)
+    return image_path.parent.resolve() / (image_path.stem + ".json")
+
+
+def find_images(
+    path_dir: Path, skip_annotated: bool = False, recursive: bool = True
+) -> List[Path]:
+    """Return sorted image paths in directory.
+    With skip_annotated images which already have annotation are not returned
+    """
+    path_dir = Path(path_dir)
+    files = path_dir.rglob("*") if recursive else path_dir.iterdir()
+    images = [
+        path
+        for path in files
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if skip_annotated:
+        images = [path for path in images if not annotation_path(path).is_file()]
+
+    return sorted(images)
+
+
+def chunks(items: List, size: int) -> Iterator[List]:
+    """Split list into consecutive parts of size items"""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def save_annotation(path: Path, annotation: Dict, model_name: str) -> Dict:
+    """Number atoms of predicted annotation and save it near the image"""
+    annotation = {
+        "atoms": annotation.get("atoms", []),
+        "bonds": annotation.get("bonds", []),
+        "model": model_name,
+    }
+    for i, atom in enumerate(annotation["atoms"]):
+        atom["atom_number"] = i
+
+    with open(annotation_path(path), "w", encoding="utf-8") as f:
+        json.dump(annotation, f, ensure_ascii=False, indent=4)
+    return annotation
+
+
+@dataclass
+class BatchState:
+    """Progress of batch prediction saved in directory to continue it later"""
+
+    directory: str
+    """ Directory with images """
+    done: List[str] = field(default_factory=list)
+    """ Images annotated by batch prediction """
+    failed: Dict[str, str] = field(default_factory=dict)
+    """ Images which were not predicted and error messages """
+
+    @property
+    def path(self) -> Path:
+        return Path(self.directory) / STATE_FILE
+
+    @classmethod
+    def load(cls, directory: Path) -> "BatchState":
+        """Read saved state or create new one"""
+        state_path = Path(directory) / STATE_FILE
+        if state_path.is_file():
+            with open(state_path, encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(str(directory), data.get("done", []), data.get("failed", {}))
+
+        return cls(str(directory))
+
+    def save(self) -> None:
+        """Write state into directory"""
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=4)
+
+
+class BatchRunner:
+    """Predicts images of directory which have no annotation.
+    Images are predicted by processes of PredictionPool, so model never runs
+    in the calling process. At most batch_size images wait in the pool,
+    therefore single images sent to the same pool are not stuck behind the
+    whole directory. State is saved after every batch_size predicted images,
+    so stopped prediction continues from not predicted images.
+    Images which can not be read are not tried again.
+    Model error stops the whole prediction.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        pool: PredictionPool,
+        batch_size: int = 8,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        on_annotated: Optional[Callable[[str], None]] = None,
+    ):
+        self.directory = Path(directory)
+        self.pool = pool
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.on_annotated = on_annotated
+
+        self.state = BatchState.load(self.directory)
+        self._cancel = threading.Event()
+
+    def pending(self) -> List[Path]:
+        """Images without annotation which did not fail before"""
+        return [
+            path
+            for path in find_images(self.directory, skip_annotated=True)
+            if str(path) not in self.state.failed
+        ]
+
+    def cancel(self) -> None:
+        """Stop after batches which are running now"""
+        self._cancel.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _finish(self, path: Path, future: Future) -> None:
+        """Save annotation of predicted image or remember unreadable one.
+        Other errors of model are raised
+        """
+        if future.cancelled():
+            raise RuntimeError("Prediction is cancelled")
+        error = future.exception()
+        if error is not None and READ_ERROR not in str(error):
+            raise error
+
+        if error is None:
+            save_annotation(path, future.result()["annotation"], self.pool.model_name)
+            self.state.done.append(str(path))
+            if self.on_annotated:
+                self.on_annotated(str(path))
+        else:
+            self.state.failed[str(path)] = READ_ERROR
+
+    def run(self) -> BatchState:
+        """Predict all pending images, return final state.
+        After cancel, images sent to the pool are waited and saved
+        """
+        self._cancel.clear()
+        paths = self.pending()
+        total = len(paths)
+        if self.on_progress:
+            self.on_progress(0, total)
+
+        waiting = deque(paths)
+        running: Dict[Future, Path] = {}
+        done = 0
+        try:
+            while True:
+                while (
+                    waiting
+                    and len(running) < self.batch_size
+                    and not self._cancel.is_set()
+                ):
+                    path = waiting.popleft()
+                    running[self.pool.submit(str(path))] = path
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._finish(running.pop(future), future)
+                    done += 1
+                    if done % self.batch_size == 0:
+                        self.state.save()
+                if self.on_progress:
+                    self.on_progress(done, total)
+        except Exception:
+            self._cancel.set()
+            raise
+        finally:
+            self.state.save()
+
+        return self.state
+
+
+def _init_process(threads: int) -> None:
+    """Limit math threads of worker process, so processes do not compete for cores"""
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def annotate_image(path: str, molfile: bool = False, smiles: bool = False) -> Dict:
+    """Predict one image in worker process, save annotation and optional
+    molfile and SMILES near the image. Return path, error and seconds spent
+    """
+    import cv2
+
+    from molina.data_structs import ImageData
+
+    start = time.perf_counter()
+    result = {"path": path, "error": None}
+    try:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Image can not be read")
+
+        image_data = ImageData(path, annotation_path(path), image)
+        image_data.runMolscribe()
+        for i, atom in enumerate(image_data.atoms):
+            atom["atom_number"] = i
+        image_data.saveAnnotation()
+
+        if molfile or smiles:
+            from molina.molfile import annotation_to_mol, mol_to_molblock, mol_to_smiles
+
+            mol = annotation_to_mol(
+                {"atoms": image_data.atoms, "bonds": image_data.bonds}
+            )
+            if molfile:
+                Path(path).with_suffix(".mol").write_text(mol_to_molblock(mol))
+            if smiles:
+                Path(path).with_suffix(".smi").write_text(mol_to_smiles(mol) + "\n")
+
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def annotate_path(
+    path: Path,
+    workers: int = 1,
+    molfile: bool = False,
+    smiles: bool = False,
+    overwrite: bool = False,
+    on_progress: Optional[Callable[[int, int, Dict], None]] = None,
+) -> Dict:
+    """Annotate image or all images under directory by worker processes.
+    Every process loads model once. on_progress gets number of finished
+    images, number of all images and result of the last image.
+    Return counts and throughput
+    """
+    path = Path(path)
+    if path.is_dir():
+        paths = find_images(path, skip_annotated=not overwrite)
+    else:
+        paths = [path]
+    paths = [str(p) for p in paths]
+
+    workers = max(1, min(workers, len(paths)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    annotate = partial(annotate_image, molfile=molfile, smiles=smiles)
+
+    start = time.perf_counter()
+    failed = {}
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_process, initargs=(threads,)) as pool:
+        for i, result in enumerate(pool.imap_unordered(annotate, paths), 1):
+            if result["error"]:
+                failed[result["path"]] = result["error"]
+            if on_progress:
+                on_progress(i, len(paths), result)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "images": len(paths),
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": len(paths) / elapsed if elapsed else 0.0,
+    }
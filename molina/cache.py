@@ -0,0 +1,138 @@
+"""Caches of decoded images and annotations limited by memory size"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+# Rough memory of one parsed atom or bond dictionary with its values
+ANNOTATION_ITEM_BYTES = 800
+
+
+def image_nbytes(image_data: Any) -> int:
+    """Memory of decoded image pixels"""
+    image = getattr(image_data, "image", None)
+    return 0 if image is None else image.nbytes
+
+
+def annotation_nbytes(annotation: Dict[str, List]) -> int:
+    """Estimated memory of parsed annotation"""
+    return ANNOTATION_ITEM_BYTES * (
+        len(annotation.get("atoms", [])) + len(annotation.get("bonds", []))
+    )
+
+
+class LRUCache:
+    """Least recently used cache limited by total size of values in bytes.
+    Dirty entries, like annotations with unsaved changes, are never evicted,
+    so cache can be over its limit until they are marked clean.
+    The last put entry is not evicted either, even if it is bigger than limit.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int]):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._dirty = set()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        """Access entry without changing its use order and statistics"""
+        return self._entries[key]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return entry and mark it as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any, dirty: bool = False) -> None:
+        """Add or replace entry, then evict old entries over the limit"""
+        with self._lock:
+            self._remove(key)
+            size = self._sizeof(value)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            if dirty:
+                self._dirty.add(key)
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove entry even if it is dirty"""
+        with self._lock:
+            value = self._entries.get(key, default)
+            self._remove(key)
+            return value
+
+    def setDirty(self, key: Hashable, dirty: bool = True) -> None:
+        """Protect entry from eviction or release it"""
+        with self._lock:
+            if key not in self._entries:
+                return
+            if dirty:
+                self._dirty.add(key)
+            else:
+                self._dirty.discard(key)
+                self._evict()
+
+    def isDirty(self, key: Hashable) -> bool:
+        return key in self._dirty
+
+    def dirtyKeys(self) -> List[Hashable]:
+        """Keys of entries which are protected from eviction"""
+        with self._lock:
+            return list(self._dirty)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits, misses, evictions and memory of cache"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "entries": len(self._entries),
+                "dirty": len(self._dirty),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        """Drop entry, lock must be held"""
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+            self._dirty.discard(key)
+
+    def _evict(self) -> None:
+        """Drop least recently used clean entries over the limit,
+        lock must be held
+        """
+        if self._bytes <= self.max_bytes:
+            return
+
+        newest: Optional[Hashable] = next(reversed(self._entries), None)
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if key == newest or key in self._dirty:
+                continue
+            self._remove(key)
+            self.evictions += 1
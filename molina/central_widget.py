@@ -1,7 +1,9 @@
-from PySide6.QtCore import Qt, QDir, QEvent
+from typing import Optional, Union
+
+import numpy.typing as npt
+from PySide6.QtCore import Qt, QDir, QEvent, QSize
 from PySide6.QtWidgets import (
     QToolButton,
-    QLabel,
     QToolBar,
     QHBoxLayout,
     QVBoxLayout,
@@ -12,11 +14,13 @@ from PySide6.QtWidgets import (
 from PySide6.QtGui import (
     QPalette,
     QColor,
-    QPixmap,
     QIcon,
 )
 
 from molina.drawing_widget import DrawingWidget
+from molina.image_reader import LazyImage
+from molina.pixmap_pyramid import PixmapPyramid
+from molina.tiled_image import TiledImageWidget
 from molina.styles import SCROLLBAR_STYLE, FOCUSED, UNFOCUSED, COLOR_BACKGROUND_WIDGETS
 
 
@@ -38,7 +42,7 @@ class CentralWidget(QWidget):
 
         # Relation between image size, and widget size, then it changes depending on zooming
         self._scale_factor = 1
-        self._pixmap = QPixmap()
+        self._pyramid: Optional[PixmapPyramid] = None
 
         self.central_widget_layout = QVBoxLayout()
         self.setLayout(self.central_widget_layout)
@@ -66,11 +70,11 @@ class CentralWidget(QWidget):
         self.image_container = QWidget()
         self.image_container.setLayout(self.image_layout)
 
-        self.image_widget = QLabel()
+        # Only visible tiles of scaled image are made and painted
+        self.image_widget = TiledImageWidget()
         self.image_widget.setStyleSheet(
             "QWidget { border: none; background-color: white; }"
         )
-        self.image_widget.setAlignment(Qt.AlignCenter)
         self.image_widget.setMinimumSize(200, 200)
 
         self.container_widget = QWidget()
@@ -126,10 +130,7 @@ class CentralWidget(QWidget):
 
     def hasPixmap(self) -> bool:
         """Check Pixmap existing"""
-        if self._pixmap.isNull():
-            return False
-        else:
-            return True
+        return self._pyramid is not None and not self._pyramid.isNull()
 
     def setScaleFactor(self, factor: float) -> None:
         """Set new scale factor and zoom factor to drawing widget"""
@@ -148,49 +149,33 @@ class CentralWidget(QWidget):
 
     def resizeImage(self) -> None:
         """Change image representation size with saving original image size"""
-        if not self._pixmap.isNull():
-            scaled_pixmap = self._pixmap.scaled(
-                self._scale_factor * self._pixmap.size(), Qt.KeepAspectRatio
-            )
-
-            self.image_widget.setPixmap(scaled_pixmap)
-            self.image_widget.setMinimumSize(scaled_pixmap.size())
+        if self.hasPixmap():
+            self.image_widget.setScale(self._scale_factor)
+            scaled_size = self.image_widget.imageSize()
+            self.image_widget.setMinimumSize(scaled_size)
 
             self.drawing_widget.setZoomFactor(self._scale_factor)
 
             # Drawing widget size strongly relates to scaled image size
-            self.drawing_widget.setFixedSize(scaled_pixmap.size())
+            self.drawing_widget.setFixedSize(scaled_size)
             self.drawing_widget.updateDrawScale()
 
-    def setPixmapSize(self) -> None:
-        """Save image widget size when main window resizes"""
-        if not self._pixmap.isNull():
-            self.image_widget.setPixmap(
-                self._pixmap.scaled(
-                    self._scale_factor * self._pixmap.size(), Qt.KeepAspectRatio
-                )
-            )
-
-    def fitImage(self) -> QPixmap:
+    def fitImage(self) -> QSize:
         """When image opens at first time it should fit to image widget size"""
-        if self._pixmap.height() >= self._pixmap.width():
-            scaled_pixmap = self._pixmap.scaledToHeight(self.image_widget.height())
-            # if picture is still out of boundaries
-            if scaled_pixmap.width() >= self.image_widget.width():
-                scaled_pixmap = scaled_pixmap.scaledToWidth(self.image_widget.width())
-        else:
-            scaled_pixmap = self._pixmap.scaledToWidth(self.image_widget.width())
-            # if picture is still out of boundaries
-            if scaled_pixmap.height() >= self.image_widget.height():
-                scaled_pixmap = scaled_pixmap.scaledToHeight(self.image_widget.height())
-
-        self.image_widget.setPixmap(scaled_pixmap)
-        return scaled_pixmap
-
-    def setCentralPixmap(self, image: QPixmap) -> None:
-        """Changes sizes, factors and clean drawing area when new image is opened"""
-        self._pixmap = image
-        if not self._pixmap.isNull():
+        scale = min(
+            self.image_widget.height() / self._pyramid.height(),
+            self.image_widget.width() / self._pyramid.width(),
+        )
+        self.image_widget.setImage(self._pyramid, scale)
+        return self.image_widget.imageSize()
+
+    def setCentralImage(self, image: Union[npt.NDArray, LazyImage]) -> None:
+        """Changes sizes, factors and clean drawing area when new image is opened.
+        Image array is shown without copying, it must not be changed later.
+        Preview of lazy image is shown until zoom needs full resolution
+        """
+        self._pyramid = PixmapPyramid(image)
+        if self.hasPixmap():
 
             # To return image_widget size after zooming to usual size save policy
             sp = self.image_widget.sizePolicy()
@@ -212,20 +197,20 @@ class CentralWidget(QWidget):
             self.image_widget.setFixedSize(scrollAreaWidth, scrollAreaHeight)
 
             # Change pixmap size as image_widget size
-            original_size = self._pixmap.height() + self._pixmap.width()
-            scaled_pixmap = self.fitImage()
+            original_size = self._pyramid.height() + self._pyramid.width()
+            scaled_size = self.fitImage()
 
             # Return old policy
             self.image_widget.setMaximumSize(2000, 2000)
             self.image_widget.setSizePolicy(sp)
 
-            self.drawing_widget.setFixedSize(scaled_pixmap.size())
+            self.drawing_widget.setFixedSize(scaled_size)
             self.drawing_widget.cleanDrawingWidget()
 
             self.setScaleFactor(
-                (scaled_pixmap.height() + scaled_pixmap.width()) / original_size
+                (scaled_size.height() + scaled_size.width()) / original_size
             )
-            self.drawing_widget.setConstants(self._pixmap.size())
+            self.drawing_widget.setConstants(self._pyramid.size())
 
     def setColor(self, widget: QWidget, color: QColor) -> None:
         """Set background widget color"""
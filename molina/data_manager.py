@@ -1,16 +1,15 @@
-import math
 from typing import Optional, List, Dict, Tuple
 
-import numpy as np
-import pandas as pd
 from PySide6.QtCore import QObject, Signal, QPoint, QLine
 
+from molina.annotation_store import AtomStore, BondStore, AnnotationChange
 from molina.drawing_objects import Atom, TypedLine
+from molina.spatial_index import SpatialGrid
 from molina.action_managers import DrawingActionManager
 
 
 class DataManager(QObject):
-    dataUpdateToDataset = Signal(object)
+    annotationChanged = Signal(object)
     newDataToDrawingWidget = Signal()
     pointUpdate = Signal(str, object, object)
     lineUpdate = Signal(str, object, object)
@@ -22,6 +21,11 @@ class DataManager(QObject):
     Dataset of images stores coordinates in fractions and indices of atoms between which there is a bond.
     Also Dataset save types of atoms and bonds.
     DataManager saves all information about the object (atom or bond) and makes some calculations.
+    Atoms and bonds are kept in columnar stores (see annotation_store), so adding an object
+    is amortized O(1) and unique index of an object is its row in the store.
+    Dataset receives only list of changes (AnnotationChange) after every edit.
+    Positions of atoms and bonds on not scaled image are kept in spatial grids
+    to find the closest object without scanning all of them.
     DataManager can have only one instance.
     DataManager delegates all operations to DrawingActionManager, enabling it to cancel the last action(s).
     """
@@ -39,241 +43,191 @@ class DataManager(QObject):
         super(DataManager, self).__init__()
         self._is_init = True
 
-        self._next_bond_id = 0
-        self._next_atom_id = 0
         self._action_manager = DrawingActionManager(self)
-        self._bonds = pd.DataFrame(
-            columns=[
-                "id",
-                "line_number",
-                "line_instance",
-                "bond_type",
-                "start_atom_idx",
-                "end_atom_idx",
-                "endpoint_atoms",
-                "confidence",
-                "deleted",
-            ]
+        self._atoms = AtomStore()
+        self._bonds = BondStore(self._atoms)
+        self._atoms_grid = SpatialGrid()
+        self._bonds_grid = SpatialGrid()
+
+    def _indexAtom(self, uid: int) -> None:
+        """Put atom and its bonds into spatial grids with actual positions"""
+        self._atoms_grid.insert(
+            uid, self._atoms.get(uid, "x"), self._atoms.get(uid, "y")
         )
-
-        self._atoms = pd.DataFrame(
-            columns=[
-                "id",
-                "atom_number",
-                "atom_instance",
-                "atom_symbol",
-                "x",
-                "y",
-                "confidence",
-                "deleted",
-            ]
+        for bond_uid in self._bonds.bondsOf(uid):
+            self._indexBond(bond_uid)
+
+    def _indexBond(self, uid: int) -> None:
+        """Put bond into spatial grid with actual positions of its atoms"""
+        start = self._bonds.get(uid, "start")
+        end = self._bonds.get(uid, "end")
+        self._bonds_grid.insert(
+            uid,
+            self._atoms.get(start, "x"),
+            self._atoms.get(start, "y"),
+            self._atoms.get(end, "x"),
+            self._atoms.get(end, "y"),
         )
 
-    def _sendDataToDataset(self) -> None:
-        """Emit signal to send updated data to Dataset:
-        empty or full dictionary
-        atoms - atom number, atom symbol, x, y, confidence
-        bonds - bond_type, endpoint_atoms, confidence
+    def setCellSize(self, cell_size: float) -> None:
+        """Set cell size of spatial grids, it should be close to bond length"""
+        self._atoms_grid.setCellSize(cell_size)
+        self._bonds_grid.setCellSize(cell_size)
+
+    def findClosestAtom(self, x: float, y: float, radius: float) -> Optional[int]:
+        """Return index of the closest atom to point on not scaled image or None"""
+        uid = self._atoms_grid.nearest(x, y, radius)
+        if uid is None:
+            return None
+        return int(self._atoms.get(uid, "number"))
+
+    def findClosestBond(
+        self, x: float, y: float, radius: float, margin: float = 0.17
+    ) -> Optional[int]:
+        """Return index of the closest bond to point on not scaled image or None.
+        Only middle part of bond is taken into account, ends belong to atoms
         """
-        if self._atoms.shape[0] == 0:
-            self.dataUpdateToDataset.emit({"atoms": [], "bonds": []})
+        uid = self._bonds_grid.nearest(x, y, radius, margin)
+        if uid is None:
+            return None
+        return int(self._bonds.get(uid, "number"))
+
+    def _sendChangesToDataset(self, changes: List[AnnotationChange]) -> None:
+        """Emit signal to send changes of data to Dataset"""
+        if changes:
+            self.annotationChanged.emit(changes)
+
+    def _atomChange(self, action: str, uid: int) -> AnnotationChange:
+        """Create change of atom with actual atom number"""
+        index = int(self._atoms.get(uid, "number"))
+        if action == "add":
+            data = self._atoms.record(uid)
+        elif action == "move":
+            data = {
+                "x": float(self._atoms.get(uid, "x")),
+                "y": float(self._atoms.get(uid, "y")),
+            }
         else:
-            filtered_atoms = self._atoms[self._atoms["deleted"] != True]
-            atoms_data = filtered_atoms.drop(
-                columns=["id", "atom_instance", "deleted"]
-            ).to_dict(orient="records")
-
-            filtered_bonds = self._bonds[self._bonds["deleted"] != True]
-            bonds_data = filtered_bonds[
-                ["bond_type", "endpoint_atoms", "confidence"]
-            ].to_dict(orient="records")
-
-            self.dataUpdateToDataset.emit({"atoms": atoms_data, "bonds": bonds_data})
+            data = {}
+        return AnnotationChange(action, "atom", uid, index, data)
+
+    def _bondChange(self, action: str, uid: int) -> AnnotationChange:
+        """Create change of bond with actual line number"""
+        index = int(self._bonds.get(uid, "number"))
+        if action == "add":
+            data = self._bonds.record(uid)
+        elif action == "update":
+            data = {"endpoint_atoms": self._bonds.endpointsOf(uid)}
+        else:
+            data = {}
+        return AnnotationChange(action, "bond", uid, index, data)
 
     def sendNewDataToDrawingWidget(self, data: Dict[str, Dict]) -> None:
         """When image already has annotation, create common data for DataManager
         and emit signal to send necessary data to draw it by DrawingWidget
         """
-        self._atoms = pd.DataFrame(data["atoms"])
-        self._atoms["atom_instance"] = self._atoms.apply(
-            lambda row: Atom(QPoint(row["x"], row["y"]), row["atom_symbol"]), axis=1
-        )
-        self._atoms["id"] = self._atoms.index
-        self._atoms["atom_number"] = self._atoms.index
-        self._atoms["deleted"] = False
-
-        self._next_atom_id = self._atoms.index[-1] + 1
-
-        if "confidence" not in self._atoms.columns:
-            self._atoms["confidence"] = "not_modeling"
-
-        self._bonds = pd.DataFrame(data["bonds"])
-
-        if not self._bonds.empty:
-            self._bonds["id"] = self._bonds.index
-            self._bonds["line_number"] = self._bonds.index
-            self._bonds["deleted"] = False
-            self._bonds["start_atom_idx"] = self._bonds["endpoint_atoms"].apply(
-                lambda x: x[0]
+        self._atoms = AtomStore(len(data["atoms"]))
+        for i, atom in enumerate(data["atoms"]):
+            self._atoms.add(
+                i,
+                atom["atom_symbol"],
+                atom["x"],
+                atom["y"],
+                Atom(QPoint(atom["x"], atom["y"]), atom["atom_symbol"]),
+                atom.get("confidence", "not_modeling"),
             )
-            self._bonds["end_atom_idx"] = self._bonds["endpoint_atoms"].apply(
-                lambda x: x[1]
+
+        # Atoms are loaded in order, so atom indexes are their unique indexes
+        self._bonds = BondStore(self._atoms, len(data["bonds"]))
+        for i, bond in enumerate(data["bonds"]):
+            start, end = bond["endpoint_atoms"]
+            atom1 = self._atoms.get(start, "instance")
+            atom2 = self._atoms.get(end, "instance")
+            self._bonds.add(
+                i,
+                bond["bond_type"],
+                start,
+                end,
+                TypedLine(
+                    QLine(atom1.position, atom2.position),
+                    bond["bond_type"],
+                    [start, end],
+                ),
+                bond.get("confidence", "not_modeling"),
             )
 
-            self._next_bond_id = self._bonds.index[-1] + 1
-
-            lines = []
-            for bond_index, bond_row in self._bonds.iterrows():
-                atom1 = self._atoms[
-                    self._atoms["atom_number"] == bond_row["start_atom_idx"]
-                ]["atom_instance"].values[0]
-                atom2 = self._atoms[
-                    self._atoms["atom_number"] == bond_row["end_atom_idx"]
-                ]["atom_instance"].values[0]
-                lines.append(
-                    TypedLine(
-                        QLine(atom1.position, atom2.position),
-                        bond_row["bond_type"],
-                        [bond_row["start_atom_idx"], bond_row["end_atom_idx"]],
-                    )
-                )
-
-            self._bonds["line_instance"] = lines
-
-            if "confidence" not in self._bonds.columns:
-                self._bonds["confidence"] = "not_modeling"
+        self._atoms_grid.clear()
+        self._bonds_grid.clear()
+        for uid in range(len(self._atoms)):
+            self._indexAtom(uid)
 
         self._action_manager = DrawingActionManager(self)
         self.newDataToDrawingWidget.emit()
 
     def addAtom(self, atom: Atom, idx: int) -> None:
         """Add new atom data after drawing point"""
-        new_data = pd.DataFrame(
-            {
-                "id": self._next_atom_id,
-                "atom_number": idx,
-                "atom_instance": atom,
-                "atom_symbol": atom.name,
-                "x": atom.position.x(),
-                "y": atom.position.y(),
-                "confidence": "not_modeling",
-                "deleted": False,
-            },
-            index=[0],
+        uid = self._atoms.add(
+            idx, atom.name, atom.position.x(), atom.position.y(), atom
         )
-        if self._atoms.empty:
-            self._atoms = new_data.copy()
-        else:
-            self._atoms = pd.concat([self._atoms, new_data], ignore_index=True)
-
-        self._sendDataToDataset()
+        self._indexAtom(uid)
 
-        self._action_manager.addAction(self._next_atom_id, "add_atom")
+        self._sendChangesToDataset([self._atomChange("add", uid)])
 
-        self._next_atom_id += 1
+        self._action_manager.addAction(uid, "add_atom")
 
     def addBond(
         self, line: TypedLine, start_atom_idx: int, end_atom_idx: int, idx: int
     ) -> None:
         """Add new bond data after drawing line"""
-        new_data = pd.DataFrame(
-            {
-                "id": self._next_bond_id,
-                "line_number": idx,
-                "line_instance": line,
-                "bond_type": line.type,
-                "start_atom_idx": start_atom_idx,
-                "end_atom_idx": end_atom_idx,
-                "endpoint_atoms": [[start_atom_idx, end_atom_idx]],
-                "confidence": "not_modeling",
-                "deleted": False,
-            },
-            index=[0],
+        uid = self._bonds.add(
+            idx,
+            line.type,
+            self._atoms.rowByNumber(start_atom_idx),
+            self._atoms.rowByNumber(end_atom_idx),
+            line,
         )
+        self._indexBond(uid)
 
-        if self._bonds.empty:
-            self._bonds = new_data.copy()
-        else:
-            self._bonds = pd.concat([self._bonds, new_data], ignore_index=True)
-
-        self._sendDataToDataset()
-
-        self._action_manager.addAction(self._next_bond_id, "add_bond")
+        self._sendChangesToDataset([self._bondChange("add", uid)])
 
-        self._next_bond_id += 1
+        self._action_manager.addAction(uid, "add_bond")
 
-    def _pointIsLineEndpoint(
-        self, point: QPoint, line: QLine, rel_tol: float = 0.01
-    ) -> bool:
-        """Check if a point is part of a line"""
-        mask_1 = math.isclose(
-            line.p1().x(), point.x(), rel_tol=rel_tol
-        ) and math.isclose(line.p1().y(), point.y(), rel_tol=rel_tol)
+    def _lineInstance(self, uid: int) -> TypedLine:
+        """Return line of bond with actual atom indexes"""
+        line = self._bonds.get(uid, "instance")
+        line.setAtomIndexes(self._bonds.endpointsOf(uid))
+        return line
 
-        mask_2 = math.isclose(
-            line.p2().x(), point.x(), rel_tol=rel_tol
-        ) and math.isclose(line.p2().y(), point.y(), rel_tol=rel_tol)
-
-        return mask_1, mask_2
-
-    def _recombineEndpoints(self) -> None:
+    def _recombineEndpoints(self, index: int) -> List[AnnotationChange]:
         """endpoint_atoms is list of atom indexes.
-        When atom deleted, indexes are changed.
-        This function refill endpoint_atoms with actual indexes
+        When atom is deleted or returned, indexes starting from index are changed.
+        Bonds refer to atoms by unique index, so actual indexes are got by one remap.
+        This function sends actual indexes to DrawingWidget
+        and returns changes for bonds with new endpoint_atoms
         """
-        # Reset old endpoints
-        self._bonds["endpoint_atoms"] = None
-        self._bonds["start_atom_idx"] = None
-        self._bonds["end_atom_idx"] = None
-
-        filtered_atoms = self._atoms[self._atoms["deleted"] == False]
-        filtered_bonds = self._bonds[self._bonds["deleted"] == False]
-
-        for bond_index, bond_row in filtered_bonds.iterrows():
-            temp_start = None
-            temp_end = None
-            for atom_index, atom_row in filtered_atoms.iterrows():
-                # Check is any of bond ends equal to atom position
-                is_p1, is_p2 = self._pointIsLineEndpoint(
-                    atom_row["atom_instance"].position, bond_row["line_instance"].line
-                )
-
-                if is_p1:
-                    temp_start = atom_row["atom_number"]
-                elif is_p2:
-                    temp_end = atom_row["atom_number"]
-
-            self._bonds.at[bond_index, "start_atom_idx"] = temp_start
-            self._bonds.at[bond_index, "end_atom_idx"] = temp_end
-
-        # Create endpoints
-        self._bonds["endpoint_atoms"] = self._bonds.apply(
-            lambda row: [row["start_atom_idx"], row["end_atom_idx"]], axis=1
-        )
-
-        endpoints = self._bonds.loc[
-            self._bonds["deleted"] == False, "endpoint_atoms"
-        ].tolist()
+        rows = self._bonds.liveRows()
+        endpoints = self._bonds.endpointNumbers(rows)
 
         # Update indexes for drawing line
-        if len(endpoints) != 0:
-            self.lineIndexUpdate.emit(endpoints)
+        if len(rows) != 0:
+            self.lineIndexUpdate.emit(endpoints.tolist())
+
+        changed = rows[(endpoints >= index).any(axis=1)]
+        return [self._bondChange("update", uid) for uid in changed]
 
     def deleteBond(self, index: int, length: Optional[int] = None):
         """When the bond deleted, for this bond flag "deleted" becomes True.
         line_number rearranged.
         Data for dataset is updated.
         """
-        uid = self._bonds.loc[self._bonds["line_number"] == index, "id"].to_list()
-        self._bonds.loc[self._bonds["line_number"] == index, "deleted"] = True
-        if self._bonds["deleted"].all() != True:
-            self._bonds.loc[self._bonds["deleted"] == False, "line_number"] = np.arange(
-                length
-            )
+        uid = self._bonds.rowByNumber(index)
+        changes = [self._bondChange("remove", uid)]
+        self._bonds.delete([uid])
+        self._bonds_grid.remove(uid)
 
-        self._action_manager.addAction(uid, "delete_bond")
+        self._action_manager.addAction([uid], "delete_bond")
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset(changes)
 
     def deleteAtom(self, index: int, length: Optional[int] = None):
         """When the atom deleted, for this atom flag "deleted" becomes True.
@@ -283,128 +237,89 @@ class DataManager(QObject):
         line_number is rearranged.
         Data for dataset is updated.
         """
-        # Get not-deleted data
-        atoms = self._atoms.loc[self._atoms["deleted"] == False]
-
         # Get unique index for deleted atom
-        uid = atoms.loc[atoms["atom_number"] == index, "id"].to_list()
-
-        assert len(uid) == 1
-
-        # Set flag deleted for chosen uid and rerange atoms
-        self._atoms.loc[self._atoms["id"] == uid[0], "deleted"] = True
-        if self._atoms["deleted"].all() != True:
-            self._atoms.loc[self._atoms["deleted"] == False, "atom_number"] = np.arange(
-                length
+        uid = [self._atoms.rowByNumber(index)]
+        changes = []
+
+        # Set flag deleted for chosen uid, following atoms are renumbered
+        self._atoms.delete(uid)
+        self._atoms_grid.remove(uid[0])
+
+        # Check is any not-deleted bond has atom as endpoint
+        uids_bond = self._bonds.bondsOf(uid[0])
+
+        if uids_bond:
+            # Delete bonds from the end, so indexes of remaining bonds are not shifted
+            line_idxs = []
+            for uid_bond in reversed(uids_bond):
+                changes.append(self._bondChange("remove", uid_bond))
+                line_idxs.append(int(self._bonds.get(uid_bond, "number")))
+
+            # Set deleted flag, following bonds are renumbered
+            self._bonds.delete(uids_bond)
+            for uid_bond in uids_bond:
+                self._bonds_grid.remove(uid_bond)
+
+            # Add action for action manager
+            self._action_manager.addAction(
+                (uid, uids_bond, "not_all_deleted"), "delete_atom_and_bond"
             )
 
-        if not self._bonds.empty and self._bonds["deleted"].all() != True:
-            # Get not-deleted bonds
-            bonds = self._bonds.loc[self._bonds["deleted"] == False]
-            # Check is any bond has atom index as endpoint
-            uids_bond = bonds.loc[
-                bonds["endpoint_atoms"].apply(lambda endpoints: index in endpoints),
-                "id",
-            ].to_list()
-
-            if uids_bond:
-                # Set deleted flag and rerange not-deleted bonds
-                self._bonds.loc[self._bonds["id"].isin(uids_bond), "deleted"] = True
-
-                length_bond = self._bonds.loc[self._bonds["deleted"] == False].shape[0]
-                self._bonds.loc[self._bonds["deleted"] == False, "line_number"] = (
-                    np.arange(length_bond)
-                )
-                # Add action for action manager
-                self._action_manager.addAction(
-                    (uid, uids_bond, "not_all_deleted"), "delete_atom_and_bond"
-                )
-
-                # Get indexes of deleted bonds and delete them from drawing line bond
-                line_idxs = self._bonds.loc[
-                    self._bonds["id"].isin(uids_bond), "line_number"
-                ].to_list()
-                line_idxs.reverse()
-
-                if len(line_idxs) != 0:
-                    for i in line_idxs:
-                        self.lineUpdate.emit("delete", i, None)
-
-                # Update atom indexes in endpoints of line
-                self._recombineEndpoints()
-
-            else:
-                self._recombineEndpoints()
-
-                self._action_manager.addAction(uid[0], "delete_atom")
+            # Delete them from drawing line bond
+            for i in line_idxs:
+                self.lineUpdate.emit("delete", i, None)
 
         else:
             self._action_manager.addAction(uid[0], "delete_atom")
 
-        self._sendDataToDataset()
+        changes.append(AnnotationChange("remove", "atom", uid[0], index))
+
+        # Update atom indexes in endpoints of line
+        changes.extend(self._recombineEndpoints(index))
+
+        self._sendChangesToDataset(changes)
 
     def getDrawingData(self) -> None:
         """Return data needed to DrawingWidget:
         points - atom position on not scaled image
         lines - bond position on not scaled image
         """
-        filtered_points = self._atoms[self._atoms["deleted"] != True]
-        points_data = filtered_points["atom_instance"].to_list()
+        points_data = self._atoms["instance"][self._atoms.liveRows()].tolist()
 
-        if not self._bonds.empty:
-            filtered_lines = self._bonds[self._bonds["deleted"] != True]
-            bonds_data = filtered_lines["line_instance"].to_list()
-            endpoints = filtered_lines["endpoint_atoms"].to_list()
-        else:
-            bonds_data = []
-            endpoints = []
+        bond_rows = self._bonds.liveRows()
+        bonds_data = self._bonds["instance"][bond_rows].tolist()
+        endpoints = self._bonds.endpointNumbers(bond_rows).tolist()
+        for line, atom_indexes in zip(bonds_data, endpoints):
+            line.setAtomIndexes(atom_indexes)
 
         return {"points": points_data, "lines": bonds_data, "endpoints": endpoints}
 
     def allDeleted(self) -> Tuple[List]:
         """Set flag "deleted" True for all actual objects"""
-        uids_atoms = self._atoms.loc[self._atoms["deleted"] == False, "id"].to_list()
-        self._atoms["deleted"] = True
+        uids_atoms = self._atoms.liveRows().tolist()
+        uids_bonds = self._bonds.liveRows().tolist()
+
+        # Remove from the end, so indexes of remaining objects are not shifted
+        changes = [self._bondChange("remove", uid) for uid in reversed(uids_bonds)]
+        changes.extend(self._atomChange("remove", uid) for uid in reversed(uids_atoms))
 
-        uids_bonds = self._bonds.loc[self._bonds["deleted"] == False, "id"].to_list()
-        self._bonds["deleted"] = True
+        self._atoms.deleteAll()
+        self._bonds.deleteAll()
+        self._atoms_grid.clear()
+        self._bonds_grid.clear()
 
         self._action_manager.addAction(
             (uids_atoms, uids_bonds, "all_deleted"), "delete_atom_and_bond"
         )
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset(changes)
 
     def cleanAll(self) -> None:
         """Reset info when image is changed"""
-        self._bonds = pd.DataFrame(
-            columns=[
-                "id",
-                "line_number",
-                "line_instance",
-                "bond_type",
-                "start_atom_idx",
-                "end_atom_idx",
-                "endpoint_atoms",
-                "confidence",
-                "deleted",
-            ]
-        )
-
-        self._atoms = pd.DataFrame(
-            columns=[
-                "id",
-                "atom_number",
-                "atom_instance",
-                "atom_symbol",
-                "x",
-                "y",
-                "confidence",
-                "deleted",
-            ]
-        )
-        self._next_bond_id = 0
-        self._next_atom_id = 0
+        self._atoms = AtomStore()
+        self._bonds = BondStore(self._atoms)
+        self._atoms_grid.clear()
+        self._bonds_grid.clear()
 
         self._action_manager = DrawingActionManager(self)
 
@@ -414,139 +329,113 @@ class DataManager(QObject):
 
     def undoAddAtom(self, uid: int) -> None:
         """Delete last added atom"""
-        self._atoms.loc[self._atoms["id"] == uid, "deleted"] = True
+        changes = [self._atomChange("remove", uid)]
+        self._atoms.delete([uid])
+        self._atoms_grid.remove(uid)
         self.pointUpdate.emit("delete", None, None)
-        self._sendDataToDataset()
+        self._sendChangesToDataset(changes)
 
     def undoDeleteAtom(self, uid: int) -> None:
         """Return last deleted atom"""
-        self._atoms.loc[self._atoms["id"] == uid, "deleted"] = False
-        length = self._atoms.loc[self._atoms["deleted"] == False, "atom_number"].shape[
-            0
-        ]
-        self._atoms.loc[self._atoms["deleted"] == False, "atom_number"] = np.arange(
-            length
-        )
+        self._atoms.restore([uid])
+        self._indexAtom(uid)
+        index = int(self._atoms.get(uid, "number"))
 
-        assert self._atoms.loc[self._atoms["id"] == uid, "atom_number"].shape[0] == 1
-        self.pointUpdate.emit(
-            "add",
-            self._atoms.loc[self._atoms["id"] == uid, "atom_number"].iloc[0],
-            self._atoms.loc[self._atoms["id"] == uid, "atom_instance"].iloc[0],
-        )
-        self._sendDataToDataset()
+        self.pointUpdate.emit("add", index, self._atoms.get(uid, "instance"))
+
+        changes = [self._atomChange("add", uid)]
+        changes.extend(self._recombineEndpoints(index))
+        self._sendChangesToDataset(changes)
 
     def undoAddBond(self, uid: int) -> None:
         """Delete last added bond"""
-        self._bonds.loc[self._bonds["id"] == uid, "deleted"] = True
+        changes = [self._bondChange("remove", uid)]
+        self._bonds.delete([uid])
+        self._bonds_grid.remove(uid)
         self.lineUpdate.emit("delete", None, None)
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset(changes)
 
-    def undoDeleteBond(self, uid: int) -> None:
+    def undoDeleteBond(self, uid: List[int]) -> None:
         """Return last deleted bond"""
         assert len(uid) == 1
         uid = uid[0]
-        self._bonds.loc[self._bonds["id"] == uid, "deleted"] = False
-        length = self._bonds.loc[self._bonds["deleted"] == False, "line_number"].shape[
-            0
-        ]
-        self._bonds.loc[self._bonds["deleted"] == False, "line_number"] = np.arange(
-            length
-        )
+        self._bonds.restore([uid])
+        self._indexBond(uid)
 
-        assert self._bonds.loc[self._bonds["id"] == uid, "line_number"].shape[0] == 1
         self.lineUpdate.emit(
             "add",
-            self._bonds.loc[self._bonds["id"] == uid, "line_number"].iloc[0],
-            self._bonds.loc[self._bonds["id"] == uid, "line_instance"].iloc[0],
+            int(self._bonds.get(uid, "number")),
+            self._lineInstance(uid),
         )
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset([self._bondChange("add", uid)])
 
-    def undoDeleteAtomAndBond(self, data: Tuple[int, List[int], str]) -> None:
+    def undoDeleteAtomAndBond(self, data: Tuple[List[int], List[int], str]) -> None:
         """Return last deleted atoms and bonds"""
         uid_atom, uids_bond, flag = data
+        changes = []
         for idx in uid_atom:
-            self._atoms.loc[self._atoms["id"] == idx, "deleted"] = False
-
-            length = self._atoms.loc[
-                self._atoms["deleted"] == False, "atom_number"
-            ].shape[0]
-            self._atoms.loc[self._atoms["deleted"] == False, "atom_number"] = np.arange(
-                length
-            )
+            self._atoms.restore([idx])
+            self._indexAtom(idx)
+            changes.append(self._atomChange("add", idx))
 
             self.pointUpdate.emit(
                 "add",
-                self._atoms.loc[self._atoms["id"] == idx, "atom_number"].iloc[0],
-                self._atoms.loc[self._atoms["id"] == idx, "atom_instance"].iloc[0],
+                int(self._atoms.get(idx, "number")),
+                self._atoms.get(idx, "instance"),
             )
 
         for idx in uids_bond:
-            self._bonds.loc[self._bonds["id"] == idx, "deleted"] = False
-
-            length = self._bonds.loc[
-                self._bonds["deleted"] == False, "line_number"
-            ].shape[0]
-            self._bonds.loc[self._bonds["deleted"] == False, "line_number"] = np.arange(
-                length
-            )
+            self._bonds.restore([idx])
+            self._indexBond(idx)
+            changes.append(self._bondChange("add", idx))
 
             self.lineUpdate.emit(
                 "add",
-                self._bonds.loc[self._bonds["id"] == idx, "line_number"].iloc[0],
-                self._bonds.loc[self._bonds["id"] == idx, "line_instance"].iloc[0],
+                int(self._bonds.get(idx, "number")),
+                self._lineInstance(idx),
             )
 
         # If all object deleted bonds are not recombined, it can be just restored
         if flag == "not_all_deleted":
-            self._recombineEndpoints()
+            changes.extend(
+                self._recombineEndpoints(int(self._atoms.get(uid_atom[0], "number")))
+            )
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset(changes)
 
-    def _updateLineInstance(self, row, index, position):
-        if not row["deleted"] and row["start_atom_idx"] == index:
-            row["line_instance"].line.setP1(position)
-        elif not row["deleted"] and row["end_atom_idx"] == index:
-            row["line_instance"].line.setP2(position)
+    def _updatePosition(self, index: int, position: QPoint) -> int:
+        """Replace position atom and bond on new one, return unique index of atom"""
+        row = self._atoms.rowByNumber(index)
+        self._atoms.get(row, "instance").position = position
+        self._atoms.set(row, "x", position.x())
+        self._atoms.set(row, "y", position.y())
+        self._indexAtom(row)
 
-        return row
+        for bond_uid in self._bonds.bondsOf(row):
+            line = self._bonds.get(bond_uid, "instance").line
+            if self._bonds.get(bond_uid, "start") == row:
+                line.setP1(position)
+            else:
+                line.setP2(position)
 
-    def _updatePosition(self, index: int, position: QPoint) -> None:
-        """Replace position atom and bond on new one"""
-        self._atoms.loc[
-            (self._atoms["deleted"] == False) & (self._atoms["atom_number"] == index),
-            "atom_instance",
-        ].item().position = position
-        self._atoms.loc[
-            (self._atoms["deleted"] == False) & (self._atoms["atom_number"] == index),
-            "x",
-        ] = position.x()
-        self._atoms.loc[
-            (self._atoms["deleted"] == False) & (self._atoms["atom_number"] == index),
-            "y",
-        ] = position.y()
-
-        self._bonds.apply(self._updateLineInstance, axis=1, args=(index, position))
+        return row
 
     def updateAtomPosition(self, index: int, position: QPoint) -> None:
         """When atom was moved change its position here"""
-        atom = self._atoms.loc[
-            (self._atoms["deleted"] == False) & (self._atoms["atom_number"] == index),
-            "atom_instance",
-        ].item()
+        atom = self._atoms.get(self._atoms.rowByNumber(index), "instance")
 
         self._action_manager.addAction((index, atom.position), "move_atom")
 
-        self._updatePosition(index, position)
+        uid = self._updatePosition(index, position)
 
-        self._sendDataToDataset()
+        self._sendChangesToDataset([self._atomChange("move", uid)])
 
     def undoUpdateAtomPosition(self, data: Tuple[int, QPoint]) -> None:
         """Return old position"""
         index, old_position = data
 
-        self._updatePosition(index, old_position)
-        self._sendDataToDataset()
+        uid = self._updatePosition(index, old_position)
+        self._sendChangesToDataset([self._atomChange("move", uid)])
         self.atomPositionUpdate.emit(index, old_position)
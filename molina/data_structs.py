@@ -2,23 +2,21 @@
 
 # %% Imports
 import json, copy
-from pathlib import Path
-
-import torch, cv2
 
 from dataclasses import dataclass, field
-from typing import Any, List, Dict, Optional
-import numpy.typing as npt
+from typing import Any, Callable, List, Dict, Optional, Union
 
 import numpy as np
-from PySide6.QtCore import QObject, Signal
-
-from molscribe import MolScribe
+from PySide6.QtCore import QObject, Qt, Signal, Slot
 
+from molina.annotation_store import AnnotationChange
+from molina.batch import BatchRunner, annotation_path, find_images
+from molina.cache import LRUCache, annotation_nbytes, image_nbytes
 from molina.data_manager import DataManager
-
-
-MOLSCRIBE = "./models/molscribe_aux_1m.pth"
+from molina.image_reader import LazyImage, open_image
+from molina.model_registry import predict_image
+from molina.prediction_pool import PredictionPool
+from molina.prefetcher import ImagePrefetcher
 
 
 @dataclass
@@ -29,30 +27,70 @@ class ImageData:
     """ Path to the image file """
     path_annotation: str
     """ Path to the annotation file """
-    image: np.array
-    """ Numpy-array representation of the image """
+    image: Union[np.array, LazyImage]
+    """ Numpy-array representation of the image, big images are decoded lazily """
     atoms: Optional[List[Dict[str, float]]] = field(default_factory=list)
     """ List of recognized atoms and their parameters """
     bonds: Optional[List[Dict[str, Any]]] = field(default_factory=list)
     """ List of recognized bonds and their parameters """
+    timings: Dict[str, float] = field(default_factory=dict)
+    """ Seconds spent on model loading and inference in the last prediction """
+    model: Optional[str] = None
+    """ Name of model which predicted annotation """
 
     def runMolscribe(self) -> None:
-        """Annotates image via MolScribe"""
-        image = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
-        self.model = MolScribe(MOLSCRIBE, torch.device("cpu"))
-        result = self.model.predict_image(
-            image, return_atoms_bonds=True, return_confidence=True
-        )
+        """Annotates image via MolScribe, model is loaded once per process"""
+        annotation, self.timings = predict_image(self.image, "MolScribe")
+        if annotation:
+            self.atoms = annotation["atoms"]
+            self.bonds = annotation["bonds"]
+            self.model = "MolScribe"
+
+    def applyChanges(self, changes: List[AnnotationChange]) -> None:
+        """Apply changes of annotation made by user.
+        Coordinates of changed atoms are replaced by fractions,
+        other atoms and bonds are not touched
+        """
+        height, width = self.image.shape[:2]
+
+        for change in changes:
+            items = self.atoms if change.target == "atom" else self.bonds
 
-        if result:
-            self.atoms = result["atoms"]
-            self.bonds = result["bonds"]
+            if change.action == "add":
+                item = dict(change.data)
+                if change.target == "atom":
+                    item["x"] /= width
+                    item["y"] /= height
+                items.insert(change.index, item)
+                if change.target == "atom":
+                    self._shiftAtomNumbers(change.index + 1)
+
+            elif change.action == "remove":
+                items.pop(change.index)
+                if change.target == "atom":
+                    self._shiftAtomNumbers(change.index)
+
+            elif change.action == "move":
+                items[change.index]["x"] = change.data["x"] / width
+                items[change.index]["y"] = change.data["y"] / height
+
+            elif change.action == "update":
+                items[change.index].update(change.data)
+
+    def _shiftAtomNumbers(self, start: int) -> None:
+        """Renumber atoms after inserted or removed one"""
+        for i in range(start, len(self.atoms)):
+            self.atoms[i]["atom_number"] = i
 
     def saveAnnotation(self) -> None:
         """Saves current annotation to the corresponding file"""
+        annotation = {"atoms": self.atoms, "bonds": self.bonds}
+        if self.model is not None:
+            annotation["model"] = self.model
+
         with open(self.path_annotation, "w", encoding="utf-8") as f:
             json.dump(
-                {"atoms": self.atoms, "bonds": self.bonds},
+                annotation,
                 f,
                 ensure_ascii=False,
                 indent=4,
@@ -65,6 +103,22 @@ class ImageSignals(QObject):
     current_image = Signal(object)
     current_annotation = Signal(object)
     data_changed = Signal(object)
+    prediction_result = Signal(object)
+    prediction_finished = Signal(object)
+    prediction_failed = Signal(str)
+    annotation_saved = Signal(str)
+
+    def setPredictionHandler(self, handler: Callable[[Any], None]) -> None:
+        """Call handler with every prediction result in thread of this object.
+        Results are emitted in collector thread, queued connection to slot
+        of this object moves them to GUI thread
+        """
+        self._prediction_handler = handler
+        self.prediction_result.connect(self.onPredictionResult, Qt.QueuedConnection)
+
+    @Slot(object)
+    def onPredictionResult(self, prediction) -> None:
+        self._prediction_handler(prediction)
 
 
 @dataclass
@@ -73,27 +127,41 @@ class Dataset:
 
     _images: Dict[str, ImageData]
     """ Dictionary of images forming the dataset """
-    _num_images: int = 10
-    """ Total number of images in dataset """
+    image_cache_bytes: int = 1 << 30
+    """ Memory limit of decoded images kept for fast switching """
+    annotation_cache_bytes: int = 64 << 20
+    """ Memory limit of parsed annotations, unsaved ones are kept over it """
     _current_image: str = ""
     """ Index of the current image """
     current_model: str = "MolScribe"
     """ Current model for prediction atoms and bonds """
+    prediction_workers: Optional[int] = None
+    """ Number of prediction processes, chosen by number of cores if None """
 
     def __post_init__(self):
+        images = self._images
+        self._images = LRUCache(self.image_cache_bytes, image_nbytes)
+        self._annotations = LRUCache(self.annotation_cache_bytes, annotation_nbytes)
+        for path, image_data in images.items():
+            self._images.put(path, image_data)
+            self._storeAnnotation(image_data)
+
         self._current_image_signal = ImageSignals()
-        self.model_map = {"MolScribe": self.runMolscribePredict, "another": None}
+        self._current_image_signal.setPredictionHandler(self.applyPrediction)
+        self._prediction_pool = PredictionPool(self.prediction_workers)
+        self._prefetcher = ImagePrefetcher(self.loadImage)
         self._data_manager = DataManager()
-        self._data_manager.dataUpdateToDataset.connect(self.updateCoordinates)
+        self._data_manager.annotationChanged.connect(self.updateCoordinates)
 
     def setCurrentModel(self, model_name: str) -> None:
         """Change current model when user choose other model"""
         self.current_model = model_name
 
-    def openImage(self, path: str) -> npt.NDArray:
-        """Open image with cv2 as numpy array"""
-        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
-        return image
+    def openImage(self, path: str) -> Optional[LazyImage]:
+        """Open image lazily: only reduced preview of big image is decoded,
+        full resolution is decoded when it is needed
+        """
+        return open_image(path)
 
     def checkAnnotation(self, annotation_path: str) -> Optional[Dict]:
         """Check annotation existing"""
@@ -104,34 +172,76 @@ class Dataset:
         else:
             return
 
-    def countAtoms(self) -> None:
-        """Create atom indexes"""
-        for i, atom in enumerate(self._images[self._current_image].atoms):
-            atom["atom_number"] = i
+    def predictionPool(self) -> PredictionPool:
+        """Processes predicting images, they are shared by batch prediction"""
+        return self._prediction_pool
 
-    def runMolscribePredict(self) -> npt.NDArray:
-        """Reset all current data and run MolScribe prediction"""
-        self._images[self._current_image].atoms = []
-        self._images[self._current_image].bonds = []
-        self._images[self._current_image].runMolscribe()
+    def startPredictionPool(self) -> None:
+        """Start prediction processes, they load model in background"""
+        self._prediction_pool.start()
 
-        return self._images[self._current_image]
+    def shutdownPredictionPool(self) -> None:
+        """Stop prediction processes, running predictions are dropped"""
+        self._prediction_pool.shutdown()
 
-    def updateCoordinates(self, coordinates: Dict) -> None:
-        """When user draw new object, DataManager sends actual data.
-        This function replace coordinate by fractions and
-        update current image atoms and bonds
+    def predictCurrentImage(self) -> None:
+        """Send current image to prediction processes.
+        Result is applied by applyPrediction in GUI thread
         """
-        if len(coordinates["atoms"]) != 0:
-            for atom in coordinates["atoms"]:
-                atom["x"] /= self._images[self._current_image].image.shape[1]
-                atom["y"] /= self._images[self._current_image].image.shape[0]
+        if self.current_model != self._prediction_pool.model_name:
+            self._current_image_signal.prediction_failed.emit(
+                f"Model {self.current_model} is not available"
+            )
+            return
 
-            self._images[self._current_image].atoms = coordinates["atoms"]
-            self._images[self._current_image].bonds = coordinates["bonds"]
-        else:
-            self._images[self._current_image].atoms = []
-            self._images[self._current_image].bonds = []
+        image_data = self._images[self._current_image]
+        # Worker decodes image file itself, GUI thread does not decode it
+        future = self._prediction_pool.submit(image_data.path_image)
+
+        # Callback is called in collector thread, signal moves result to GUI thread
+        future.add_done_callback(
+            lambda done: self._current_image_signal.prediction_result.emit(
+                (image_data, done)
+            )
+        )
+
+    def applyPrediction(self, prediction) -> None:
+        """Replace annotation of predicted image,
+        draw it if the image is still opened
+        """
+        image_data, future = prediction
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error is not None:
+            self._current_image_signal.prediction_failed.emit(str(error))
+            return
+
+        result = future.result()
+        image_data.atoms = result["annotation"]["atoms"]
+        image_data.bonds = result["annotation"]["bonds"]
+        image_data.timings = result["timings"]
+        image_data.model = self._prediction_pool.model_name
+        for i, atom in enumerate(image_data.atoms):
+            atom["atom_number"] = i
+        self._storeAnnotation(image_data, dirty=True)
+
+        self._current_image_signal.prediction_finished.emit(image_data.timings)
+
+        path = self._current_image
+        if path in self._images and self._images[path] is image_data:
+            self._current_image_signal.current_annotation.emit(
+                {"atoms": image_data.atoms, "bonds": image_data.bonds}
+            )
+            self.drawAnnotation()
+
+    def updateCoordinates(self, changes: List[AnnotationChange]) -> None:
+        """When user draw new object, DataManager sends changes of data.
+        This function applies them to current image atoms and bonds
+        """
+        self._images[self._current_image].applyChanges(changes)
+        self._storeAnnotation(self._images[self._current_image], dirty=True)
 
         self._current_image_signal.current_annotation.emit(
             {
@@ -155,32 +265,99 @@ class Dataset:
         """Save annotation of actual image if it is not empty"""
         if self._current_image and len(self._images[self._current_image].atoms) != 0:
             self._images[self._current_image].saveAnnotation()
+            self._annotations.setDirty(self._current_image, False)
+            self._current_image_signal.annotation_saved.emit(self._current_image)
+
+    def loadImage(self, path: str) -> ImageData:
+        """Read image and its annotation if it exists"""
+        image = self.openImage(path)
+        path_annotation = annotation_path(path)
+        annotation = self._annotations.get(path)
+        if annotation is None:
+            annotation = self.checkAnnotation(path_annotation)
+            annotation = {
+                "atoms": annotation["atoms"] if annotation else [],
+                "bonds": annotation["bonds"] if annotation else [],
+                "model": annotation.get("model") if annotation else None,
+            }
+            for i, atom in enumerate(annotation["atoms"]):
+                atom["atom_number"] = i
+            self._annotations.put(path, annotation)
+
+        return ImageData(
+            path,
+            path_annotation,
+            image,
+            annotation["atoms"],
+            annotation["bonds"],
+            model=annotation.get("model"),
+        )
+
+    def _storeAnnotation(self, image_data: ImageData, dirty: bool = False) -> None:
+        """Cache annotation of image, dirty one is not evicted until it is saved"""
+        self._annotations.put(
+            image_data.path_image,
+            {
+                "atoms": image_data.atoms,
+                "bonds": image_data.bonds,
+                "model": image_data.model,
+            },
+            dirty or self._annotations.isDirty(image_data.path_image),
+        )
+
+    def _attachAnnotation(self, image_data: ImageData) -> None:
+        """Give image unsaved annotation from cache, it could be read by another
+        thread before changes. Otherwise cache annotation of image
+        """
+        path = image_data.path_image
+        if self._annotations.isDirty(path):
+            image_data.atoms = self._annotations[path]["atoms"]
+            image_data.bonds = self._annotations[path]["bonds"]
+            image_data.model = self._annotations[path].get("model")
+        else:
+            self._storeAnnotation(image_data)
+
+    def unsavedAnnotations(self) -> List[str]:
+        """Paths of images which annotations are changed and not saved"""
+        return self._annotations.dirtyKeys()
+
+    def cacheStats(self) -> Dict[str, Dict[str, Any]]:
+        """Hits, misses, evictions and memory of image and annotation caches"""
+        return {
+            "images": self._images.stats(),
+            "annotations": self._annotations.stats(),
+        }
+
+    def forgetImage(self, path: str) -> None:
+        """Drop cached image which annotation was changed outside,
+        so it is read again when opened. Current image is kept
+        """
+        self._prefetcher.discard(path)
+        if path != self._current_image:
+            self._images.pop(path, None)
+            # Unsaved changes of user are more important than annotation on disk
+            if not self._annotations.isDirty(path):
+                self._annotations.pop(path)
+
+    def prefetch(self, paths: List[str]) -> None:
+        """Read images in background, so they are opened instantly"""
+        self._prefetcher.prefetch(path for path in paths if path not in self._images)
+
+    def shutdownPrefetcher(self) -> None:
+        """Stop background reading of images"""
+        self._prefetcher.shutdown()
 
     def changeCurrentImage(self, path: str) -> None:
-        """Changes current image, fill data, save data for _num_images items.
+        """Changes current image, fill data, keep recently used images in cache.
         Emit signals to update text annotation visualization
         """
         self._current_image = path
-        if path not in self._images:
-            image = self.openImage(path)
-            annotation_path = Path.joinpath(
-                Path(path).parent.resolve(), Path(path).stem + ".json"
-            )
-            annotation = self.checkAnnotation(annotation_path)
-            if annotation:
-                self._images[path] = ImageData(
-                    path,
-                    annotation_path,
-                    image,
-                    annotation["atoms"],
-                    annotation["bonds"],
-                )
-                self.countAtoms()
-            else:
-                self._images[path] = ImageData(path, annotation_path, image)
-            if len(self._images) > self._num_images:
-                oldest_key = list(self._images.keys())[0]
-                self._images.pop(oldest_key)
+        if self._images.get(path) is None:
+            image_data = self._prefetcher.take(path)
+            if image_data is None:
+                image_data = self.loadImage(path)
+            self._attachAnnotation(image_data)
+            self._images.put(path, image_data)
 
         self._current_image_signal.current_image.emit(self._images[path].image)
         self._current_image_signal.current_annotation.emit(
@@ -190,34 +367,51 @@ class Dataset:
         if len(self._images[path].atoms) != 0:
             self.drawAnnotation()
 
+        # Neighbours in directory are likely to be opened next
+        self.prefetch(self._prefetcher.neighbours(path))
+
 
-class Worker(QObject):
-    """Class for parallel thread"""
+class BatchWorker(QObject):
+    """Class for batch prediction of directory in parallel thread"""
 
-    finished = Signal()
-    result = Signal(object)
+    progress = Signal(int, int)
+    annotated = Signal(str)
+    error = Signal(str)
+    finished = Signal(object)
 
-    def __init__(self, data: Dataset):
+    def __init__(self, directory: str, pool: PredictionPool, batch_size: int = 8):
         super().__init__()
-        self.data = data
+        self.runner = BatchRunner(
+            directory,
+            pool,
+            batch_size,
+            on_progress=self.progress.emit,
+            on_annotated=self.annotated.emit,
+        )
 
     def run(self):
-        """Run actual model prediction"""
-        result = self.data.model_map[self.data.current_model]()
-        self.data.countAtoms()
-        self.result.emit({"atoms": result.atoms, "bonds": result.bonds})
-        self.finished.emit()
-
-        self.data.drawAnnotation()
-
-
-# HINT: next two functions possibly require additional code decomposition
-
-
-def dataset_from_directory(path_dir) -> Dataset:
-    """Creates Dataset from directory"""
-    # filter image files via os.listdir
-
-    # cycle over files
-    pass
-    # return
+        """Predict all not annotated images of directory"""
+        try:
+            self.runner.run()
+        except Exception as e:
+            self.error.emit(str(e))
+        self.finished.emit(self.runner.state)
+
+    def cancel(self):
+        """Stop prediction after running batches"""
+        self.runner.cancel()
+
+
+def dataset_from_directory(path_dir: str) -> Dataset:
+    """Creates Dataset from directory, all images are read at once
+    and kept while they fit into image cache
+    """
+    paths = [str(path) for path in find_images(path_dir)]
+    dataset = Dataset({})
+    for path in paths:
+        image_data = dataset.loadImage(path)
+        if image_data.image is not None:
+            dataset._attachAnnotation(image_data)
+            dataset._images.put(path, image_data)
+
+    return dataset
@@ -1,13 +1,130 @@
 import math
 
-from typing import Tuple, Dict, Optional, List
-
-from PySide6.QtGui import QColor, QPainter, QPen, QFont, QPainterPath
-from PySide6.QtCore import QPoint, QLine, Qt
-
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple, Dict, Optional, List, Union
+
+import numpy as np
+import numpy.typing as npt
+from PySide6.QtGui import (
+    QColor,
+    QPainter,
+    QPen,
+    QFont,
+    QFontMetrics,
+    QPainterPath,
+    QPolygonF,
+)
+from PySide6.QtCore import QPoint, QPointF, QLine, QLineF, QRect, Qt
 
 ORGANIC_COLOR = QColor(0, 150, 0)
 LINE_COLOR = QColor("#3366ff")
+LABEL_CACHE_SIZE = 512
+
+
+@dataclass(frozen=True)
+class AtomLabel:
+    """Prebuilt text of atom symbol, placed at the origin"""
+
+    path: QPainterPath
+    """ Outline of text with baseline at y = 0 """
+    width: int
+    """ Width of text bounding rectangle """
+    height: int
+    """ Height of text bounding rectangle """
+    ascent: int
+    """ Font ascent """
+    min_width: int
+    """ Width of "M" used as minimal width of the rectangle around text """
+    line_height: int
+    """ Font height """
+
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def atom_label(name: str, size: int) -> AtomLabel:
+    """Build text path and metrics of atom symbol, results are cached by (name, size)"""
+    font = QFont("Verdana", size)
+    font.setBold(True)
+    font_metrics = QFontMetrics(font)
+    bounding_rect = font_metrics.boundingRect(name)
+
+    path = QPainterPath()
+    path.addText(0, 0, font, name)
+
+    return AtomLabel(
+        path=path,
+        width=bounding_rect.width(),
+        height=bounding_rect.height(),
+        ascent=font_metrics.ascent(),
+        min_width=font_metrics.horizontalAdvance("M"),
+        line_height=font_metrics.height(),
+    )
+
+
+def atom_label_cache_stats() -> Dict[str, float]:
+    """Return hits, misses, current size and hit rate of atom label cache"""
+    info = atom_label.cache_info()
+    calls = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "hit_rate": info.hits / calls if calls else 0.0,
+    }
+
+
+def wedge_polygon(
+    x1: float, y1: float, x2: float, y2: float, min_width: float, max_width: float
+) -> npt.NDArray:
+    """Corners (4, 2) of trapezoid which is min_width wide at start
+    and max_width wide at end
+    """
+    start = np.array([x1, y1], dtype=np.float64)
+    end = np.array([x2, y2], dtype=np.float64)
+    normal = _unit_normal(end - start)
+
+    return np.stack(
+        [
+            start + normal * min_width / 2,
+            end + normal * max_width / 2,
+            end - normal * max_width / 2,
+            start - normal * min_width / 2,
+        ]
+    )
+
+
+def dashed_wedge_lines(
+    x1: float,
+    y1: float,
+    x2: float,
+    y2: float,
+    min_length: float,
+    max_length: float,
+    num_lines: int,
+) -> npt.NDArray:
+    """Perpendicular strokes (num_lines, 4) placed evenly along the line,
+    stroke length grows from min_length at start to max_length at end
+    """
+    start = np.array([x1, y1], dtype=np.float64)
+    end = np.array([x2, y2], dtype=np.float64)
+    fraction = np.linspace(0.0, 1.0, num_lines)[:, None]
+
+    centers = start + fraction * (end - start)
+    half = (
+        _unit_normal(end - start)
+        * (min_length + fraction * (max_length - min_length))
+        / 2
+    )
+
+    return np.hstack([centers - half, centers + half])
+
+
+def _unit_normal(direction: npt.NDArray) -> npt.NDArray:
+    """Direction rotated by 90 degrees and normalized, (0, 1) for zero vector"""
+    length = np.hypot(*direction)
+    if length == 0:
+        return np.array([0.0, 1.0])
+    return np.array([-direction[1], direction[0]]) / length
 
 
 class Atom:
@@ -39,40 +156,56 @@ class Atom:
         else:
             return QColor(100, 30, 200)
 
+    def boundingRect(self, size: int, flag: bool = False) -> QRect:
+        """Area covered by drawn text with its outline and temporal rectangle"""
+        label = atom_label(self.name, size)
+        text_position = QPoint(
+            self.position.x() - label.width // 2 - 3,
+            self.position.y() - label.height // 2 + label.ascent,
+        )
+        rect = label.path.boundingRect().toAlignedRect().translated(text_position)
+
+        if flag:
+            rect_width = max(label.width + 2, label.min_width + 4) + 4
+            rect_height = max(label.height + 4, label.line_height + 4)
+            rect = rect.united(
+                QRect(
+                    self.position.x() - rect_width // 2 - 2,
+                    self.position.y() - rect_height // 2 + 2,
+                    rect_width,
+                    rect_height,
+                )
+            )
+
+        # Outline pen is 5 pixels width
+        return rect.adjusted(-4, -4, 4, 4)
+
     def draw(self, painter: QPainter, size: int, flag: bool = False) -> None:
         """Draw text"""
-        font = QFont("Verdana", size)
-        font.setBold(True)
-        painter.setFont(font)
-
-        font_metrics = painter.fontMetrics()
-        text_width = font_metrics.boundingRect(self.name).width()
-        text_height = font_metrics.boundingRect(self.name).height()
+        label = atom_label(self.name, size)
 
         text_position = QPoint(
-            self.position.x() - text_width // 2 - 3,
-            self.position.y() - text_height // 2 + font_metrics.ascent(),
+            self.position.x() - label.width // 2 - 3,
+            self.position.y() - label.height // 2 + label.ascent,
         )
 
         pen = QPen(QColor("white"), 5, Qt.SolidLine)
         pen.setCapStyle(Qt.RoundCap)
         pen.setJoinStyle(Qt.RoundJoin)
 
-        path = QPainterPath()
-        path.addText(text_position, font, self.name)
+        path = label.path.translated(text_position)
 
         painter.setPen(pen)
 
-        # painter.drawText(text_position, self.name)
         painter.drawPath(path)
         painter.fillPath(path, self.color())
 
         if flag:
             # Draw rectangle where temporal text will be written
             rect_width = max(
-                text_width + 2, font_metrics.horizontalAdvance("M") + 4
+                label.width + 2, label.min_width + 4
             )  # Adding some padding
-            rect_height = max(text_height + 4, font_metrics.height() + 4)
+            rect_height = max(label.height + 4, label.line_height + 4)
 
             rect_x = self.position.x() - rect_width // 2
             rect_y = self.position.y() - rect_height // 2
@@ -100,6 +233,10 @@ class TypedLine:
         self.type = type_line
         self.atom_indexes = atom_indexes
 
+        # Wedge geometry is recomputed only when line or sizes are changed
+        self._geometry_key = None
+        self._geometry = None
+
     def setAtomIndexes(self, atom_indexes: List[int]) -> None:
         """Connect atoms with line ends"""
         self.atom_indexes = atom_indexes
@@ -126,6 +263,46 @@ class TypedLine:
         else:
             return None, None
 
+    def boundingRect(self, constants: Dict) -> QRect:
+        """Area covered by drawn line including parallel lines and wedges"""
+        margin = int(
+            constants["bond_distance"]
+            + max(constants["line_width"] * 1.5, constants["max_width"])
+            + 2
+        )
+        return (
+            QRect(self.line.p1(), self.line.p2())
+            .normalized()
+            .adjusted(-margin, -margin, margin, margin)
+        )
+
+    def wedgeGeometry(self, constants: Dict) -> Union[QPolygonF, List[QLineF]]:
+        """Polygon of solid wedge or strokes of dashed wedge, cached for the line"""
+        key = (
+            self.type,
+            self.line.x1(),
+            self.line.y1(),
+            self.line.x2(),
+            self.line.y2(),
+            constants["max_width"],
+            constants["segment_number"],
+        )
+        if key == self._geometry_key:
+            return self._geometry
+
+        ends = (self.line.x1(), self.line.y1(), self.line.x2(), self.line.y2())
+        if self.type == "solid wedge":
+            corners = wedge_polygon(*ends, 1, constants["max_width"])
+            self._geometry = QPolygonF([QPointF(x, y) for x, y in corners.tolist()])
+        else:
+            strokes = dashed_wedge_lines(
+                *ends, 1, constants["max_width"], constants["segment_number"]
+            )
+            self._geometry = [QLineF(*stroke) for stroke in strokes.tolist()]
+        self._geometry_key = key
+
+        return self._geometry
+
     def draw(self, painter: QPainter, constants: Dict) -> None:
         """Drawing line according to its type"""
 
@@ -205,71 +382,15 @@ class TypedLine:
             painter.drawLine(self.line)
 
         elif self.type == "solid wedge":
-            start_point = self.line.p1()
-            end_point = self.line.p2()
-
-            # Calculate the number of segments
-            num_segments = 30
-            dx = end_point.x() - start_point.x()
-            dy = end_point.y() - start_point.y()
-
-            max_pen_width = constants["max_width"]
-            min_pen_width = 1
-
-            for i in range(num_segments):
-                # Calculate start and end points of this segment
-                fraction_start = i / num_segments
-                fraction_end = (i + 1) / num_segments
-                segment_start = QPoint(
-                    start_point.x() + fraction_start * dx,
-                    start_point.y() + fraction_start * dy,
-                )
-                segment_end = QPoint(
-                    start_point.x() + fraction_end * dx,
-                    start_point.y() + fraction_end * dy,
-                )
-
-                pen_width = min_pen_width + (max_pen_width - min_pen_width) * (
-                    i / num_segments
-                )
-                pen = QPen(LINE_COLOR, pen_width, Qt.SolidLine)
-                pen.setCapStyle(Qt.RoundCap)
-                painter.setPen(pen)
-
-                # Draw the segment
-                painter.drawLine(segment_start, segment_end)
+            pen = QPen(LINE_COLOR, 1, Qt.SolidLine)
+            pen.setJoinStyle(Qt.RoundJoin)
+            painter.setPen(pen)
+            painter.setBrush(LINE_COLOR)
+            painter.drawPolygon(self.wedgeGeometry(constants))
+            painter.setBrush(Qt.NoBrush)
 
         elif self.type == "dashed wedge":
             pen = QPen(LINE_COLOR, int(constants["line_width"] * 0.8), Qt.SolidLine)
             pen.setCapStyle(Qt.RoundCap)
             painter.setPen(pen)
-
-            start_point = self.line.p1()
-            end_point = self.line.p2()
-
-            min_length = 1
-            max_length = constants["max_width"]
-            num_lines = constants["segment_number"]
-
-            # Calculate the direction of the main line
-            dx = end_point.x() - start_point.x()
-            dy = end_point.y() - start_point.y()
-
-            for i in range(num_lines):
-                fraction = i / (num_lines - 1)
-
-                # Position along the main line
-                x = start_point.x() + fraction * dx
-                y = start_point.y() + fraction * dy
-
-                # Length of the perpendicular line at this point
-                perp_length = min_length + fraction * (max_length - min_length)
-
-                # Calculate start and end points of the perpendicular line
-                angle = math.atan2(dy, dx) + math.pi / 2  # Rotate by 90 degrees
-                dx_perp = math.cos(angle) * perp_length / 2
-                dy_perp = math.sin(angle) * perp_length / 2
-                perp_start = QPoint(x - dx_perp, y - dy_perp)
-                perp_end = QPoint(x + dx_perp, y + dy_perp)
-
-                painter.drawLine(perp_start, perp_end)
+            painter.drawLines(self.wedgeGeometry(constants))
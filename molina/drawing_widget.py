@@ -1,11 +1,13 @@
+import time
+from collections import deque
 from typing import Dict, Optional, Union, List
 
 from PySide6.QtWidgets import QWidget
-from PySide6.QtCore import Qt, QSize, QRect, QPoint, QLine, Signal
+from PySide6.QtCore import Qt, QSize, QPoint, QLine, QRect, Signal
 from PySide6.QtGui import (
     QPainter,
-    QPen,
     QPaintEvent,
+    QPixmap,
 )
 
 from molina.data_manager import DataManager
@@ -19,6 +21,13 @@ class DrawingWidget(QWidget):
     Bond is a line between two atoms, which can be different type.
     Here user can add and delete points and lines or clean whole area.
     Also existing annotation or model prediction is drawn here.
+    Annotation is drawn once into cached layer, which is redrawn only after
+    edits or zooming. Every frame draws only the layer, temporal line,
+    temporal text and moved atom with its bonds.
+    Edits repaint only the area of changed objects: the area is redrawn in
+    the layer and the widget is updated only inside it.
+    Layer covers only the visible part of widget with a margin for scrolling,
+    so zooming into big image does not make a pixmap of the whole image.
     """
 
     def __init__(self, parent=None):
@@ -32,6 +41,13 @@ class DrawingWidget(QWidget):
         self._bond_type = None
         self._temp_atom = None
         self._selected_atom_idx = None
+        self._selected_lines = []
+
+        self._layer = QPixmap()
+        self._layer_rect = QRect()
+        self._layer_is_valid = False
+        self._dirty_rect = QRect()
+        self._frame_times = deque(maxlen=100)
 
         self._zoom_factor = 1.0
 
@@ -57,34 +73,186 @@ class DrawingWidget(QWidget):
         self._data_manager.atomPositionUpdate.connect(self.updateAtomPosition)
 
     def paintEvent(self, event: QPaintEvent) -> None:
-        """Function to draw points and lines"""
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
+        """Draw cached layer, then objects changing now:
+        moved atom with its bonds, temporal text and temporal line
+        """
+        if self._text_size is None:
+            return
 
-        pen = QPen(Qt.red, 5)
-        painter.setPen(pen)
+        start_time = time.perf_counter()
 
         text_size = int(self.getScaledConstants(self._text_size))
         bond_constants = self.getScaledBondConstants(self._bond_constant)
 
-        for line in self._lines:
-            line.update(
-                self._points[line.atom_indexes[0]].position,
-                self._points[line.atom_indexes[1]].position,
-            )
-            line.draw(painter, bond_constants)
+        exposed = event.rect()
+        visible = self.visibleRegion().boundingRect().united(exposed)
+
+        if not self._layer_is_valid or not self._layer_rect.contains(visible):
+            self._layer_rect = self.layerRect(visible)
+            self.renderLayer(text_size, bond_constants)
+        elif not self._dirty_rect.isEmpty():
+            self.renderLayer(text_size, bond_constants, self._dirty_rect)
+
+        painter = QPainter(self)
+        painter.setClipRect(exposed)
+        painter.drawPixmap(self._layer_rect.topLeft(), self._layer)
+        painter.setRenderHint(QPainter.Antialiasing)
 
-        for point in self._points:
-            point.draw(painter, text_size)
+        # Draw moved atom
+        if self._selected_atom_idx is not None:
+            for line in self._selected_lines:
+                self.updateLinePosition(line)
+                if line.boundingRect(bond_constants).intersects(exposed):
+                    line.draw(painter, bond_constants)
+            point = self._points[self._selected_atom_idx]
+            if point.boundingRect(text_size).intersects(exposed):
+                point.draw(painter, text_size)
 
         # Draw current text being written
-        if self._temp_atom:
+        if self._temp_atom and self._temp_atom.boundingRect(
+            text_size, self._is_writing
+        ).intersects(exposed):
             self._temp_atom.draw(painter, text_size, self._is_writing)
 
         # Draw current line while button mouse is pushed
-        if self._temp_line:
+        if self._temp_line and self._temp_line.boundingRect(bond_constants).intersects(
+            exposed
+        ):
             self._temp_line.draw(painter, bond_constants)
 
+        painter.end()
+        self._frame_times.append(time.perf_counter() - start_time)
+
+    def layerRect(self, visible: QRect) -> QRect:
+        """Area of cached layer: visible area with half of its size around,
+        so small scrolling does not redraw the layer
+        """
+        margin_x = visible.width() // 2
+        margin_y = visible.height() // 2
+        return visible.adjusted(-margin_x, -margin_y, margin_x, margin_y).intersected(
+            self.rect()
+        )
+
+    def renderLayer(
+        self, text_size: int, bond_constants: Dict, rect: Optional[QRect] = None
+    ) -> None:
+        """Draw all points and lines inside layer area except moved ones
+        into cached layer. If rect is given, only this area of the layer is redrawn
+        """
+        if self._layer_rect.isEmpty():
+            # Widget is not visible, layer is drawn when it is shown
+            self._layer = QPixmap()
+            self._dirty_rect = QRect()
+            return
+
+        ratio = self.devicePixelRatioF()
+        if self._layer.size() != self._layer_rect.size() * ratio:
+            self._layer = QPixmap(self._layer_rect.size() * ratio)
+            self._layer.setDevicePixelRatio(ratio)
+            rect = None
+
+        if rect is None:
+            self._layer.fill(Qt.transparent)
+            area = self._layer_rect
+        else:
+            area = rect.intersected(self._layer_rect)
+
+        painter = QPainter(self._layer)
+        painter.translate(-self._layer_rect.topLeft())
+        if rect is not None:
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.fillRect(area, Qt.transparent)
+            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            painter.setClipRect(area)
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        for line in self._lines:
+            if self._selected_atom_idx in line.atom_indexes:
+                continue
+            self.updateLinePosition(line)
+            if line.boundingRect(bond_constants).intersects(area):
+                line.draw(painter, bond_constants)
+
+        for i, point in enumerate(self._points):
+            if i == self._selected_atom_idx:
+                continue
+            if point.boundingRect(text_size).intersects(area):
+                point.draw(painter, text_size)
+
+        painter.end()
+        self._layer_is_valid = True
+        self._dirty_rect = QRect()
+
+    def invalidateLayer(self) -> None:
+        """Mark cached layer as out of date and schedule repaint"""
+        self._layer_is_valid = False
+        self.update()
+
+    def invalidateRect(self, rect: QRect) -> None:
+        """Mark area of the layer as out of date and schedule its repaint"""
+        if rect.isEmpty():
+            return
+        self._dirty_rect = self._dirty_rect.united(rect)
+        self.update(rect)
+
+    def repaintRect(self, rect: QRect) -> None:
+        """Schedule repaint of area with objects drawn out of layer"""
+        if not rect.isEmpty():
+            self.update(rect)
+
+    def atomRect(self, atom: Optional[Atom], flag: bool = False) -> QRect:
+        """Scaled area of drawn atom"""
+        if atom is None or self._text_size is None:
+            return QRect()
+        return atom.boundingRect(int(self.getScaledConstants(self._text_size)), flag)
+
+    def lineRect(self, line: Optional[TypedLine]) -> QRect:
+        """Scaled area of drawn line"""
+        if line is None or self._bond_constant is None:
+            return QRect()
+        return line.boundingRect(self.getScaledBondConstants(self._bond_constant))
+
+    def atomAreaRect(self, idx: int) -> QRect:
+        """Area of atom together with its lines"""
+        rect = self.atomRect(self._points[idx])
+        for line in self._lines:
+            if idx in line.atom_indexes:
+                self.updateLinePosition(line)
+                rect = rect.united(self.lineRect(line))
+        return rect
+
+    def getFrameTimes(self) -> Dict[str, float]:
+        """Paint time of the last frame and mean paint time of recent frames in ms"""
+        if not self._frame_times:
+            return {"last": 0.0, "mean": 0.0, "frames": 0}
+
+        return {
+            "last": self._frame_times[-1] * 1000,
+            "mean": sum(self._frame_times) / len(self._frame_times) * 1000,
+            "frames": len(self._frame_times),
+        }
+
+    def updateLinePosition(self, line: TypedLine) -> None:
+        """Move line ends to positions of its atoms"""
+        line.update(
+            self._points[line.atom_indexes[0]].position,
+            self._points[line.atom_indexes[1]].position,
+        )
+
+    def selectAtom(self, idx: Optional[int]) -> None:
+        """Choose atom to move, it and its lines are drawn out of cached layer"""
+        if self._selected_atom_idx is not None:
+            self.invalidateRect(self.atomAreaRect(self._selected_atom_idx))
+
+        self._selected_atom_idx = idx
+        if idx is None:
+            self._selected_lines = []
+        else:
+            self._selected_lines = [
+                line for line in self._lines if idx in line.atom_indexes
+            ]
+            self.invalidateRect(self.atomAreaRect(idx))
+
     def addPoint(self, atom: Atom) -> None:
         """Add atom to DataManager data"""
         not_scaled_atom = Atom(
@@ -98,7 +266,7 @@ class DrawingWidget(QWidget):
         self._points.append(atom)
 
         self._data_manager.addAtom(not_scaled_atom, len(self._points) - 1)
-        self.update()
+        self.invalidateRect(self.atomRect(atom))
 
     def getScaledConstants(self, threshold: float) -> float:
         """Scaled thresholds or sizes, or return maximum or minimum value"""
@@ -117,29 +285,31 @@ class DrawingWidget(QWidget):
 
     def findAtoms(self, line: QLine) -> Dict:
         """Save temporal line only if there are near two points"""
-        threshold = self.getScaledConstants(self._closest_atom_threshold)
-
-        # Keep order founded atoms
-        close_point = {"start": [], "end": []}
-
-        for i, atom in enumerate(self._points):
-            point = atom.position
-            distance_to_start = (line.p1() - point).manhattanLength()
-            distance_to_end = (line.p2() - point).manhattanLength()
+        radius = (
+            self.getScaledConstants(self._closest_atom_threshold) / self._zoom_factor
+        )
 
-            if distance_to_start <= threshold:
-                close_point["start"].append({"pos": point, "idx": i})
-            elif distance_to_end <= threshold:
-                close_point["end"].append({"pos": point, "idx": i})
+        start_idx = self._data_manager.findClosestAtom(
+            line.x1() / self._zoom_factor, line.y1() / self._zoom_factor, radius
+        )
+        end_idx = self._data_manager.findClosestAtom(
+            line.x2() / self._zoom_factor, line.y2() / self._zoom_factor, radius
+        )
 
-        # Check how many atoms are founded, if two - ok
-        if (len(close_point["start"]) + len(close_point["end"])) == 2:
-            return close_point
-        else:
+        # Check that two different atoms are founded
+        if start_idx is None or end_idx is None or start_idx == end_idx:
             return
 
+        return {
+            "start": [{"pos": self._points[start_idx].position, "idx": start_idx}],
+            "end": [{"pos": self._points[end_idx].position, "idx": end_idx}],
+        }
+
     def addLine(self, line: TypedLine) -> None:
         """Add bond to DataManager data"""
+        # Temporal line could be drawn here
+        self.repaintRect(self.lineRect(line))
+
         atoms = self.findAtoms(line.line)
         if atoms:
             atom1, atom2 = atoms["start"][0]["pos"], atoms["end"][0]["pos"]
@@ -161,96 +331,44 @@ class DrawingWidget(QWidget):
                 atoms["end"][0]["idx"],
                 len(self._lines) - 1,
             )
-
-        self.update()
+            self.invalidateRect(self.lineRect(line))
 
     def deleteLine(self, idx: int) -> None:
         """Delete chosen line"""
-        self._lines.pop(idx)
+        self.invalidateRect(self.lineRect(self._lines.pop(idx)))
         self._data_manager.deleteBond(idx, len(self._lines))
 
-        self.update()
-
     def deletePoint(self, idx: int) -> None:
-        """Delete chosen atom"""
-        self._points.pop(idx)
+        """Delete chosen atom, its lines are deleted by DataManager"""
+        self.invalidateRect(self.atomRect(self._points.pop(idx)))
         self._data_manager.deleteAtom(idx, len(self._points))
 
-        self.update()
-
-    def lineCenter(self, line: QLine) -> QPoint:
-        """Calculate center of chosen line"""
-        x_center = (line.x1() + line.x2()) / 2
-        y_center = (line.y1() + line.y2()) / 2
-        return QPoint(x_center, y_center)
-
-    def partLine(self, end_line: QPoint, center: QPoint, part: float = 0.66) -> QPoint:
-        """Calculate 2/3 of chosen line"""
-        x = center.x() + part * (end_line.x() - center.x())
-        y = center.y() + part * (end_line.y() - center.y())
-        return QPoint(x, y)
-
-    def createToleranceRectangle(
-        self, start: QPoint, end: QPoint, tolerance: int
-    ) -> QRect:
-        """Calculate tolerance rectangle around line"""
-        tolerance = tolerance["bond_distance"]
-        if start.x() == end.x():  # Vertical line
-            return QRect(
-                start.x() - tolerance // 2,
-                min(start.y(), end.y()),
-                tolerance,
-                abs(start.y() - end.y()),
-            )
-        elif start.y() == end.y():  # Horizontal line
-            return QRect(
-                min(start.x(), end.x()),
-                start.y() - tolerance // 2,
-                abs(start.x() - end.x()),
-                tolerance,
-            )
-        else:
-            # For non-axis-aligned lines, additional logic is needed
-            # Depending on your requirements, this can be more complex
-            return None
-
-    def isPointOnLineSegment(self, start: QPoint, end: QPoint, point: QPoint) -> bool:
-        """Check if click is on tolerance rectangle of chosen line"""
-        tolerance_rect = self.createToleranceRectangle(
-            start, end, self.getScaledBondConstants(self._bond_constant)
-        )
-        if tolerance_rect:
-            return tolerance_rect.contains(point)
-
-        line_length = (start - end).manhattanLength()
-        d1 = (point - start).manhattanLength()
-        d2 = (point - end).manhattanLength()
-
-        return abs(d1 + d2 - line_length) < 1e-5
-
     def findClosestObject(
         self, position: QPoint, flag: bool = "deletion"
     ) -> Union[None, int]:
         """According to scaled threshold choose the closest object and delete it"""
-        threshold = self.getScaledConstants(self._closest_atom_threshold)
+        x = position.x() / self._zoom_factor
+        y = position.y() / self._zoom_factor
 
-        for i in range(len(self._points)):
-            distance = (position - self._points[i].position).manhattanLength()
-            if distance <= threshold:
-                if flag == "deletion":
-                    self.deletePoint(i)
-                    return
-                elif flag == "search":
-                    return i
+        radius = (
+            self.getScaledConstants(self._closest_atom_threshold) / self._zoom_factor
+        )
+        atom_idx = self._data_manager.findClosestAtom(x, y, radius)
+        if atom_idx is not None:
+            if flag == "deletion":
+                self.deletePoint(atom_idx)
+                return
+            elif flag == "search":
+                return atom_idx
 
         if flag == "deletion":
-            for i in range(len(self._lines)):
-                center = self.lineCenter(self._lines[i].line)
-                part_P1 = self.partLine(self._lines[i].line.p1(), center)
-                part_P2 = self.partLine(self._lines[i].line.p2(), center)
-                if self.isPointOnLineSegment(part_P1, part_P2, position):
-                    self.deleteLine(i)
-                    return
+            # Click on any of parallel lines of double or triple bond is also counted
+            tolerance = self.getScaledBondConstants(self._bond_constant)
+            line_idx = self._data_manager.findClosestBond(
+                x, y, tolerance["bond_distance"] / self._zoom_factor
+            )
+            if line_idx is not None:
+                self.deleteLine(line_idx)
 
     def setDrawingMode(self, enabled: bool, type: str, info: str) -> None:
         """Set flag for drawing line or point mode"""
@@ -291,24 +409,23 @@ class DrawingWidget(QWidget):
                         for line in not_scaled_data["lines"]
                     ]
 
-            self.update()
+            self.invalidateLayer()
 
     def updatePoint(
         self, update_type: str, idx: Optional[int] = None, point: Optional[Atom] = None
     ) -> None:
         """Delete or add atom"""
         if update_type == "delete" and idx is None:
-            self._points.pop()
+            self.invalidateRect(self.atomRect(self._points.pop()))
         elif update_type == "delete" and idx is not None:
-            self._points.pop(idx)
+            self.invalidateRect(self.atomRect(self._points.pop(idx)))
         elif update_type == "add":
             scaled_point = QPoint(
                 point.position.x() * self._zoom_factor,
                 point.position.y() * self._zoom_factor,
             )
             self._points.insert(idx, Atom(scaled_point, point.name))
-
-        self.update()
+            self.invalidateRect(self.atomRect(self._points[idx]))
 
     def updateLine(
         self,
@@ -318,11 +435,9 @@ class DrawingWidget(QWidget):
     ) -> None:
         """Delete or add bond"""
         if update_type == "delete" and idx is None:
-            self._lines.pop()
-            self.update()
+            self.invalidateRect(self.lineRect(self._lines.pop()))
         elif update_type == "delete" and idx is not None:
-            self._lines.pop(idx)
-            self.update()
+            self.invalidateRect(self.lineRect(self._lines.pop(idx)))
         elif update_type == "add":
             new_line = QLine(
                 line.line.x1() * self._zoom_factor,
@@ -332,9 +447,12 @@ class DrawingWidget(QWidget):
             )
 
             self._lines.insert(idx, TypedLine(new_line, line.type, line.atom_indexes))
+            self.invalidateRect(self.lineRect(self._lines[idx]))
 
     def updateLineIndex(self, endpoints: List[List[int]]) -> None:
-        """Change atom indexes in lines to actual"""
+        """Change atom indexes in lines to actual.
+        Positions of lines stay the same, so nothing is repainted
+        """
         assert len(endpoints) == len(self._lines)
 
         for i in range(len(self._lines)):
@@ -343,16 +461,15 @@ class DrawingWidget(QWidget):
 
             line.atom_indexes = endpoints[i]
 
-        self.update()
-
     def updateAtomPosition(self, index: int, position: QPoint) -> None:
         """Set new position to atom"""
         scaled_position = QPoint(
             position.x() * self._zoom_factor,
             position.y() * self._zoom_factor,
         )
+        old_rect = self.atomAreaRect(index)
         self._points[index].position = scaled_position
-        self.update()
+        self.invalidateRect(old_rect.united(self.atomAreaRect(index)))
 
     def setHotkeysMap(self, new_map: Dict) -> None:
         """set new hotkeys map"""
@@ -373,10 +490,13 @@ class DrawingWidget(QWidget):
         self._closest_atom_threshold = smallest_dim * 0.03
         self._text_size = 45
 
+        # Grid cells about bond length give a few objects per cell
+        self._data_manager.setCellSize(self._closest_atom_threshold * 2)
+
     def setZoomFactor(self, factor: float) -> None:
         """Set new zoom factor after scale factor changing"""
         self._zoom_factor = factor
-        self.update()
+        self.invalidateLayer()
 
     def cleanDrawingWidget(self) -> None:
         """Reset all variables after image changing"""
@@ -385,6 +505,7 @@ class DrawingWidget(QWidget):
         self._temp_text = ""
         self._temp_line = None
         self._selected_atom_idx = None
+        self._selected_lines = []
         self._zoom_factor = 1.0
         self._text_size = None
         self._bond_constant = None
@@ -394,6 +515,7 @@ class DrawingWidget(QWidget):
         self._drawing_point_enabled = False
 
         self._data_manager.cleanAll()
+        self.invalidateLayer()
 
     def clearAll(self) -> None:
         """Reset drawing data"""
@@ -402,8 +524,9 @@ class DrawingWidget(QWidget):
             self._points = []
             self._temp_line = None
             self._selected_atom_idx = None
+            self._selected_lines = []
             self._data_manager.allDeleted()
-            self.update()
+            self.invalidateLayer()
 
     def mousePressEvent(self, event: QPaintEvent) -> None:
         """Set point mode or line mode if left button is clicked.
@@ -419,14 +542,15 @@ class DrawingWidget(QWidget):
                 )
 
             elif self._is_writing:
+                self.repaintRect(self.atomRect(self._temp_atom, True))
                 self._temp_atom = Atom(event.pos(), "")
                 self._temp_text = ""
-                self.update()
+                self.repaintRect(self.atomRect(self._temp_atom, True))
 
             else:
                 atom_idx = self.findClosestObject(event.pos(), "search")
                 if atom_idx is not None:
-                    self._selected_atom_idx = atom_idx
+                    self.selectAtom(atom_idx)
 
         elif event.button() == Qt.RightButton:
             self.findClosestObject(event.pos(), "deletion")
@@ -436,12 +560,16 @@ class DrawingWidget(QWidget):
         if self._drawing_line_enabled:
             if self._temp_line:
                 # Move one end of temporal line
+                old_rect = self.lineRect(self._temp_line)
                 self._temp_line.line.setP2(event.pos())
+                self.repaintRect(old_rect.united(self.lineRect(self._temp_line)))
         elif self._selected_atom_idx is not None:
             # Move the selected atom
+            old_rect = self.atomAreaRect(self._selected_atom_idx)
             self._points[self._selected_atom_idx].position = event.pos()
-
-        self.update()
+            self.repaintRect(
+                old_rect.united(self.atomAreaRect(self._selected_atom_idx))
+            )
 
     def mouseReleaseEvent(self, event) -> None:
         """Add line if two atoms are nearby"""
@@ -457,7 +585,7 @@ class DrawingWidget(QWidget):
             self._data_manager.updateAtomPosition(
                 self._selected_atom_idx, not_scaled_position
             )
-            self._selected_atom_idx = None
+            self.selectAtom(None)
 
     def keyPressEvent(self, event: QPaintEvent) -> None:
         """Run action according to the key pressed"""
@@ -477,6 +605,7 @@ class DrawingWidget(QWidget):
                 self.update()
 
         elif self._is_writing:
+            old_rect = self.atomRect(self._temp_atom, True)
             if event.key() == Qt.Key_Return:
                 if self._temp_atom is not None and self._temp_text != "":
                     self._temp_atom.name = self._temp_text
@@ -493,7 +622,7 @@ class DrawingWidget(QWidget):
                 self._temp_text += event.text()
                 self._temp_atom.name = self._temp_text
 
-            self.update()
+            self.repaintRect(old_rect.united(self.atomRect(self._temp_atom, True)))
 
         elif event.modifiers() & Qt.ControlModifier:
             if event.key() == Qt.Key_Z:
@@ -0,0 +1,118 @@
+"""Export of all annotations of directory into one SDF or SMILES CSV file.
+Module does not import Qt widgets, so it works on servers without display
+"""
+
+import csv
+import json
+import multiprocessing
+import time
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from molina.batch import chunks
+
+
+FORMATS = ("sdf", "csv")
+# Paths sent to processes at once, output order is kept inside one window
+WINDOW_SIZE = 10000
+CHUNK_SIZE = 64
+
+
+def find_annotations(path_dir: Path) -> List[Path]:
+    """Sorted annotation files under directory, hidden files like
+    batch state are skipped
+    """
+    return sorted(
+        path
+        for path in Path(path_dir).rglob("*.json")
+        if path.is_file() and not path.name.startswith(".")
+    )
+
+
+def export_annotation(path: str, fmt: str = "sdf") -> Tuple[str, Optional[str], str]:
+    """Convert one annotation in worker process into SDF record or SMILES.
+    Return path, record and error, record is None if conversion failed
+    """
+    from rdkit import Chem
+
+    from molina.molfile import annotation_to_mol, expand_functional_group
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            annotation = json.load(f)
+
+        smiles, mol = expand_functional_group(annotation_to_mol(annotation), {})
+        if fmt == "csv":
+            return path, smiles, ""
+
+        mol.SetProp("_Name", Path(path).stem)
+        record = (
+            f"{Chem.MolToMolBlock(mol)}"
+            f">  <SMILES>\n{smiles}\n\n"
+            f">  <source>\n{path}\n\n"
+            "$$$$\n"
+        )
+        return path, record, ""
+
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def export_directory(
+    path: Path,
+    output: Path,
+    fmt: Optional[str] = None,
+    workers: int = 1,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict:
+    """Write molecules of all annotations under directory into output file
+    in order of annotation paths. Annotations are converted by worker
+    processes, a window of paths is processed at once and records are
+    written as soon as they are ready, so memory does not grow with corpus.
+    Format is taken from output suffix if it is not given.
+    on_progress gets numbers of processed and all annotations after every window.
+    Return counts, failed paths with errors and throughput
+    """
+    output = Path(output)
+    fmt = fmt or output.suffix.lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt}, use one of {FORMATS}")
+
+    paths = [str(p) for p in find_annotations(path)]
+    workers = max(1, min(workers, len(paths)))
+    export = partial(export_annotation, fmt=fmt)
+
+    start = time.perf_counter()
+    written = 0
+    failed = {}
+    context = multiprocessing.get_context("spawn")
+    with open(output, "w", encoding="utf-8", newline="") as f, context.Pool(
+        workers
+    ) as pool:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(["path", "smiles"])
+
+        for window in chunks(paths, WINDOW_SIZE):
+            for source, record, error in pool.imap(export, window, CHUNK_SIZE):
+                if record is None:
+                    failed[source] = error
+                    continue
+                if writer:
+                    writer.writerow([source, record])
+                else:
+                    f.write(record)
+                written += 1
+            f.flush()
+            if on_progress:
+                on_progress(written + len(failed), len(paths))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "annotations": len(paths),
+        "written": written,
+        "failed": failed,
+        "seconds": elapsed,
+        "annotations_per_second": len(paths) / elapsed if elapsed else 0.0,
+    }
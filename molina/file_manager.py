@@ -1,3 +1,9 @@
+import sqlite3
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
 from PySide6.QtCore import Qt, QEvent
 from PySide6.QtCore import (
     QDir,
@@ -5,23 +11,333 @@ from PySide6.QtCore import (
     QModelIndex,
     QFile,
     QFileInfo,
+    QAbstractListModel,
+    QFileSystemWatcher,
+    QObject,
+    QSize,
+    QPoint,
+    QTimer,
 )
+from PySide6.QtGui import QColor, QPainter, QPixmap
 from PySide6.QtWidgets import (
     QSizePolicy,
     QVBoxLayout,
+    QHBoxLayout,
+    QStackedLayout,
     QWidget,
     QFileSystemModel,
     QTreeView,
+    QListView,
+    QToolButton,
+    QComboBox,
     QAbstractItemView,
 )
 
+from molina.annotation_index import AnnotationIndex, matches
+from molina.batch import find_images
+from molina.cache import LRUCache
 from molina.styles import SCROLLBAR_STYLE, FOCUSED, UNFOCUSED
+from molina.thumbnails import ThumbnailStore
+from molina.tiled_image import pixmap_nbytes
+
+
+THUMBNAIL_CACHE_BYTES = 32 << 20
+# Pause after the last change of directory before index is updated
+INDEX_UPDATE_DELAY_MS = 500
+INDEX_FILTERS = {
+    "All images": "all",
+    "Annotated": "annotated",
+    "Unannotated": "unannotated",
+    "Low confidence": "low_confidence",
+}
+BADGE_SIZE = 14
+COLOR_ANNOTATED = QColor(76, 175, 80)
+COLOR_NOT_ANNOTATED = QColor(190, 190, 190)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """Images of one directory with thumbnails and annotation badges.
+    Thumbnail is requested only when view asks for it, so only rows scrolled
+    into view are loaded. Shown thumbnails are kept in memory limited cache.
+    Rows are sorted by path, changes of annotation index update only
+    changed rows, loaded thumbnails are kept.
+    """
+
+    thumbnailReady = Signal(str, object)
+
+    def __init__(self, store: ThumbnailStore, parent=None):
+        super().__init__(parent)
+        self._store = store
+        self._paths: List[str] = []
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._thumbnails = LRUCache(THUMBNAIL_CACHE_BYTES, pixmap_nbytes)
+        self._icons = LRUCache(THUMBNAIL_CACHE_BYTES, pixmap_nbytes)
+        self._pending = set()
+        self._placeholder = self.badged(QPixmap(), None)
+        self.directory = ""
+
+        # Thumbnails are made in other threads, signal moves them to GUI thread
+        self.thumbnailReady.connect(self.onThumbnailReady)
+
+    def setDirectory(
+        self,
+        directory: str,
+        paths: Optional[List[str]] = None,
+        statuses: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        """Show images of directory, or only paths of it if they are given,
+        with indexed annotation statuses. Thumbnails are kept if directory
+        is the same, otherwise requests of previous images are dropped
+        """
+        self.beginResetModel()
+        if directory != self.directory:
+            self._store.cancelPending()
+            self._thumbnails = LRUCache(THUMBNAIL_CACHE_BYTES, pixmap_nbytes)
+            self._pending = set()
+        self.directory = directory
+        if paths is None:
+            paths = [str(path) for path in find_images(directory, recursive=False)]
+        self._paths = sorted(paths)
+        statuses = statuses or {}
+        self._status = {
+            path: statuses[path] for path in self._paths if path in statuses
+        }
+        self._icons = LRUCache(THUMBNAIL_CACHE_BYTES, pixmap_nbytes)
+        self.endResetModel()
+
+    def row(self, path: str) -> int:
+        """Row of image, -1 if it is not shown"""
+        row = bisect_left(self._paths, path)
+        if row < len(self._paths) and self._paths[row] == path:
+            return row
+        return -1
+
+    def applyStatuses(
+        self, statuses: Dict[str, Optional[Dict[str, Any]]], name: str
+    ) -> None:
+        """Apply changed statuses of images from index: rows which pass
+        filter name are added or updated, other ones are removed.
+        Status None means that image is deleted
+        """
+        for path, status in sorted(statuses.items()):
+            row = self.row(path)
+            if matches(status, name):
+                if row < 0:
+                    row = bisect_left(self._paths, path)
+                    self.beginInsertRows(QModelIndex(), row, row)
+                    self._paths.insert(row, path)
+                    self._status[path] = status
+                    self.endInsertRows()
+                elif self._status.get(path) != status:
+                    self._status[path] = status
+                    # Badge is painted again from kept thumbnail
+                    self._icons.pop(path)
+                    index = self.index(row)
+                    self.dataChanged.emit(
+                        index, index, [Qt.DecorationRole, Qt.ToolTipRole]
+                    )
+            elif row >= 0:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._paths[row]
+                self._status.pop(path, None)
+                self._icons.pop(path)
+                if status is None:
+                    self._thumbnails.pop(path)
+                self.endRemoveRows()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        path = self._paths[index.row()]
+        if role == Qt.DisplayRole:
+            return Path(path).name
+        elif role == Qt.DecorationRole:
+            icon = self._icons.get(path)
+            if icon is None:
+                thumbnail = self._thumbnails.get(path)
+                if thumbnail is None:
+                    self.requestThumbnail(path)
+                    return self._placeholder
+                icon = self.badged(thumbnail, self._status.get(path))
+                self._icons.put(path, icon)
+            return icon
+        elif role == Qt.ToolTipRole:
+            status = self._status.get(path)
+            if status is None or not status["annotated"]:
+                return path
+            return f"{path}\nAtoms: {status['atoms']}, bonds: {status['bonds']}"
+        elif role == Qt.UserRole:
+            return path
+        return None
+
+    def requestThumbnail(self, path: str) -> None:
+        """Make or read thumbnail in background once"""
+        if path in self._pending:
+            return
+        self._pending.add(path)
+        self._store.request(path).add_done_callback(
+            lambda future, path=path: self.thumbnailReady.emit(path, future)
+        )
+
+    def onThumbnailReady(self, path: str, future: Future) -> None:
+        """Keep thumbnail and update its row, badge is added when row is shown"""
+        self._pending.discard(path)
+        row = self.row(path)
+        if row < 0 or future.cancelled():
+            return
+
+        try:
+            thumbnail_path = future.result()
+        except Exception:
+            return
+
+        pixmap = QPixmap(str(thumbnail_path)) if thumbnail_path else QPixmap()
+        self._thumbnails.put(path, pixmap)
+        self._icons.pop(path)
+
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole, Qt.ToolTipRole])
+
+    def badged(self, thumbnail: QPixmap, status: Optional[Dict[str, Any]]) -> QPixmap:
+        """Thumbnail in the center of square icon with annotation status
+        circle in the corner, unknown status has no circle
+        """
+        size = self._store.size
+        icon = QPixmap(size, size)
+        icon.fill(Qt.transparent)
+
+        painter = QPainter(icon)
+        if not thumbnail.isNull():
+            painter.drawPixmap(
+                QPoint(
+                    (size - thumbnail.width()) // 2, (size - thumbnail.height()) // 2
+                ),
+                thumbnail,
+            )
+        if status is not None:
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.white)
+            painter.setBrush(
+                COLOR_ANNOTATED if status["annotated"] else COLOR_NOT_ANNOTATED
+            )
+            painter.drawEllipse(size - BADGE_SIZE - 2, 2, BADGE_SIZE, BADGE_SIZE)
+        painter.end()
+        return icon
+
+
+class IndexWatcher(QObject):
+    """Keeps annotation index of shown directory up to date.
+    Directory is watched for added, removed and renamed files, annotations
+    saved by application are reported by indexPath. Index is updated in
+    background thread, a burst of changes makes one update.
+    indexLoaded sends statuses of all images of opened directory,
+    indexUpdated sends statuses of changed images only, None for deleted ones
+    """
+
+    indexLoaded = Signal(str, object)
+    indexUpdated = Signal(str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._index: Optional[AnnotationIndex] = None
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self.scheduleUpdate)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(INDEX_UPDATE_DELAY_MS)
+        self._timer.timeout.connect(self.update)
+
+    @property
+    def directory(self) -> str:
+        return str(self._index.directory) if self._index else ""
+
+    def setDirectory(self, directory: str) -> None:
+        """Open index of directory and update it in background.
+        Index is kept in memory if directory is not writable
+        """
+        if self._index is not None:
+            if str(self._index.directory) == directory:
+                return
+            self._watcher.removePaths(self._watcher.directories())
+            index = self._index
+            self._pool.submit(index.close)
+
+        try:
+            self._index = AnnotationIndex(directory)
+        except (sqlite3.Error, OSError):
+            self._index = AnnotationIndex(directory, ":memory:")
+
+        self._watcher.addPath(directory)
+        self._submit(self._load, self._index, loaded=True)
+
+    def scheduleUpdate(self) -> None:
+        self._timer.start()
+
+    def update(self) -> None:
+        """Read changed annotations in background thread"""
+        if self._index is not None:
+            self._submit(self._changed, self._index)
+
+    def indexPath(self, path: str) -> None:
+        """Read annotation of one image of shown directory"""
+        if self._index is not None and str(Path(path).parent) == self.directory:
+            self._submit(self._changed, self._index, path)
+
+    @staticmethod
+    def _load(index: AnnotationIndex) -> Dict[str, Dict[str, Any]]:
+        """Update index and read statuses of all images, called in index thread"""
+        index.update()
+        return index.statuses()
+
+    @staticmethod
+    def _changed(
+        index: AnnotationIndex, path: Optional[str] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Update whole index or one image of it and read statuses
+        of changed images, called in index thread
+        """
+        changed = index.update() if path is None else index.updatePath(path)
+        return index.statuses(changed)
+
+    def _submit(self, function, *args, loaded: bool = False) -> None:
+        # Signal moves result from index thread to GUI thread
+        directory = self.directory
+        self._pool.submit(function, *args).add_done_callback(
+            lambda future: self._onDone(directory, future, loaded)
+        )
+
+    def _onDone(self, directory: str, future: Future, loaded: bool) -> None:
+        """Send statuses of index, called in index thread.
+        Empty update is not sent
+        """
+        if future.cancelled() or future.exception():
+            return
+        if loaded:
+            self.indexLoaded.emit(directory, future.result())
+        elif future.result():
+            self.indexUpdated.emit(directory, future.result())
+
+    def shutdown(self) -> None:
+        """Stop watching and close index"""
+        self._timer.stop()
+        if self._index is not None:
+            self._pool.submit(self._index.close)
+        self._pool.shutdown(wait=False)
 
 
 class FileManager(QWidget):
     """This class shows directories and images inside ones.
     One click opens directory.
     Double click on image opens image in CentralWidget.
+    Thumbnails button switches to grid of images of the last clicked directory,
+    which can be filtered by annotation status from index of directory.
     It doesn't work when model predicts atoms and bonds for opened image.
     """
 
@@ -50,7 +366,53 @@ class FileManager(QWidget):
         self.file_view.setMinimumSize(200, 200)
         self.file_view.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
-        self.file_layout.addWidget(self.file_view)
+        self.button_thumbnails = QToolButton(self)
+        self.button_thumbnails.setText("Thumbnails")
+        self.button_thumbnails.setToolTip("Show thumbnails of clicked directory")
+        self.button_thumbnails.setCheckable(True)
+        self.button_thumbnails.toggled.connect(self.showThumbnails)
+
+        self.filter_box = QComboBox(self)
+        self.filter_box.addItems(list(INDEX_FILTERS))
+        self.filter_box.setToolTip("Show images with annotation status")
+        self.filter_box.setEnabled(False)
+        self.filter_box.currentTextChanged.connect(
+            lambda text: self.updateThumbnails()
+        )
+
+        self.thumbnail_tools = QHBoxLayout()
+        self.thumbnail_tools.addWidget(self.button_thumbnails)
+        self.thumbnail_tools.addWidget(self.filter_box)
+        self.file_layout.addLayout(self.thumbnail_tools)
+
+        self.index_watcher = IndexWatcher(self)
+        self.index_watcher.indexLoaded.connect(self.onIndexLoaded)
+        self.index_watcher.indexUpdated.connect(self.onIndexUpdated)
+        # Statuses of all images of indexed directory, None until it is loaded
+        self._statuses: Optional[Dict[str, Dict[str, Any]]] = None
+
+        self.thumbnail_store = ThumbnailStore()
+        self.thumbnail_model = ThumbnailModel(self.thumbnail_store, self)
+        self._directory = QDir.homePath()
+
+        self.thumbnail_view = QListView(self)
+        self.thumbnail_view.setStyleSheet(SCROLLBAR_STYLE)
+        self.thumbnail_view.setModel(self.thumbnail_model)
+        self.thumbnail_view.setViewMode(QListView.IconMode)
+        self.thumbnail_view.setMovement(QListView.Static)
+        self.thumbnail_view.setResizeMode(QListView.Adjust)
+        self.thumbnail_view.setUniformItemSizes(True)
+        self.thumbnail_view.setWordWrap(True)
+        size = self.thumbnail_store.size
+        self.thumbnail_view.setIconSize(QSize(size, size))
+        self.thumbnail_view.setGridSize(QSize(size + 20, size + 40))
+        self.thumbnail_view.setEditTriggers(QListView.NoEditTriggers)
+        self.thumbnail_view.doubleClicked.connect(self.onThumbnailDoubleClicked)
+
+        self.views_layout = QStackedLayout()
+        self.views_layout.addWidget(self.file_view)
+        self.views_layout.addWidget(self.thumbnail_view)
+        self.file_layout.addLayout(self.views_layout)
 
         self.file_view.setEditTriggers(QTreeView.NoEditTriggers)
 
@@ -58,12 +420,14 @@ class FileManager(QWidget):
         self.file_view.doubleClicked.connect(self.onDoubleClicked)
 
         self.file_view.installEventFilter(self)
+        self.thumbnail_view.installEventFilter(self)
 
-    def eventFilter(self, obj: QTreeView, event: QEvent) -> bool:
+    def eventFilter(self, obj: QAbstractItemView, event: QEvent) -> bool:
         """Catch focus"""
-        if obj == self.file_view and event.type() == QEvent.FocusIn:
+        views = (self.file_view, self.thumbnail_view)
+        if obj in views and event.type() == QEvent.FocusIn:
             self.updateStyleSheet(True)
-        elif obj == self.file_view and event.type() == QEvent.FocusOut:
+        elif obj in views and event.type() == QEvent.FocusOut:
             self.updateStyleSheet(False)
 
         return super().eventFilter(obj, event)
@@ -86,6 +450,7 @@ class FileManager(QWidget):
         """Open/close directory"""
         path = self.file_model.filePath(index)
         if QFileInfo(path).isDir():
+            self._directory = path
             if self.file_view.isExpanded(index):
                 self.file_view.collapse(index)
             else:
@@ -97,3 +462,62 @@ class FileManager(QWidget):
         if QFile(path).exists() and not QFileInfo(path).isDir():
             if path.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp")):
                 self.itemSelected.emit(path)
+
+    def showThumbnails(self, checked: bool) -> None:
+        """Switch between directory tree and thumbnails of clicked directory"""
+        self.filter_box.setEnabled(checked)
+        if checked:
+            if self.index_watcher.directory != self._directory:
+                self._statuses = None
+                self.index_watcher.setDirectory(self._directory)
+                self.updateThumbnails()
+            self.views_layout.setCurrentWidget(self.thumbnail_view)
+        else:
+            self.views_layout.setCurrentWidget(self.file_view)
+
+    def updateThumbnails(self) -> None:
+        """Show images of directory which pass status filter.
+        Until directory is indexed, all its images are shown
+        """
+        name = INDEX_FILTERS[self.filter_box.currentText()]
+        if self._statuses is None:
+            paths = None if name == "all" else []
+        else:
+            paths = [
+                path for path, status in self._statuses.items() if matches(status, name)
+            ]
+        self.thumbnail_model.setDirectory(
+            self.index_watcher.directory, paths, self._statuses
+        )
+
+    def onIndexLoaded(self, directory: str, statuses: Dict) -> None:
+        """Show statuses of all images when directory is indexed"""
+        if directory == self.index_watcher.directory:
+            self._statuses = dict(statuses)
+            self.updateThumbnails()
+
+    def onIndexUpdated(self, directory: str, statuses: Dict) -> None:
+        """Update only rows of images which statuses are changed"""
+        if directory != self.index_watcher.directory or self._statuses is None:
+            return
+        for path, status in statuses.items():
+            if status is None:
+                self._statuses.pop(path, None)
+            else:
+                self._statuses[path] = status
+        if self.thumbnail_model.directory == directory:
+            name = INDEX_FILTERS[self.filter_box.currentText()]
+            self.thumbnail_model.applyStatuses(statuses, name)
+
+    def annotationChanged(self, path: str) -> None:
+        """Update index and badges when annotation is saved"""
+        self.index_watcher.indexPath(path)
+
+    def onThumbnailDoubleClicked(self, index: QModelIndex) -> None:
+        """Send image path of thumbnail to MainWindow"""
+        self.itemSelected.emit(self.thumbnail_model.data(index, Qt.UserRole))
+
+    def shutdownThumbnails(self) -> None:
+        """Stop background making of thumbnails and indexing"""
+        self.thumbnail_store.shutdown()
+        self.index_watcher.shutdown()
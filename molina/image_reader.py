@@ -0,0 +1,182 @@
+"""Lazy reading of big images: reduced preview first, full resolution on demand"""
+
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+# Images with the longest side up to twice this size are read at once
+PREVIEW_SIZE = 2048
+REDUCTIONS = (2, 4, 8)
+TIFF_SUFFIXES = {".tif", ".tiff"}
+# Pillow modes of one channel images, their preview is decoded as grayscale
+GRAYSCALE_MODES = ("1", "L", "I", "F", "I;16", "I;16B", "I;16L")
+
+# Pillow size limit is global, it is changed by one header reading at a time
+_HEADER_LOCK = threading.Lock()
+
+
+def read_image_header(path: str) -> Optional[Tuple[int, int, bool]]:
+    """Width, height and whether image is grayscale from image header
+    without decoding pixels. None if Pillow is not installed or format
+    is unknown to it
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    # Only header is read here, pixels are decoded by OpenCV, so size limit
+    # of Pillow against decompression bombs does not protect anything.
+    # The limit is restored, so other users of Pillow keep it
+    with _HEADER_LOCK:
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            with Image.open(path) as image:
+                return image.size + (image.mode in GRAYSCALE_MODES,)
+        except Exception:
+            return None
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def memory_map_tiff(path: str) -> Optional[npt.NDArray]:
+    """Array over uncompressed grayscale TIFF mapped into memory, pages are read
+    by the system when pixels are used. None if tifffile is not installed
+    or file can not be mapped
+    """
+    if Path(path).suffix.lower() not in TIFF_SUFFIXES:
+        return None
+    try:
+        import tifffile
+    except ImportError:
+        return None
+
+    try:
+        image = tifffile.memmap(path, mode="r")
+    except Exception:
+        return None
+
+    # Color TIFF is RGB, but images of application are BGR like OpenCV ones
+    if image.ndim != 2 or image.dtype != np.uint8:
+        return None
+    return image
+
+
+class LazyImage:
+    """Image file which pixels are decoded only when they are needed.
+    Size is read from file header and preview is decoded reduced by 2, 4 or 8
+    times, so the longest side is about preview_size. Full resolution is
+    decoded on first call of full(), or memory mapped for uncompressed TIFF.
+    Small images are decoded at once and preview is the full image.
+    OpenCV decodes reduced JPEG directly, other formats are decoded and
+    resized, so only the preview stays in memory.
+    Numpy functions get full resolution array through __array__.
+    shape and ndim describe the preview scaled to full size, they do not
+    change when full resolution is decoded. Full array can have other
+    layout, like 16 bit pixels or alpha channel, so code which depends
+    on it uses full().shape.
+    """
+
+    def __init__(self, path: str, preview_size: int = PREVIEW_SIZE):
+        self.path = path
+        self._full: Optional[npt.NDArray] = None
+        self._preview: Optional[npt.NDArray] = None
+        self.reduction = 1
+        self._grayscale = False
+
+        header = read_image_header(path)
+        if header is not None and max(header[:2]) > 2 * preview_size:
+            self._size = header[:2]
+            self._grayscale = header[2]
+            self.reduction = next(
+                (r for r in REDUCTIONS if max(self._size) / r <= preview_size),
+                REDUCTIONS[-1],
+            )
+            self._preview = self._readReduced()
+
+        if self._preview is None:
+            self.reduction = 1
+            self._full = self._readFull()
+            self._preview = self._full
+            if self._full is not None:
+                self._size = (self._full.shape[1], self._full.shape[0])
+
+    def isNull(self) -> bool:
+        """Image could not be read"""
+        return self._preview is None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Height and width of full image and channels of preview"""
+        return (self._size[1], self._size[0]) + self._preview.shape[2:]
+
+    @property
+    def ndim(self) -> int:
+        """Dimensions of preview"""
+        return self._preview.ndim
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of decoded pixels, mapped file is not counted"""
+        nbytes = self._preview.nbytes
+        if self._full is not None and self._full is not self._preview:
+            if not isinstance(self._full, np.memmap):
+                nbytes += self._full.nbytes
+        return nbytes
+
+    def isLoaded(self) -> bool:
+        """Full resolution is decoded"""
+        return self._full is not None
+
+    def preview(self) -> npt.NDArray:
+        """Image reduced by reduction times, the same array as full for
+        small images
+        """
+        return self._preview
+
+    def full(self) -> npt.NDArray:
+        """Full resolution image, it is decoded on the first call"""
+        if self._full is None:
+            self._full = self._readFull()
+        return self._full
+
+    def __array__(self, dtype=None) -> npt.NDArray:
+        image = self.full()
+        return image if dtype is None else image.astype(dtype)
+
+    def _readReduced(self) -> Optional[npt.NDArray]:
+        import cv2
+
+        # Full image of grayscale file is two-dimensional, preview must be the same
+        if self._grayscale:
+            flag = {
+                2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+            }[self.reduction]
+        else:
+            flag = {
+                2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8,
+            }[self.reduction]
+        return cv2.imread(self.path, flag)
+
+    def _readFull(self) -> Optional[npt.NDArray]:
+        import cv2
+
+        image = memory_map_tiff(self.path)
+        if image is None:
+            image = cv2.imread(self.path, cv2.IMREAD_UNCHANGED)
+        return image
+
+
+def open_image(path: str, preview_size: int = PREVIEW_SIZE) -> Optional[LazyImage]:
+    """Open image lazily, None if it can not be read"""
+    image = LazyImage(path, preview_size)
+    return None if image.isNull() else image
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from collections import defaultdict
 
 import numpy.typing as npt
@@ -8,6 +8,7 @@ from PySide6.QtCore import (
     QDir,
     Signal,
     QThread,
+    QTimer,
 )
 from PySide6.QtWidgets import (
     QToolButton,
@@ -21,29 +22,52 @@ from PySide6.QtWidgets import (
     QTextEdit,
     QMenu,
     QMessageBox,
+    QProgressBar,
+    QLabel,
 )
 from PySide6.QtGui import (
     QPalette,
     QColor,
-    QPixmap,
     QIcon,
-    QImage,
-    QPaintEvent,
     QAction,
     QRegion,
 )
 
-from molina.data_structs import Dataset, Worker
+from molina.data_structs import BatchWorker, Dataset
 from molina.central_widget import CentralWidget
 from molina.action_managers import FileActionManager
 from molina.file_manager import FileManager
 from molina.help_widget import HelpWindow
 from molina.hotkeys import Hotkeys
+from molina.image_reader import LazyImage
 from molina.styles import TOOLBAR_STYLE, TEXT_STYLE
 
 
 RESOURCES_PATH = QDir("molina/resources")
 COLOR_BACKGROUND_WIDGETS = QColor(250, 250, 250)
+# Pause after the last edit before annotation text is built again
+ANNOTATION_TEXT_DELAY_MS = 150
+FRAME_TIMES_INTERVAL_MS = 1000
+BATCH_TOOLTIP = "Predict all images of directory"
+BATCH_STOP_TOOLTIP = "Stop directory prediction"
+TAB = "        "
+
+
+def annotation_to_text(annotation: Dict[str, List[Any]]) -> str:
+    """Pretty text of annotation: every key and items of it line by line"""
+    lines = []
+    for key, items in annotation.items():
+        lines.append(f"{key}:")
+        for item in items:
+            lines.extend(
+                f"{TAB}{internal_key}: {internal_value}"
+                for internal_key, internal_value in item.items()
+                if not (
+                    internal_key == "confidence" and internal_value == "not_modeling"
+                )
+            )
+            lines.append("")
+    return "\n".join(lines) + "\n" if lines else ""
 
 
 class MainWindow(QMainWindow):
@@ -54,7 +78,7 @@ class MainWindow(QMainWindow):
 
     imagePathSelected = Signal(str)
 
-    def __init__(self):
+    def __init__(self, preload_model: bool = False, show_frame_times: bool = False):
         super(MainWindow, self).__init__()
 
         self.setWindowTitle("MOLInA")
@@ -70,11 +94,24 @@ class MainWindow(QMainWindow):
         self.data_images._current_image_signal.current_annotation.connect(
             self.changeAnnotation
         )
+        self.data_images._current_image_signal.prediction_finished.connect(
+            self.showModelTimings
+        )
+        self.data_images._current_image_signal.prediction_failed.connect(
+            self.onPredictionFailed
+        )
+
+        # Model is loaded while user opens and annotates the first image
+        if preload_model:
+            self.data_images.startPredictionPool()
 
         self.central_widget = CentralWidget()
 
         self.file_widget = FileManager(self)
         self.file_widget.itemSelected.connect(self.changeCurrentImage)
+        self.data_images._current_image_signal.annotation_saved.connect(
+            self.file_widget.annotationChanged
+        )
 
         self.addToolBar(self.toolbar_main)
         self.page_layout.addWidget(self.splitter)
@@ -85,6 +122,16 @@ class MainWindow(QMainWindow):
         self.text_widget.setLineWrapMode(QTextEdit.WidgetWidth)
         self.text_widget.setReadOnly(True)
 
+        # Edits come faster than text can be built, so the text is built
+        # once after a burst of edits and only if the panel is visible
+        self._annotation = {}
+        self._annotation_text_dirty = False
+        self._annotation_timer = QTimer(self)
+        self._annotation_timer.setSingleShot(True)
+        self._annotation_timer.setInterval(ANNOTATION_TEXT_DELAY_MS)
+        self._annotation_timer.timeout.connect(self.showAnnotationText)
+        self.splitter.splitterMoved.connect(self.showAnnotationText)
+
         self.splitter.addWidget(self.file_widget)
         self.splitter.addWidget(self.central_widget)
         self.splitter.addWidget(self.text_widget)
@@ -123,6 +170,26 @@ class MainWindow(QMainWindow):
         self.button_predict.setIcon(QIcon(RESOURCES_PATH.filePath("predict.png")))
         self.button_predict.pressed.connect(self.startPrediction)
 
+        self.button_batch = QToolButton()
+        self.button_batch.setToolTip(BATCH_TOOLTIP)
+        self.button_batch.setIcon(QIcon(RESOURCES_PATH.filePath("predict_batch.png")))
+        self.button_batch.pressed.connect(self.startBatchPrediction)
+
+        self.batch_progress = QProgressBar()
+        self.batch_progress.setMaximumWidth(200)
+        self.batch_progress.hide()
+        self.statusBar().addPermanentWidget(self.batch_progress)
+
+        # Paint time of drawing area is shown for checking of rendering speed
+        self.frame_times_label = QLabel()
+        self.frame_times_label.setVisible(show_frame_times)
+        self.statusBar().addPermanentWidget(self.frame_times_label)
+        self._frame_times_timer = QTimer(self)
+        self._frame_times_timer.setInterval(FRAME_TIMES_INTERVAL_MS)
+        self._frame_times_timer.timeout.connect(self.showFrameTimes)
+        if show_frame_times:
+            self._frame_times_timer.start()
+
         # Add a spacer widget between buttons
         self.spacer = QWidget()
         self.spacer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
@@ -145,13 +212,14 @@ class MainWindow(QMainWindow):
         self.help_button.clicked.connect(self.showHelpWindow)
 
         self.hotkeys = Hotkeys()
-        self.thread = None
+        self.batch_thread = None
 
         self.toolbar_main.addWidget(self.button_open)
         self.toolbar_main.addWidget(self.button_save)
         self.toolbar_main.addWidget(self.button_clean)
         self.toolbar_main.addWidget(self.button_current_model)
         self.toolbar_main.addWidget(self.button_predict)
+        self.toolbar_main.addWidget(self.button_batch)
         self.toolbar_main.addWidget(self.spacer)
         self.toolbar_main.addWidget(self.button_left)
         self.toolbar_main.addWidget(self.button_recent)
@@ -172,29 +240,10 @@ class MainWindow(QMainWindow):
         help_window = HelpWindow(self.hotkeys)
         help_window.exec_()
 
-    def changeImage(self, image: npt.NDArray) -> None:
-        """Convert numpy array to QPixmap"""
+    def changeImage(self, image: Union[npt.NDArray, LazyImage]) -> None:
+        """Show numpy array, it is shared with Qt without copying"""
         self.central_widget.setScaleFactor(1.0)
-
-        if image.ndim == 3:
-            h, w, ch = image.shape
-            bytes_per_line = ch * w
-            if image.shape[2] == 4:
-                q_image = QImage(
-                    image.data, w, h, bytes_per_line, QImage.Format_RGBA8888
-                )
-            elif image.shape[2] == 3:
-                q_image = QImage(image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        elif image.ndim == 2:
-            h, w = image.shape
-            q_image = QImage(image.data, w, h, w, QImage.Format_Grayscale8)
-        else:
-            raise ValueError("Unexpected array dimension")
-
-        if q_image.isNull():
-            ValueError("Unsupported array shape for QPixmap conversion")
-
-        self.central_widget.setCentralPixmap(QPixmap.fromImage(q_image))
+        self.central_widget.setCentralImage(image)
 
     def openImage(self) -> None:
         """Open image with file dialog window"""
@@ -212,84 +261,140 @@ class MainWindow(QMainWindow):
         self.fileAction.addRecentImage(path)
         self.imagePathSelected.emit(path)
 
+        # User often returns to recently opened images
+        recent_images = self.fileAction.getRecentImages()[1:3]
+        self.data_images.prefetch([str(image) for image in recent_images])
+
     def changeAnnotation(self, annotation: Dict[str, List[Any]]) -> None:
-        """Make text more pretty look and set it into text area"""
-        annotation_pretty = ""
-        tab = "        "
-        for key in annotation.keys():
-            annotation_pretty = annotation_pretty + str(key) + ":\n"
-            for item in annotation[key]:
-                for internal_key, internal_value in item.items():
-                    if (
-                        internal_key == "confidence"
-                        and internal_value == "not_modeling"
-                    ):
-                        continue
-                    annotation_pretty = (
-                        annotation_pretty
-                        + tab
-                        + str(internal_key)
-                        + ": "
-                        + str(internal_value)
-                        + "\n"
-                    )
-                annotation_pretty += "\n"
+        """Remember annotation, its text is built after a burst of edits"""
+        self._annotation = annotation
+        self._annotation_text_dirty = True
+        self._annotation_timer.start()
+
+    def showAnnotationText(self) -> None:
+        """Make text more pretty look and set it into text area.
+        Hidden or collapsed text area is filled when it is shown again
+        """
+        if not self._annotation_text_dirty:
+            return
+        if self.text_widget.visibleRegion().isEmpty():
+            return
+        self._annotation_text_dirty = False
 
         scrollbar = self.text_widget.verticalScrollBar()
         current_pos = scrollbar.value()
 
-        self.text_widget.setText(annotation_pretty)
+        self.text_widget.setText(annotation_to_text(self._annotation))
 
         scrollbar.setValue(current_pos)
 
     def startPrediction(self) -> None:
-        """Start new thread to parallel prediction
-        Block FileManager and toolbar"""
+        """Send current image to prediction processes.
+        User can work with other images while it is predicted
+        """
         if not self.central_widget.hasPixmap():
             QMessageBox.warning(self, "Prediction Error", "No image to predict.")
             return
 
-        self.file_widget.setEnabled(False)
-        self.toolbar_main.setEnabled(False)
+        self.data_images.predictCurrentImage()
+        self.statusBar().showMessage("Prediction is running...")
+
+    def onPredictionFailed(self, message: str) -> None:
+        """Show prediction error"""
+        self.statusBar().clearMessage()
+        QMessageBox.warning(self, "Prediction Error", message)
+
+    def startBatchPrediction(self) -> None:
+        """Predict all not annotated images of chosen directory in parallel thread.
+        User can annotate other images meanwhile. Second click cancels prediction
+        """
+        if self.batch_thread is not None:
+            self.batch_worker.cancel()
+            self.statusBar().showMessage("Batch prediction is stopping...")
+            return
+
+        directory = QFileDialog.getExistingDirectory(self, "Predict directory")
+        if not directory:
+            return
 
-        self.thread = QThread()
-        self.worker = Worker(self.data_images)
-        self.worker.moveToThread(self.thread)
+        self.batch_thread = QThread()
+        self.batch_worker = BatchWorker(directory, self.data_images.predictionPool())
+        self.batch_worker.moveToThread(self.batch_thread)
+
+        self.batch_thread.started.connect(self.batch_worker.run)
+        self.batch_worker.finished.connect(self.batch_thread.quit)
+        self.batch_worker.finished.connect(self.onBatchCompleted)
+        self.batch_worker.progress.connect(self.showBatchProgress)
+        self.batch_worker.error.connect(self.onBatchError)
+        self.batch_worker.annotated.connect(self.data_images.forgetImage)
+        self.batch_worker.annotated.connect(self.file_widget.annotationChanged)
+        self.batch_thread.finished.connect(self.onBatchThreadFinished)
+
+        self.button_batch.setToolTip(BATCH_STOP_TOOLTIP)
+        self.batch_progress.setValue(0)
+        self.batch_progress.show()
+        self.batch_thread.start()
+
+    def showBatchProgress(self, done: int, total: int) -> None:
+        """Show number of predicted images"""
+        self.batch_progress.setMaximum(max(total, 1))
+        self.batch_progress.setValue(done)
+        self.batch_progress.setFormat(f"{done}/{total}")
+
+    def onBatchCompleted(self, state) -> None:
+        """Show result of batch prediction"""
+        self.statusBar().showMessage(
+            f"Batch prediction: {len(state.done)} annotated, "
+            f"{len(state.failed)} failed"
+        )
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.thread.finished.connect(self.onThreadFinished)
-        self.worker.result.connect(self.onModelCompleted)
+    def onBatchError(self, message: str) -> None:
+        """Show model error which stopped batch prediction"""
+        QMessageBox.warning(self, "Prediction Error", message)
 
-        self.thread.start()
+    def onBatchThreadFinished(self) -> None:
+        """Clean thread and worker after batch prediction finishing"""
+        self.batch_worker.deleteLater()
+        self.batch_thread.deleteLater()
+        self.batch_thread = None
+        self.batch_progress.hide()
+        self.button_batch.setToolTip(BATCH_TOOLTIP)
 
-    def onThreadFinished(self) -> None:
-        """Clean thread and worker after prediction finishing"""
-        self.worker.deleteLater()
-        self.thread = None
+    def showEvent(self, event) -> None:
+        """Fill text area which was left behind while window was hidden"""
+        super().showEvent(event)
+        if self._annotation_text_dirty:
+            self._annotation_timer.start()
 
     def closeEvent(self, event) -> None:
-        """Finish thread if application was closed"""
-        if self.thread and self.thread.isRunning():
-            self.thread.terminate()
-            self.thread.wait()
+        """Finish prediction processes and threads if application was closed"""
+        self.data_images.shutdownPredictionPool()
+        self.data_images.shutdownPrefetcher()
+        self.file_widget.shutdownThumbnails()
 
-        event.accept()
+        # Batch state is saved after every batch, so it can be continued later
+        if self.batch_thread and self.batch_thread.isRunning():
+            self.batch_worker.cancel()
+            self.batch_thread.quit()
+            self.batch_thread.wait()
 
-    def onModelCompleted(self, model_result: Dict) -> None:
-        """Unblock FileManager and toolbar and change annotation text"""
-        if model_result:
-            self.changeAnnotation(model_result)
+        event.accept()
 
-        self.file_widget.setEnabled(True)
-        self.toolbar_main.setEnabled(True)
+    def showModelTimings(self, timings: Dict[str, float]) -> None:
+        """Show model loading and inference time in status bar"""
+        if timings:
+            self.statusBar().showMessage(
+                f"Model loading: {timings['load']:.2f} s, "
+                f"prediction: {timings['inference']:.2f} s"
+            )
 
-    def resizeEvent(self, event: QPaintEvent) -> None:
-        """Save central widget size as image size while
-        main window or central part of main window is changed
-        """
-        super().resizeEvent(event)
-        self.central_widget.setPixmapSize()
+    def showFrameTimes(self) -> None:
+        """Show paint time of drawing area in status bar"""
+        times = self.central_widget.drawing_widget.getFrameTimes()
+        self.frame_times_label.setText(
+            f"Paint: last {times['last']:.1f} ms, "
+            f"mean {times['mean']:.1f} ms of {times['frames']} frames"
+        )
 
     def setColor(self, widget: QWidget, color: QColor) -> None:
         """Fill widget background by one color"""
@@ -0,0 +1,129 @@
+"""Process-wide registry of prediction models.
+Module does not import Qt, so prediction processes start fast
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+MOLSCRIBE = "./models/molscribe_aux_1m.pth"
+
+
+def load_molscribe(path: str = MOLSCRIBE) -> Any:
+    """Build MolScribe network and read its checkpoint on cpu"""
+    import torch
+    from molscribe import MolScribe
+
+    return MolScribe(path, torch.device("cpu"))
+
+
+def predict_image(
+    image: Any, model_name: str = "MolScribe"
+) -> Tuple[Optional[Dict[str, List]], Dict[str, float]]:
+    """Predict atoms and bonds of BGR image by model of this process.
+    Return annotation, None if model found nothing, and seconds
+    spent on model loading and inference
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.cvtColor(np.asarray(image), cv2.COLOR_BGR2RGB)
+
+    start = time.perf_counter()
+    model = ModelRegistry().get(model_name)
+    loaded = time.perf_counter()
+    result = model.predict_image(image, return_atoms_bonds=True, return_confidence=True)
+    timings = {
+        "load": loaded - start,
+        "inference": time.perf_counter() - loaded,
+    }
+
+    if not result:
+        return None, timings
+    return {"atoms": result["atoms"], "bonds": result["bonds"]}, timings
+
+
+class ModelRegistry:
+    """Keeps every model resident after its first use.
+    Model is loaded lazily on the first request or in background by preload,
+    then the same instance is returned to all callers of the process.
+    """
+
+    _instance = None
+    _is_init = False
+
+    def __new__(cls):
+        if not cls._instance:
+            cls._instance = super(ModelRegistry, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._is_init:
+            return
+        self._is_init = True
+
+        self._loaders: Dict[str, Callable[[], Any]] = {"MolScribe": load_molscribe}
+        self._models: Dict[str, Any] = {}
+        self._load_times: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Add model loader, loaded model with the same name is dropped"""
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._models.pop(name, None)
+            self._load_times.pop(name, None)
+
+    def _lock(self, name: str) -> threading.Lock:
+        """Lock of one model, so different models can be loaded at the same time"""
+        with self._registry_lock:
+            if name not in self._loaders:
+                raise KeyError(f"Unknown model {name}")
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """Return loaded model, load it if it is the first request.
+        If model is loading in background, wait for it
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock(name):
+            if name not in self._models:
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._load_times[name] = time.perf_counter() - start
+
+        return self._models[name]
+
+    def preload(self, name: str) -> threading.Thread:
+        """Start loading model in background thread.
+        Loading errors are not raised here, they are raised by the next get
+        """
+
+        def load():
+            try:
+                self.get(name)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=load, name=f"preload-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def isLoaded(self, name: str) -> bool:
+        """Check if model is resident"""
+        return name in self._models
+
+    def loadTime(self, name: str) -> Optional[float]:
+        """Seconds spent on loading model or None if it is not loaded"""
+        return self._load_times.get(name)
+
+    def unload(self, name: str) -> None:
+        """Drop loaded model to free memory"""
+        with self._lock(name):
+            self._models.pop(name, None)
+            self._load_times.pop(name, None)
@@ -20,21 +20,47 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from typing import Dict, Tuple
-from rdkit import Chem
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from rdkit import Chem, rdBase
 
-from molina.constants import RGROUP_SYMBOLS, BOND_TYPES, ABBREVIATIONS, FORMULA_REGEX
+from molina.constants import (
+    RGROUP_SYMBOLS,
+    BOND_TYPES,
+    ABBREVIATIONS,
+    ELEMENTS,
+    FORMULA_REGEX,
+)
 
 
+# Labels and condensed formulas recur across corpus, their parsing is cached
+FORMULA_CACHE_SIZE = 4096
+FRAGMENT_CACHE_SIZE = 4096
+
 BOND_TYPES_3 = {
     1: Chem.rdchem.BondType.SINGLE,
     2: Chem.rdchem.BondType.DOUBLE,
     3: Chem.rdchem.BondType.TRIPLE,
 }
 
+# Bond type and direction of RDkit bond for index of BOND_TYPES
+EDGE_BONDS = {
+    1: (Chem.BondType.SINGLE, None),
+    2: (Chem.BondType.DOUBLE, None),
+    3: (Chem.BondType.TRIPLE, None),
+    4: (Chem.BondType.AROMATIC, None),
+    5: (Chem.BondType.SINGLE, Chem.BondDir.BEGINWEDGE),
+    6: (Chem.BondType.SINGLE, Chem.BondDir.BEGINDASH),
+}
+
+RGROUP_SET = frozenset(RGROUP_SYMBOLS)
+
 
 def annotation_to_coords_and_edges(data) -> Dict:
-    """Function to data prepare for converting into SMILES or molblock"""
+    """Function to data prepare for converting into SMILES or molblock.
+    Edges are sorted list of (i, j, bond type index) with i < j,
+    one for every pair of bonded atoms, the last bond of pair wins
+    """
     # Remove hydrogen if needed
     filtered_atoms_data = [atom for atom in data["atoms"] if atom["atom_symbol"] != "H"]
     mask = [atom["atom_number"] for atom in data["atoms"] if atom["atom_symbol"] == "H"]
@@ -56,90 +82,134 @@ def annotation_to_coords_and_edges(data) -> Dict:
 
         data_output["chartok_coords"] = {"coords": coords, "symbols": symbols}
 
-        bonds_data = data["bonds"]
-        num_atoms = max(max(bond["endpoint_atoms"]) for bond in bonds_data) + 1
-
-        edges = [[0 for _ in range(num_atoms)] for _ in range(num_atoms)]
-
-        for bond in bonds_data:
+        edges = {}
+        for bond in data["bonds"]:
             i, j = bond["endpoint_atoms"]
-            bond_type_int = BOND_TYPES.index(
-                bond["bond_type"]
-            )  # Map bond type to an integer
-            edges[i][j] = bond_type_int
-            edges[j][i] = bond_type_int
+            if i == j:
+                continue
+            # Map bond type to an integer
+            edges[min(i, j), max(i, j)] = BOND_TYPES.index(bond["bond_type"])
 
-        data_output["edges"] = edges
+        data_output["edges"] = sorted(
+            (i, j, bond_type) for (i, j), bond_type in edges.items() if bond_type
+        )
 
     return data_output
 
 
-def convert_graph_to_molfile(
-    coords, symbols, edges, image=None, debug=False
-) -> Chem.rdchem.RWMol:
-    """Create molblock from RDkit"""
-    mol = Chem.RWMol()
-    n = len(symbols)
-    ids = []
+def atom_from_symbol(symbol: str) -> Chem.rdchem.Atom:
+    """Atom of annotation symbol: R-group and abbreviation are atoms "*"
+    with alias, other symbols are parsed as SMILES, unparsed ones are
+    condensed formulas and also become atoms with alias
+    """
+    raw_symbol = symbol
+    if symbol[0] == "[":
+        symbol = symbol[1:-1]
 
-    for i in range(n):
-        symbol = symbols[i]
-        if symbol[0] == "[":
-            symbol = symbol[1:-1]
+    if symbol in RGROUP_SET:
+        atom = Chem.Atom("*")
+        if symbol[0] == "R" and symbol[1:].isdigit():
+            atom.SetIsotope(int(symbol[1:]))
+        Chem.SetAtomAlias(atom, symbol)
 
-        if symbol in RGROUP_SYMBOLS:
-            atom = Chem.Atom("*")
-            if symbol[0] == "R" and symbol[1:].isdigit():
-                atom.SetIsotope(int(symbol[1:]))
-            Chem.SetAtomAlias(atom, symbol)
+    elif symbol in ABBREVIATIONS:
+        atom = Chem.Atom("*")
+        Chem.SetAtomAlias(atom, symbol)
+
+    else:
+        try:  # try to get SMILES of atom
+            atom = Chem.AtomFromSmiles(raw_symbol)
+            atom.SetChiralTag(Chem.rdchem.ChiralType.CHI_UNSPECIFIED)
 
-        elif symbol in ABBREVIATIONS:
+        except Exception:  # otherwise, abbreviation or condensed formula
             atom = Chem.Atom("*")
             Chem.SetAtomAlias(atom, symbol)
 
-        else:
-            try:  # try to get SMILES of atom
-                atom = Chem.AtomFromSmiles(symbols[i])
-                atom.SetChiralTag(Chem.rdchem.ChiralType.CHI_UNSPECIFIED)
+    if atom.GetSymbol() == "*":
+        atom.SetProp("molFileAlias", symbol)
+
+    return atom
+
+
+def build_atom_templates() -> Dict[str, Chem.rdchem.Atom]:
+    """Atoms of all elements, R-groups and abbreviations from constants,
+    with and without square brackets
+    """
+    symbols = list(ELEMENTS) + list(RGROUP_SYMBOLS) + list(ABBREVIATIONS)
+    symbols += [f"[{symbol}]" for symbol in symbols]
+
+    # Bare symbols of not organic elements are not SMILES, errors are expected.
+    # Logs are blocked until blocker is deleted, then previous state is restored
+    blocker = rdBase.BlockLogs()
+    try:
+        return {symbol: atom_from_symbol(symbol) for symbol in symbols}
+    finally:
+        del blocker
+
+
+# Atoms of known symbols are made once, convert_graph_to_mol copies them
+ATOM_TEMPLATES = build_atom_templates()
 
-            except:  # otherwise, abbreviation or condensed formula
-                atom = Chem.Atom("*")
-                Chem.SetAtomAlias(atom, symbol)
 
-        if atom.GetSymbol() == "*":
-            atom.SetProp("molFileAlias", symbol)
+def convert_graph_to_mol(
+    coords, symbols, edges: List[Tuple[int, int, int]]
+) -> Chem.rdchem.RWMol:
+    """Create RDkit molecule, abbreviations are atoms with alias.
+    Edges are (i, j, bond type index), bonds to unknown atoms are skipped
+    """
+    mol = Chem.RWMol()
+    n = len(symbols)
+    ids = []
 
+    for i in range(n):
+        # Known symbols are taken from table, only unseen labels are parsed
+        atom = ATOM_TEMPLATES.get(symbols[i])
+        if atom is None:
+            atom = atom_from_symbol(symbols[i])
+
+        # Atom is copied into molecule, so template is not changed
         idx = mol.AddAtom(atom)
         assert idx == i
         ids.append(idx)
 
-    for i in range(n):
-        for j in range(i + 1, n):
-            if edges[i][j] == 1:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.SINGLE)
-            elif edges[i][j] == 2:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.DOUBLE)
-            elif edges[i][j] == 3:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.TRIPLE)
-            elif edges[i][j] == 4:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.AROMATIC)
-            elif edges[i][j] == 5:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.SINGLE)
-                mol.GetBondBetweenAtoms(ids[i], ids[j]).SetBondDir(
-                    Chem.BondDir.BEGINWEDGE
-                )
-            elif edges[i][j] == 6:
-                mol.AddBond(ids[i], ids[j], Chem.BondType.SINGLE)
-                mol.GetBondBetweenAtoms(ids[i], ids[j]).SetBondDir(
-                    Chem.BondDir.BEGINDASH
-                )
+    for i, j, bond_type in edges:
+        if bond_type not in EDGE_BONDS or i >= n or j >= n:
+            continue
+        order, direction = EDGE_BONDS[bond_type]
+        num_bonds = mol.AddBond(ids[i], ids[j], order)
+        if direction is not None:
+            mol.GetBondWithIdx(num_bonds - 1).SetBondDir(direction)
+
+    return mol
+
+
+def convert_graph_to_molfile(coords, symbols, edges, image=None, debug=False) -> str:
+    """Create molblock from RDkit"""
+    return mol_to_molblock(convert_graph_to_mol(coords, symbols, edges))
+
+
+def annotation_to_mol(annotation: Dict) -> Chem.rdchem.RWMol:
+    """Convert annotation with atoms and bonds into RDkit molecule"""
+    data = annotation_to_coords_and_edges(annotation)
+    return convert_graph_to_mol(
+        data["chartok_coords"]["coords"],
+        data["chartok_coords"]["symbols"],
+        data["edges"],
+    )
 
+
+def mol_to_molblock(mol: Chem.rdchem.RWMol) -> str:
+    """Create molblock, empty string if RDkit can not write molecule"""
     try:
-        molblock = Chem.MolToMolBlock(mol)
-    except Exception as e:
-        molblock = ""
+        return Chem.MolToMolBlock(mol)
+    except Exception:
+        return ""
+
 
-    return molblock
+def mol_to_smiles(mol: Chem.rdchem.RWMol) -> str:
+    """Create SMILES with expanded abbreviations"""
+    smiles, _ = expand_functional_group(mol, {})
+    return smiles
 
 
 def _parse_tokens(tokens: list):
@@ -246,26 +316,41 @@ def _condensed_formula_list_to_smiles(
     assert direction == 1 or direction == -1
 
 
-def get_smiles_from_symbol(symbol, mol, atom, bonds):
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def formula_list(symbol: str) -> list:
+    """Parsed and expanded condensed formula, cached by symbol.
+    Returned list is shared between calls and must not be changed
     """
-    Convert symbol (abbrev. or condensed formula) to smiles
-    If condensed formula, determine parsing direction and num. bonds on each side using coordinates
+    return _expand_carbon(_parse_formula(symbol))
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def smiles_from_symbol(symbol: str, total_bonds: int) -> Optional[str]:
+    """SMILES of abbreviation or condensed formula with total_bonds order
+    of bonds to the rest of molecule, cached by both
     """
     if symbol in ABBREVIATIONS:
         return ABBREVIATIONS[symbol].smiles
     if len(symbol) > 20:
         return None
 
-    total_bonds = int(sum([bond.GetBondTypeAsDouble() for bond in bonds]))
-    formula_list = _expand_carbon(_parse_formula(symbol))
     smiles, bonds_left, num_trails, success = _condensed_formula_list_to_smiles(
-        formula_list, total_bonds, None
+        formula_list(symbol), total_bonds, None
     )
     if success:
         return smiles
     return None
 
 
+def get_smiles_from_symbol(symbol, mol, atom, bonds):
+    """
+    Convert symbol (abbrev. or condensed formula) to smiles
+    If condensed formula, determine parsing direction and num. bonds on each side using coordinates
+    """
+    total_bonds = int(sum([bond.GetBondTypeAsDouble() for bond in bonds]))
+    return smiles_from_symbol(symbol, total_bonds)
+
+
 def convert_smiles_to_mol(smiles):
     if smiles is None or smiles == "":
         return None
@@ -276,8 +361,43 @@ def convert_smiles_to_mol(smiles):
     return mol
 
 
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def fragment_mol(symbol: str, total_bonds: int) -> Optional[Chem.rdchem.Mol]:
+    """RDkit molecule of abbreviation or condensed formula, cached by symbol
+    and total order of its bonds. Cache lives in process, so a batch export
+    worker builds every fragment once. Returned molecule is shared between
+    calls and must not be changed
+    """
+    return convert_smiles_to_mol(smiles_from_symbol(symbol, total_bonds))
+
+
+def fragment_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Return hits, misses, current size and hit rate of formula
+    and fragment caches
+    """
+    stats = {}
+    for name, function in [
+        ("formulas", formula_list),
+        ("smiles", smiles_from_symbol),
+        ("fragments", fragment_mol),
+    ]:
+        info = function.cache_info()
+        calls = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / calls if calls else 0.0,
+        }
+    return stats
+
+
 def expand_functional_group(mol, mappings) -> Tuple[str, Chem.rdchem.RWMol]:
-    """If alias is not simple, function converts alias to SMILES separately"""
+    """If alias is not simple, function converts alias to SMILES separately.
+    Fragments of all abbreviations are collected first, then molecule is
+    assembled once: fragments are inserted in place, abbreviation atoms are
+    removed in one batch
+    """
     # Check alias
     bool_alias = (
         any([len(Chem.GetAtomAlias(atom)) > 0 for atom in mol.GetAtoms()])
@@ -290,7 +410,8 @@ def expand_functional_group(mol, mappings) -> Tuple[str, Chem.rdchem.RWMol]:
         for i, atom in enumerate(mol_w.GetAtoms()):  # reset radical electrons
             atom.SetNumRadicalElectrons(0)
 
-        atoms_to_remove = []
+        # index of abbreviation atom -> its fragment
+        fragments = {}
         for i in range(num_atoms):
             atom = mol_w.GetAtomWithIdx(i)
             if atom.GetSymbol() == "*":
@@ -301,66 +422,49 @@ def expand_functional_group(mol, mappings) -> Tuple[str, Chem.rdchem.RWMol]:
                 if not (isinstance(symbol, str) and len(symbol) > 0):
                     continue
                 # rgroups do not need to be expanded
-                if symbol in RGROUP_SYMBOLS:
+                if symbol in RGROUP_SET:
                     continue
 
                 bonds = atom.GetBonds()
-                sub_smiles = get_smiles_from_symbol(symbol, mol_w, atom, bonds)
+                total_bonds = int(sum([bond.GetBondTypeAsDouble() for bond in bonds]))
 
-                # create mol object for abbreviation/condensed formula from its SMILES
-                mol_r = convert_smiles_to_mol(sub_smiles)
+                # mol object for abbreviation/condensed formula from its SMILES
+                mol_r = fragment_mol(symbol, total_bonds)
 
                 if mol_r is None:
                     # atom.SetAtomicNum(6)
                     atom.SetIsotope(0)
                     continue
 
-                # remove bonds connected to abbreviation/condensed formula
-                adjacent_indices = [bond.GetOtherAtomIdx(i) for bond in bonds]
-                for adjacent_idx in adjacent_indices:
-                    mol_w.RemoveBond(i, adjacent_idx)
-
-                adjacent_atoms = [
-                    mol_w.GetAtomWithIdx(adjacent_idx)
-                    for adjacent_idx in adjacent_indices
-                ]
-                for adjacent_atom, bond in zip(adjacent_atoms, bonds):
-                    adjacent_atom.SetNumRadicalElectrons(
-                        int(bond.GetBondTypeAsDouble())
-                    )
-
-                # get indices of atoms of main body that connect to substituent
-                bonding_atoms_w = adjacent_indices
-                # assume indices are concated after combine mol_w and mol_r
-                bonding_atoms_r = [mol_w.GetNumAtoms()]
-                for atm in mol_r.GetAtoms():
-                    if atm.GetNumRadicalElectrons() and atm.GetIdx() > 0:
-                        bonding_atoms_r.append(mol_w.GetNumAtoms() + atm.GetIdx())
-
-                # combine main body and substituent into a single molecule object
-                combo = Chem.CombineMols(mol_w, mol_r)
-
-                # connect substituent to main body with bonds
-                mol_w = Chem.RWMol(combo)
-                # if len(bonding_atoms_r) == 1:  # substituent uses one atom to bond to main body
-                for atm in bonding_atoms_w:
-                    bond_order = mol_w.GetAtomWithIdx(atm).GetNumRadicalElectrons()
-                    mol_w.AddBond(
-                        atm, bonding_atoms_r[0], order=BOND_TYPES_3[bond_order]
-                    )
-
-                # reset radical electrons
-                for atm in bonding_atoms_w:
-                    mol_w.GetAtomWithIdx(atm).SetNumRadicalElectrons(0)
-                for atm in bonding_atoms_r:
-                    mol_w.GetAtomWithIdx(atm).SetNumRadicalElectrons(0)
-                atoms_to_remove.append(i)
-
-        # Remove atom in the end, otherwise the id will change
-        # Reverse the order and remove atoms with larger id first
-        atoms_to_remove.sort(reverse=True)
-        for i in atoms_to_remove:
+                fragments[i] = mol_r
+
+        # index of abbreviation atom -> first atom of its fragment,
+        # which bonds to main body like abbreviation did
+        anchors = {}
+        for i, mol_r in fragments.items():
+            anchors[i] = mol_w.GetNumAtoms()
+            mol_w.InsertMol(mol_r)
+            for idx in range(anchors[i], mol_w.GetNumAtoms()):
+                mol_w.GetAtomWithIdx(idx).SetNumRadicalElectrons(0)
+
+            # bond between two abbreviations is added with the later one
+            for bond in mol.GetAtomWithIdx(i).GetBonds():
+                adjacent_idx = bond.GetOtherAtomIdx(i)
+                if adjacent_idx in fragments and adjacent_idx not in anchors:
+                    continue
+                mol_w.AddBond(
+                    anchors.get(adjacent_idx, adjacent_idx),
+                    anchors[i],
+                    order=BOND_TYPES_3[int(bond.GetBondTypeAsDouble())],
+                )
+
+        # Abbreviation atoms are removed with their bonds at once,
+        # indices are not changed until the end of batch
+        mol_w.BeginBatchEdit()
+        for i in fragments:
             mol_w.RemoveAtom(i)
+        mol_w.CommitBatchEdit()
+
         smiles = Chem.MolToSmiles(mol_w)
         mol = mol_w.GetMol()
     else:
@@ -0,0 +1,150 @@
+"""Conversion of numpy images to Qt without copies and zoom levels of image"""
+
+import math
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+from PySide6.QtCore import QRect, QRectF, QSize, Qt
+from PySide6.QtGui import QImage, QPainter, QPixmap
+
+from molina.image_reader import LazyImage
+
+
+# Levels are not reduced below this size of the longest side
+MIN_LEVEL_SIZE = 256
+
+
+def array_to_qimage(image: npt.NDArray) -> Tuple[QImage, npt.NDArray]:
+    """Wrap numpy array into QImage over the same memory.
+    Returned array is the buffer of QImage, it must be kept alive while
+    QImage is used. It is the input array itself unless rows are not contiguous
+    """
+    if image.dtype != np.uint8:
+        raise ValueError(f"Unsupported image type {image.dtype}")
+
+    if not image.flags["C_CONTIGUOUS"]:
+        image = np.ascontiguousarray(image)
+
+    if image.ndim == 3:
+        h, w, ch = image.shape
+        if ch == 4:
+            image_format = QImage.Format_RGBA8888
+        elif ch == 3:
+            image_format = QImage.Format_RGB888
+        else:
+            raise ValueError("Unsupported array shape for QPixmap conversion")
+    elif image.ndim == 2:
+        h, w = image.shape
+        image_format = QImage.Format_Grayscale8
+    else:
+        raise ValueError("Unexpected array dimension")
+
+    q_image = QImage(image.data, w, h, image.strides[0], image_format)
+    if q_image.isNull():
+        raise ValueError("Unsupported array shape for QPixmap conversion")
+
+    return q_image, image
+
+
+class PixmapPyramid:
+    """Image with levels reduced by two times each, like mipmaps.
+    Level 0 is QImage over numpy array without copy, others are made on first
+    use from the previous level. Zooming scales only the requested region of
+    the nearest level which is not smaller than requested size.
+    For LazyImage the preview is the first level, full resolution is decoded
+    only when zoom needs more details than preview has.
+    """
+
+    def __init__(
+        self,
+        image: Union[npt.NDArray, LazyImage],
+        min_level_size: int = MIN_LEVEL_SIZE,
+    ):
+        self._levels: Dict[int, QImage] = {}
+        self._arrays: Dict[int, npt.NDArray] = {}
+        self._size = QSize(image.shape[1], image.shape[0])
+
+        self._load_full: Optional[Callable[[], npt.NDArray]] = None
+        if isinstance(image, LazyImage):
+            self._base_level = int(math.log2(image.reduction))
+            self._setLevel(self._base_level, image.preview())
+            if self._base_level > 0:
+                self._load_full = image.full
+        else:
+            self._base_level = 0
+            self._setLevel(0, image)
+
+        self._max_level = self._base_level
+        longest = max(self.width(), self.height())
+        while longest >> (self._max_level + 1) >= min_level_size:
+            self._max_level += 1
+
+    def _setLevel(self, index: int, image: npt.NDArray) -> None:
+        """Keep array alive together with QImage over it"""
+        self._levels[index], self._arrays[index] = array_to_qimage(image)
+
+    def size(self) -> QSize:
+        """Size of original image"""
+        return QSize(self._size)
+
+    def width(self) -> int:
+        return self._size.width()
+
+    def height(self) -> int:
+        return self._size.height()
+
+    def isNull(self) -> bool:
+        return self._levels[self._base_level].isNull()
+
+    def levelCount(self) -> int:
+        return self._max_level + 1
+
+    def levelFor(self, scale: float) -> int:
+        """The most reduced level which is still not smaller than scale"""
+        if scale >= 1:
+            return 0
+        return min(int(math.floor(-math.log2(max(scale, 1e-9)))), self._max_level)
+
+    def level(self, index: int) -> QImage:
+        """Image reduced by 2 ** index times"""
+        if index < self._base_level:
+            self._setLevel(0, self._load_full())
+            self._base_level = 0
+        if index not in self._levels:
+            previous = self.level(index - 1)
+            self._levels[index] = previous.scaled(
+                max(previous.width() // 2, 1),
+                max(previous.height() // 2, 1),
+                Qt.IgnoreAspectRatio,
+                Qt.SmoothTransformation,
+            )
+        return self._levels[index]
+
+    def scaledSize(self, scale: float) -> QSize:
+        """Size of original image multiplied by scale"""
+        return QSize(
+            max(round(self.width() * scale), 1), max(round(self.height() * scale), 1)
+        )
+
+    def region(self, scale: float, rect: QRect) -> QPixmap:
+        """Pixmap of rect of image multiplied by scale, only this part of
+        the nearest level is scaled
+        """
+        level = self.level(self.levelFor(scale))
+        scale_x = scale * self.width() / level.width()
+        scale_y = scale * self.height() / level.height()
+        source = QRectF(
+            rect.x() / scale_x,
+            rect.y() / scale_y,
+            rect.width() / scale_x,
+            rect.height() / scale_y,
+        )
+
+        pixmap = QPixmap(rect.size())
+        pixmap.fill(Qt.white)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(QRectF(0, 0, rect.width(), rect.height()), level, source)
+        painter.end()
+        return pixmap
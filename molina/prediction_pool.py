@@ -0,0 +1,241 @@
+"""Prediction of atoms and bonds in separate processes.
+Module does not import Qt, so worker processes start fast
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+
+# Workers crashed in a row without any answer, after that requests are failed
+MAX_CRASHES = 5
+READ_ERROR = "Image can not be read"
+
+
+def default_workers() -> int:
+    """Number of worker processes: every model takes a few cores and ~1 GB"""
+    return max(1, min(4, (os.cpu_count() or 1) // 4))
+
+
+def _serve(requests, responses, model_name: str) -> None:
+    """Worker process loop: load model, then predict images from requests queue.
+    Request is (request id, image path), None stops the loop. Image is decoded
+    here, so GUI process neither decodes full resolution nor copies pixels.
+    Response is (request id, annotation, timings, error)
+    """
+    import cv2
+
+    from molina.model_registry import ModelRegistry, predict_image
+
+    # Load model before the first request, loading error is raised on request
+    try:
+        ModelRegistry().get(model_name)
+    except Exception:
+        pass
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        request_id, path = request
+        try:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError(READ_ERROR)
+            annotation, timings = predict_image(image, model_name)
+            annotation = annotation or {"atoms": [], "bonds": []}
+            responses.put((request_id, annotation, timings, None))
+        except Exception as e:
+            responses.put((request_id, None, None, f"{type(e).__name__}: {e}"))
+
+
+class PredictionPool:
+    """Pool of processes predicting images, so the GUI process is never busy.
+    Every worker has its own request queue and gets next image only when it
+    is idle, therefore request of crashed worker is known: it is failed and
+    the worker is restarted. All workers share one response queue, which is
+    read by collector thread resolving futures of requests.
+    """
+
+    def __init__(self, workers: Optional[int] = None, model_name: str = "MolScribe"):
+        self.workers = workers or default_workers()
+        self.model_name = model_name
+
+        self._context = multiprocessing.get_context("spawn")
+        self._responses = None
+        self._processes = {}
+        self._requests = {}
+        self._running: Dict[int, Optional[int]] = {}
+        self._futures: Dict[int, Future] = {}
+        self._backlog = deque()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._stopped = threading.Event()
+        self._crashes = 0
+        self.restarts = 0
+
+    def isStarted(self) -> bool:
+        return self._collector is not None
+
+    def start(self) -> None:
+        """Start worker processes and collector thread"""
+        with self._lock:
+            if self._collector is not None:
+                return
+            self._stopped.clear()
+            self._responses = self._context.Queue()
+            for worker_id in range(self.workers):
+                self._startWorker(worker_id)
+            self._collector = threading.Thread(
+                target=self._collect, name="prediction-collector", daemon=True
+            )
+            self._collector.start()
+
+    def _startWorker(self, worker_id: int) -> None:
+        """Start new process for worker, lock must be held"""
+        requests = self._context.Queue()
+        process = self._context.Process(
+            target=_serve,
+            args=(requests, self._responses, self.model_name),
+            name=f"prediction-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._requests[worker_id] = requests
+        self._running[worker_id] = None
+
+    def _dispatch(self) -> None:
+        """Send waiting requests to idle workers, lock must be held"""
+        for worker_id, request_id in self._running.items():
+            if not self._backlog:
+                return
+            if request_id is None:
+                request = self._backlog.popleft()
+                self._running[worker_id] = request[0]
+                self._requests[worker_id].put(request)
+
+    def submit(self, path: str) -> Future:
+        """Queue image file for prediction, future gets annotation and timings"""
+        self.start()
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._futures[request_id] = future
+            self._backlog.append((request_id, str(path)))
+            self._dispatch()
+
+        return future
+
+    def pending(self) -> int:
+        """Number of requests which are not finished"""
+        with self._lock:
+            return len(self._futures)
+
+    def _finish(self, request_id: int, annotation, timings, error) -> List:
+        """Free worker of request and return its future with result,
+        lock must be held. Future is resolved out of the lock,
+        because its callbacks can submit new requests
+        """
+        for worker_id, running_id in self._running.items():
+            if running_id == request_id:
+                self._running[worker_id] = None
+
+        future = self._futures.pop(request_id, None)
+        if future is None:
+            return []
+        if error is None:
+            self._crashes = 0
+            return [(future, {"annotation": annotation, "timings": timings}, None)]
+        return [(future, None, RuntimeError(error))]
+
+    def _restartCrashed(self) -> List:
+        """Start dead workers again and return failed futures of their requests,
+        lock must be held
+        """
+        failed = []
+        for worker_id, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            request_id = self._running[worker_id]
+            if request_id is not None:
+                failed += self._finish(
+                    request_id, None, None, "Prediction worker crashed"
+                )
+            self._crashes += 1
+            if self._crashes > MAX_CRASHES * self.workers:
+                # Worker can not even start, it is not restarted any more
+                del self._processes[worker_id]
+                del self._requests[worker_id]
+                del self._running[worker_id]
+            else:
+                self._startWorker(worker_id)
+                self.restarts += 1
+
+        # No workers left, so waiting requests are failed too
+        if not self._processes:
+            while self._backlog:
+                failed += self._finish(
+                    self._backlog.popleft()[0], None, None, "Prediction workers crash"
+                )
+
+        return failed
+
+    def _collect(self) -> None:
+        """Read responses of workers and watch that workers are alive"""
+        while not self._stopped.is_set():
+            responses = []
+            try:
+                responses.append(self._responses.get(timeout=0.2))
+                while True:
+                    responses.append(self._responses.get_nowait())
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                break
+
+            resolved = []
+            with self._lock:
+                if self._stopped.is_set():
+                    break
+                for response in responses:
+                    resolved += self._finish(*response)
+                resolved += self._restartCrashed()
+                self._dispatch()
+
+            for future, result, error in resolved:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        """Stop workers, not finished requests are cancelled"""
+        with self._lock:
+            if self._collector is None:
+                return
+            self._stopped.set()
+            for requests in self._requests.values():
+                requests.put(None)
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+            self._backlog.clear()
+
+        self._collector.join(timeout)
+        for process in self._processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        self._processes.clear()
+        self._requests.clear()
+        self._running.clear()
+        self._collector = None
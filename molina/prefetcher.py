@@ -0,0 +1,108 @@
+"""Background reading of images which are likely to be opened next"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from molina.batch import find_images
+
+
+class ImagePrefetcher:
+    """Reads images with their annotations ahead in a pool of threads.
+    Decoding releases GIL, so GUI thread is not blocked. Only the last
+    capacity requested paths are kept, older ones are cancelled or dropped.
+    """
+
+    def __init__(
+        self, loader: Callable[[str], Any], workers: int = 2, capacity: int = 8
+    ):
+        self._loader = loader
+        self._capacity = capacity
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures: "OrderedDict[str, Future]" = OrderedDict()
+        self._listings: Dict[str, Tuple[int, List[str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        """Start reading paths which are not read yet"""
+        with self._lock:
+            for path in paths:
+                path = str(Path(path))
+                if path in self._futures:
+                    self._futures.move_to_end(path)
+                    continue
+                self._futures[path] = self._pool.submit(self._loader, path)
+
+            while len(self._futures) > self._capacity:
+                _, future = self._futures.popitem(last=False)
+                future.cancel()
+
+    def take(self, path: str) -> Optional[Any]:
+        """Return read image and forget it, None if it was not requested.
+        If reading is running, wait for it, it is still faster than new reading
+        """
+        with self._lock:
+            future = self._futures.pop(str(Path(path)), None)
+
+        if future is None or future.cancel():
+            self.misses += 1
+            return None
+
+        try:
+            result = future.result()
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return result
+
+    def discard(self, path: str) -> None:
+        """Forget read image, for example when its annotation is changed"""
+        with self._lock:
+            future = self._futures.pop(str(Path(path)), None)
+        if future is not None:
+            future.cancel()
+
+    def neighbours(self, path: str, depth: int = 2) -> List[str]:
+        """Images next to path in its directory: next, previous, second next
+        and so on. Directory listing is reread only when directory is changed
+        """
+        path = Path(path)
+        directory = str(path.parent)
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+
+        listing = self._listings.get(directory)
+        if listing is None or listing[0] != mtime:
+            images = [str(image) for image in find_images(directory, recursive=False)]
+            listing = (mtime, images)
+            self._listings[directory] = listing
+
+        images = listing[1]
+        try:
+            index = images.index(str(path))
+        except ValueError:
+            return []
+
+        result = []
+        for shift in range(1, depth + 1):
+            for neighbour in (index + shift, index - shift):
+                if 0 <= neighbour < len(images):
+                    result.append(images[neighbour])
+        return result
+
+    def shutdown(self) -> None:
+        """Cancel waiting reads and stop threads"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._pool.shutdown(wait=False)
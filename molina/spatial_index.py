@@ -0,0 +1,132 @@
+"""Spatial index for search of atoms and bonds near the cursor"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+
+def distance_to_segment(
+    x: float,
+    y: float,
+    x1: float,
+    y1: float,
+    x2: float,
+    y2: float,
+    margin: float = 0.0,
+) -> float:
+    """Distance from point to segment (x1, y1) - (x2, y2).
+    margin is a fraction of segment cut from both ends, so only the middle part
+    of segment is taken into account. Segment of zero length is a point.
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    length = dx * dx + dy * dy
+
+    if length == 0:
+        return math.hypot(x - x1, y - y1)
+
+    t = ((x - x1) * dx + (y - y1) * dy) / length
+    t = min(max(t, margin), 1 - margin)
+
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+class SpatialGrid:
+    """Uniform grid over points and segments.
+    Every object is registered in all cells crossed by its bounding box,
+    so a query checks only objects from cells around the requested point.
+    Point is a segment of zero length.
+    """
+
+    def __init__(self, cell_size: float = 50.0):
+        self._cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._objects: Dict[Hashable, Tuple[float, float, float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._objects
+
+    def _cellsOf(
+        self, x1: float, y1: float, x2: float, y2: float
+    ) -> Iterator[Tuple[int, int]]:
+        """Cells crossed by bounding box"""
+        size = self._cell_size
+        for cx in range(
+            math.floor(min(x1, x2) / size), math.floor(max(x1, x2) / size) + 1
+        ):
+            for cy in range(
+                math.floor(min(y1, y2) / size), math.floor(max(y1, y2) / size) + 1
+            ):
+                yield cx, cy
+
+    def insert(
+        self,
+        key: Hashable,
+        x1: float,
+        y1: float,
+        x2: Optional[float] = None,
+        y2: Optional[float] = None,
+    ) -> None:
+        """Add point (x1, y1) or segment (x1, y1) - (x2, y2), replace old one with the same key"""
+        if key in self._objects:
+            self.remove(key)
+
+        if x2 is None or y2 is None:
+            x2, y2 = x1, y1
+
+        self._objects[key] = (x1, y1, x2, y2)
+        for cell in self._cellsOf(x1, y1, x2, y2):
+            self._cells[cell].add(key)
+
+    def remove(self, key: Hashable) -> None:
+        """Delete object if it exists"""
+        coords = self._objects.pop(key, None)
+        if coords is None:
+            return
+
+        for cell in self._cellsOf(*coords):
+            keys = self._cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def clear(self) -> None:
+        """Delete all objects"""
+        self._cells.clear()
+        self._objects.clear()
+
+    def setCellSize(self, cell_size: float) -> None:
+        """Change cell size and register all objects again"""
+        objects = self._objects
+        self._cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._objects = {}
+        for key, coords in objects.items():
+            self.insert(key, *coords)
+
+    def nearest(
+        self, x: float, y: float, radius: float, margin: float = 0.0
+    ) -> Optional[Hashable]:
+        """Return key of the closest object not farther than radius or None.
+        For segments margin is a fraction cut from both ends
+        """
+        candidates = set()
+        for cell in self._cellsOf(x - radius, y - radius, x + radius, y + radius):
+            keys = self._cells.get(cell)
+            if keys:
+                candidates |= keys
+
+        best_key = None
+        best_distance = radius
+        for key in candidates:
+            distance = distance_to_segment(x, y, *self._objects[key], margin)
+            if distance < best_distance or (
+                distance == best_distance and (best_key is None or key < best_key)
+            ):
+                best_key = key
+                best_distance = distance
+
+        return best_key
@@ -0,0 +1,121 @@
+"""On-disk cache of image thumbnails made in background threads.
+Module does not import Qt, thumbnails are PNG files shown by FileManager
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+
+THUMBNAIL_SIZE = 128
+
+
+def default_cache_dir() -> Path:
+    """Thumbnails are kept in user cache directory"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "molina" / "thumbnails"
+
+
+def thumbnail_key(image_path: str, size: int) -> str:
+    """Name of thumbnail file, it is changed when image file is changed"""
+    stat = os.stat(image_path)
+    key = f"{Path(image_path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{size}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class ThumbnailStore:
+    """Makes thumbnails in a pool of threads and keeps them on disk,
+    keyed by image path, file size, modification time and thumbnail size.
+    Every image is requested once, repeated requests get the same future.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        size: int = THUMBNAIL_SIZE,
+        workers: int = 2,
+    ):
+        self.directory = Path(directory) if directory else default_cache_dir()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def cachedPath(self, image_path: str) -> Optional[Path]:
+        """Thumbnail file if it is already made"""
+        try:
+            path = self.directory / (thumbnail_key(image_path, self.size) + ".png")
+        except OSError:
+            return None
+        return path if path.is_file() else None
+
+    def thumbnail(self, image_path: str) -> Optional[Path]:
+        """Thumbnail file, it is made if it does not exist.
+        None if image can not be read
+        """
+        import cv2
+
+        from molina.image_reader import open_image
+
+        path = self.cachedPath(image_path)
+        if path is not None:
+            return path
+
+        # Reduced preview is decoded, big scans are not read at full resolution
+        image = open_image(image_path, self.size)
+        if image is None:
+            return None
+        image = image.preview()
+
+        height, width = image.shape[:2]
+        scale = self.size / max(height, width)
+        if scale < 1:
+            image = cv2.resize(
+                image,
+                (max(round(width * scale), 1), max(round(height * scale), 1)),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        path = self.directory / (thumbnail_key(image_path, self.size) + ".png")
+        # Other thread or process never sees half written file
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp.png")
+        if not cv2.imwrite(str(temp_path), image):
+            return None
+        os.replace(temp_path, path)
+        return path
+
+    def request(self, image_path: str) -> Future:
+        """Make thumbnail in background, future gets thumbnail file"""
+        with self._lock:
+            future = self._futures.get(image_path)
+            if future is None or future.done():
+                future = self._pool.submit(self._load, image_path)
+                self._futures[image_path] = future
+        return future
+
+    def _load(self, image_path: str) -> Optional[Path]:
+        try:
+            path = self.thumbnail(image_path)
+        except Exception:
+            path = None
+        with self._lock:
+            self._futures.pop(image_path, None)
+        return path
+
+    def cancelPending(self) -> None:
+        """Drop requests which are not started, for example when other
+        directory is shown
+        """
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def shutdown(self) -> None:
+        """Cancel waiting requests and stop threads"""
+        self.cancelPending()
+        self._pool.shutdown(wait=False)
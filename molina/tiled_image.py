@@ -0,0 +1,111 @@
+"""Image view which scales and paints only visible tiles of image"""
+
+from typing import Any, Dict, Optional
+
+from PySide6.QtCore import QPoint, QRect, QSize
+from PySide6.QtGui import QPainter, QPaintEvent, QPixmap
+from PySide6.QtWidgets import QWidget
+
+from molina.cache import LRUCache
+from molina.pixmap_pyramid import PixmapPyramid
+
+
+TILE_SIZE = 256
+TILE_CACHE_BYTES = 128 << 20
+
+
+def pixmap_nbytes(pixmap: QPixmap) -> int:
+    """Memory of pixmap pixels"""
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class TiledImageWidget(QWidget):
+    """Shows image multiplied by scale in the center of widget.
+    Scaled image is split into square tiles, only tiles crossing painted area
+    are made from the nearest pyramid level. Tiles are kept in a cache
+    limited by memory, so memory and paint time depend on screen size
+    rather than on image size and zoom.
+    """
+
+    def __init__(
+        self,
+        parent=None,
+        tile_size: int = TILE_SIZE,
+        cache_bytes: int = TILE_CACHE_BYTES,
+    ):
+        super().__init__(parent)
+        self._tile_size = tile_size
+        self._tiles = LRUCache(cache_bytes, pixmap_nbytes)
+        self._pyramid: Optional[PixmapPyramid] = None
+        self._scale = 1.0
+
+    def setImage(self, pyramid: Optional[PixmapPyramid], scale: float) -> None:
+        """Show new image, tiles of previous one are dropped"""
+        self._pyramid = pyramid
+        self._scale = scale
+        self._tiles = LRUCache(self._tiles.max_bytes, pixmap_nbytes)
+        self.update()
+
+    def setScale(self, scale: float) -> None:
+        """Change zoom, tiles of other scales stay in cache for zooming back"""
+        if scale != self._scale:
+            self._scale = scale
+            self.update()
+
+    def imageSize(self) -> QSize:
+        """Size of image multiplied by scale"""
+        if self._pyramid is None:
+            return QSize()
+        return self._pyramid.scaledSize(self._scale)
+
+    def imageRect(self) -> QRect:
+        """Area of scaled image in widget"""
+        size = self.imageSize()
+        return QRect(
+            QPoint(
+                (self.width() - size.width()) // 2, (self.height() - size.height()) // 2
+            ),
+            size,
+        )
+
+    def tile(self, column: int, row: int) -> QPixmap:
+        """Scaled image part in the column and row of tile grid"""
+        key = (self._scale, column, row)
+        pixmap = self._tiles.get(key)
+        if pixmap is None:
+            rect = QRect(
+                column * self._tile_size,
+                row * self._tile_size,
+                self._tile_size,
+                self._tile_size,
+            ).intersected(QRect(QPoint(0, 0), self.imageSize()))
+            pixmap = self._pyramid.region(self._scale, rect)
+            self._tiles.put(key, pixmap)
+        return pixmap
+
+    def paintEvent(self, event: QPaintEvent) -> None:
+        """Draw tiles crossing painted area, it is the visible part
+        of widget when it is inside scroll area
+        """
+        if self._pyramid is None or self._pyramid.isNull():
+            return
+
+        image_rect = self.imageRect()
+        # Painted area in scaled image coordinates
+        area = event.rect().intersected(image_rect).translated(-image_rect.topLeft())
+        if area.isEmpty():
+            return
+
+        size = self._tile_size
+        painter = QPainter(self)
+        for row in range(area.top() // size, area.bottom() // size + 1):
+            for column in range(area.left() // size, area.right() // size + 1):
+                painter.drawPixmap(
+                    image_rect.topLeft() + QPoint(column * size, row * size),
+                    self.tile(column, row),
+                )
+        painter.end()
+
+    def cacheStats(self) -> Dict[str, Any]:
+        """Hits, misses, evictions and memory of tile cache"""
+        return self._tiles.stats()